@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""Offline benchmark for the DeepPlanning ETL.
+
+For every scale factor the harness generates synthetic raw inputs
+(``deepplanning_synthetic.py``), then runs each builder/validator stage in a
+fresh process and records wall time, CPU time, rows, rows/sec and peak RSS.
+Results go to a JSON file; ``--baseline`` compares rows/sec against an earlier
+results file and exits 1 when a stage slowed down by more than
+``--max-regression``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import build_deepplanning_parquet as builder
+from deepplanning_profile import peak_rss_mb
+from deepplanning_store import DeepPlanningStore
+from deepplanning_synthetic import generate
+from validate_deepplanning_parquet import validate_parquet_dir
+
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_MAX_REGRESSION = 0.25
+GENERATED_MARKER = "generated.json"
+
+
+def _stage_build_shopping(config: Dict) -> int:
+    counts = builder.build_shopping_tables(
+        Path(config["qwen_agent_root"]) / "shoppingplanning",
+        Path(config["raw_cache_dir"]),
+        Path(config["parquet_dir"]),
+        config["row_group_size"],
+        config["workers"],
+        catalog_layout=config["catalog_layout"],
+        json_columns=config["json_columns"],
+    )
+    return sum(counts.values())
+
+
+def _stage_build_travel(config: Dict) -> int:
+    counts = builder.build_travel_tables(
+        Path(config["qwen_agent_root"]) / "travelplanning",
+        Path(config["raw_cache_dir"]),
+        Path(config["parquet_dir"]),
+        True,
+        config["row_group_size"],
+        config["workers"],
+        distance_matrix_layout=config["distance_matrix_layout"],
+        json_columns=config["json_columns"],
+    )
+    return sum(counts.values())
+
+
+def _stage_build_partitioned(config: Dict) -> int:
+    parquet_dir = Path(config["parquet_dir"])
+    contracts = builder._read_json(builder.TABLE_CONTRACTS_PATH)
+    rows = 0
+    for path in sorted(parquet_dir.glob("*.parquet")):
+        partition_by, sort_by = builder._partition_layout(path.stem, contracts)
+        builder.write_partitioned_table(
+            path,
+            Path(config["partitioned_dir"]) / path.stem,
+            partition_by,
+            sort_by,
+            builder.DEFAULT_PARTITIONED_ROW_GROUP_SIZE,
+        )
+        rows += pq.ParquetFile(path).metadata.num_rows
+    return rows
+
+
+def _validate(config: Dict, fast: bool) -> int:
+    report = validate_parquet_dir(Path(config["parquet_dir"]), fast)
+    if report["status"] != "ok":
+        raise RuntimeError(f"validation failed: {report['failed_checks']}")
+    return sum(table["rows"] for table in report["tables"].values())
+
+
+def _stage_validate_fast(config: Dict) -> int:
+    return _validate(config, fast=True)
+
+
+def _stage_validate_full(config: Dict) -> int:
+    return _validate(config, fast=False)
+
+
+def _stage_store_index(config: Dict) -> int:
+    index_path = Path(config["parquet_dir"]).parent / "bench_store_index.json"
+    if index_path.exists():
+        index_path.unlink()
+    store = DeepPlanningStore(Path(config["parquet_dir"]), index_path)
+    return sum(len(store.keys(domain)) for domain in store.tables_by_domain)
+
+
+STAGES: Dict[str, Callable[[Dict], int]] = {
+    "build_shopping": _stage_build_shopping,
+    "build_travel": _stage_build_travel,
+    "build_partitioned": _stage_build_partitioned,
+    "validate_fast": _stage_validate_fast,
+    "validate_full": _stage_validate_full,
+    "store_index": _stage_store_index,
+}
+
+
+def _run_stage(name: str, config: Dict) -> Dict:
+    """Stage body, executed in a fresh process so peak RSS is per stage."""
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    rows = STAGES[name](config)
+    seconds = time.perf_counter() - wall
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "seconds": round(seconds, 4),
+        "cpu_seconds": round(time.process_time() - cpu + children.ru_utime + children.ru_stime, 4),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def _write_manifest(config: Dict) -> None:
+    parquet_dir = Path(config["parquet_dir"])
+    counts = {path.stem: pq.ParquetFile(path).metadata.num_rows for path in sorted(parquet_dir.glob("*.parquet"))}
+    builder.build_manifest(
+        parquet_dir / "manifest.json",
+        counts,
+        True,
+        Path(config["qwen_agent_root"]),
+        distance_matrix_layout=config["distance_matrix_layout"],
+        catalog_layout=config["catalog_layout"],
+        json_columns=config["json_columns"],
+    )
+
+
+def run_scale(scale: int, args: argparse.Namespace) -> Dict:
+    scale_dir = args.work_dir / f"scale_{scale}"
+    inputs_dir = scale_dir / "inputs"
+    marker = inputs_dir / GENERATED_MARKER
+    result: Dict = {"scale": scale}
+
+    generated = json.loads(marker.read_text(encoding="utf-8")) if marker.exists() else None
+    if args.regenerate or generated is None or generated.get("seed") != args.seed:
+        shutil.rmtree(inputs_dir, ignore_errors=True)
+        started = time.perf_counter()
+        generated = generate(inputs_dir, scale, args.seed)
+        generated["seconds"] = round(time.perf_counter() - started, 4)
+        marker.write_text(json.dumps(generated, ensure_ascii=False, indent=2), encoding="utf-8")
+    result["inputs"] = {**generated, "raw_bytes": _dir_bytes(Path(generated["raw_cache_dir"]))}
+
+    parquet_dir = scale_dir / "parquet"
+    partitioned_dir = scale_dir / "partitioned"
+    shutil.rmtree(parquet_dir, ignore_errors=True)
+    shutil.rmtree(partitioned_dir, ignore_errors=True)
+    parquet_dir.mkdir(parents=True)
+    config = {
+        "raw_cache_dir": generated["raw_cache_dir"],
+        "qwen_agent_root": generated["qwen_agent_root"],
+        "parquet_dir": str(parquet_dir),
+        "partitioned_dir": str(partitioned_dir),
+        "row_group_size": args.row_group_size,
+        "workers": args.workers,
+        "distance_matrix_layout": args.distance_matrix_layout,
+        "catalog_layout": args.catalog_layout,
+        "json_columns": args.json_columns,
+    }
+
+    stages: Dict[str, Dict] = {}
+    context = multiprocessing.get_context("spawn")
+    for name in args.stages:
+        if name.startswith("validate") and not (parquet_dir / "manifest.json").exists():
+            _write_manifest(config)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            stages[name] = pool.submit(_run_stage, name, config).result()
+        print(json.dumps({"scale": scale, "stage": name, **stages[name]}), flush=True)
+    result["stages"] = stages
+    result["parquet_bytes"] = _dir_bytes(parquet_dir)
+    if not args.keep_outputs:
+        shutil.rmtree(parquet_dir, ignore_errors=True)
+        shutil.rmtree(partitioned_dir, ignore_errors=True)
+    return result
+
+
+def compare_to_baseline(results: Dict, baseline: Dict, max_regression: float) -> List[Dict]:
+    """List stages whose rows/sec dropped by more than ``max_regression`` versus the baseline run."""
+    previous = {
+        (run["scale"], name): stage
+        for run in baseline.get("runs", [])
+        for name, stage in run.get("stages", {}).items()
+    }
+    regressions = []
+    for run in results["runs"]:
+        for name, stage in run["stages"].items():
+            before = previous.get((run["scale"], name))
+            if not before or not before.get("rows_per_sec") or not stage.get("rows_per_sec"):
+                continue
+            change = stage["rows_per_sec"] / before["rows_per_sec"] - 1
+            if change < -max_regression:
+                regressions.append(
+                    {
+                        "scale": run["scale"],
+                        "stage": name,
+                        "baseline_rows_per_sec": before["rows_per_sec"],
+                        "rows_per_sec": stage["rows_per_sec"],
+                        "change": round(change, 4),
+                    }
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the DeepPlanning ETL on synthetic inputs (no network)")
+    parser.add_argument("--work-dir", type=Path, default=Path("artifacts/bench"))
+    parser.add_argument("--results", type=Path, default=Path("artifacts/bench/results.json"))
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--regenerate", action="store_true", help="Regenerate inputs even if a matching set exists")
+    parser.add_argument("--keep-outputs", action="store_true", help="Keep the parquet outputs of every scale")
+    parser.add_argument("--row-group-size", type=int, default=builder.DEFAULT_ROW_GROUP_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Builder worker processes (0 = all CPUs)")
+    parser.add_argument("--distance-matrix-layout", choices=builder.DISTANCE_MATRIX_LAYOUTS, default="long")
+    parser.add_argument("--catalog-layout", choices=builder.CATALOG_LAYOUTS, default="flat")
+    parser.add_argument("--json-columns", choices=builder.JSON_COLUMN_MODES, default="string")
+    parser.add_argument("--baseline", type=Path, default=None, help="Earlier results.json to compare rows/sec against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=DEFAULT_MAX_REGRESSION,
+        help="Allowed fractional rows/sec drop versus --baseline before failing",
+    )
+    args = parser.parse_args()
+    if args.workers <= 0:
+        args.workers = os.cpu_count() or 1
+
+    results: Dict = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "pyarrow": pa.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "seed": args.seed,
+            "row_group_size": args.row_group_size,
+            "workers": args.workers,
+            "distance_matrix_layout": args.distance_matrix_layout,
+            "catalog_layout": args.catalog_layout,
+            "json_columns": args.json_columns,
+            "stages": args.stages,
+        },
+        "runs": [run_scale(scale, args) for scale in args.scales],
+    }
+
+    status = "ok"
+    regressions: Optional[List[Dict]] = None
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_to_baseline(results, baseline, args.max_regression)
+        results["baseline"] = {
+            "path": str(args.baseline),
+            "max_regression": args.max_regression,
+            "same_config": baseline.get("config") == results["config"],
+            "regressions": regressions,
+        }
+        if regressions:
+            status = "regressed"
+    results["status"] = status
+
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    args.results.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps({"status": status, "results": str(args.results), "regressions": regressions}, ensure_ascii=False))
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,15 +5,60 @@ from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
+import heapq
+import io
 import json
+import os
+import re
+import shutil
+import sys
 import tarfile
+import time
 import zipfile
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import IO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
+import pyarrow.json as pajson
 import pyarrow.parquet as pq
-from huggingface_hub import snapshot_download
+from huggingface_hub import hf_hub_download
+
+from deepplanning_catalog import (
+    CATALOG_LAYOUTS,
+    FLAT_TABLE,
+    MEMBERSHIP_TABLE,
+    PRODUCT_HASH_COLUMN,
+    PRODUCTS_TABLE,
+    layout_tables,
+    split_catalog_row,
+)
+from deepplanning_distance import dense_schema, encode_distance_matrix, measure_types
+from deepplanning_ipc import DEFAULT_IPC_DIR_NAME, IPC_COMPRESSIONS, IPC_SUFFIX, write_ipc_companion
+from deepplanning_nested import (
+    JSON_COLUMN_MODES,
+    conform_array,
+    contains_type,
+    is_nested,
+    json_fields,
+    writable_type,
+)
+from deepplanning_profile import NULL_PROFILER, BuildProfiler, timed_call
+from deepplanning_stages import STAGE_STATE_FILE, StageScheduler
+from deepplanning_write_profiles import (
+    DEFAULT_WRITE_PROFILE,
+    REPORT_FILE as WRITE_PROFILE_REPORT_FILE,
+    WRITE_PROFILES_PATH,
+    WriteProfile,
+    load_write_profiles,
+    write_profile_report,
+)
 
 HF_DATASET_ID = "Qwen/DeepPlanning"
 RAW_FILES = [
@@ -23,6 +68,44 @@ RAW_FILES = [
     "database_level2.tar.gz",
     "database_level3.tar.gz",
 ]
+DEFAULT_ROW_GROUP_SIZE = 65536
+DEFAULT_PARTITIONED_ROW_GROUP_SIZE = 4096
+
+SHOPPING_TABLES = [
+    "shopping_queries",
+    "shopping_cases",
+    "shopping_gt_products",
+    "shopping_gt_coupons",
+    "shopping_catalog",
+    "shopping_user_info",
+    "shopping_initial_cart",
+]
+SHOPPING_CASE_FILES = ("validation_cases.json", "user_info.json", "cart.json", "products.jsonl")
+TRAVEL_DB_FILES: List[Tuple[str, str]] = [
+    ("travel_db_trains", "trains/trains.csv"),
+    ("travel_db_flights", "flights/flights.csv"),
+    ("travel_db_hotels", "hotels/hotels.csv"),
+    ("travel_db_restaurants", "restaurants/restaurants.csv"),
+    ("travel_db_attractions", "attractions/attractions.csv"),
+    ("travel_db_locations", "locations/locations_coords.csv"),
+]
+TRAVEL_DISTANCE_MATRIX_FILE = ("travel_db_transportation", "transportation/distance_matrix.csv")
+TRAVEL_DISTANCE_MATRIX_DENSE_FILE = ("travel_db_transportation_dense", "transportation/distance_matrix.csv")
+DISTANCE_MATRIX_LAYOUTS = ("long", "dense")
+SHOPPING_CASE_DIR_RE = re.compile(r"case_(\d+)")
+TRAVEL_SAMPLE_DIR_RE = re.compile(r"id_(\d+)")
+SCHEMAS_DIR = Path(__file__).resolve().parent.parent / "schemas"
+TABLE_CONTRACTS_PATH = SCHEMAS_DIR / "table_contracts.json"
+TRAVEL_COLUMN_TYPES_PATH = SCHEMAS_DIR / "travel_db_column_types.json"
+
+# Source JSON mixes ints and floats for these columns; pin them so the type does
+# not depend on which rows happen to land in the first row group.
+COLUMN_TYPE_OVERRIDES: Dict[str, Dict[str, pa.DataType]] = {
+    "shopping_gt_products": {"price": pa.float64()},
+    "shopping_catalog": {"price": pa.float64(), "rating": pa.float64()},
+    "shopping_products": {"price": pa.float64(), "rating": pa.float64()},
+    "shopping_catalog_membership": {"case_fields_json": pa.string()},
+}
 
 
 def _ensure_dir(path: Path) -> None:
@@ -34,11 +117,214 @@ def _read_json(path: Path):
         return json.load(f)
 
 
-def _write_parquet(rows: List[Dict], out_path: Path) -> int:
-    _ensure_dir(out_path.parent)
-    table = pa.Table.from_pylist(rows)
-    pq.write_table(table, out_path, compression="zstd")
-    return table.num_rows
+def _conform_batch(batch: pa.RecordBatch, schema: pa.Schema) -> pa.RecordBatch:
+    columns = []
+    for field in schema:
+        if field.name in batch.schema.names:
+            column = batch.column(field.name)
+            if is_nested(field.type) or is_nested(column.type):
+                columns.append(conform_array(column, field.type, field.name))
+            else:
+                columns.append(column.cast(field.type))
+        else:
+            columns.append(pa.nulls(batch.num_rows, field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class _ParquetTableWriter:
+    """Buffer record batches for one table and flush them as fixed-size parquet row groups.
+
+    The schema is taken from the first flushed row group: column names follow the
+    first batch (as ``pa.Table.from_pylist`` did with the first row), column types
+    are unified across the buffered batches and then pinned by ``column_types``.
+    Every later batch is conformed to that schema (nested columns field by
+    field, see ``deepplanning_nested``). A batch that does not fit (an int
+    column that later holds floats, an all-null column that later holds
+    strings) widens the unpinned columns as ``from_pylist`` over all rows would
+    have, and the row groups already written are rewritten in the wider schema. ``write_profile`` sets the parquet
+    encodings once that schema is known (default: plain zstd).
+
+    Rows go to ``<name>.parquet.tmp``, which replaces ``out_path`` only on
+    ``close``: the existing file (and any hardlink of it, e.g. a staged publish
+    copy) is never rewritten in place, and ``abort`` leaves it untouched.
+    """
+
+    def __init__(
+        self,
+        out_path: Path,
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+        column_types: Optional[Dict[str, pa.DataType]] = None,
+        profiler: BuildProfiler = NULL_PROFILER,
+        write_profile: Optional[WriteProfile] = None,
+    ) -> None:
+        self.out_path = out_path
+        self.tmp_path = out_path.with_name(out_path.name + ".tmp")
+        self.row_group_size = row_group_size
+        self.column_types = column_types or {}
+        self.profiler = profiler
+        self.write_profile = write_profile
+        self.schema: Optional[pa.Schema] = None
+        self.num_rows = 0
+        self._pending: List[pa.RecordBatch] = []
+        self._pending_rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def write_rows(self, rows: List[Dict]) -> None:
+        if rows:
+            self.write_batch(pa.RecordBatch.from_pylist(rows))
+
+    def write_batch(self, batch: pa.RecordBatch) -> None:
+        if batch.num_rows == 0:
+            return
+        self._pending.append(batch)
+        self._pending_rows += batch.num_rows
+        if self._pending_rows >= self.row_group_size:
+            self._flush(final=False)
+
+    def _infer_schema(self) -> pa.Schema:
+        names = self._pending[0].schema.names
+        fields = []
+        for name in names:
+            typed = [pa.schema([b.schema.field(name)]) for b in self._pending if name in b.schema.names]
+            unified = pa.unify_schemas(typed, promote_options="permissive").field(name)
+            fields.append(pa.field(name, self.column_types.get(name, writable_type(unified.type))))
+        return pa.schema(fields)
+
+    def _widen_schema(self) -> pa.Schema:
+        """The current schema with unpinned columns promoted to also hold the pending batches."""
+        fields = []
+        for field in self.schema:
+            if field.name in self.column_types:
+                fields.append(field)
+                continue
+            typed = [pa.schema([field])]
+            typed += [pa.schema([b.schema.field(field.name)]) for b in self._pending if field.name in b.schema.names]
+            unified = pa.unify_schemas(typed, promote_options="permissive").field(field.name)
+            fields.append(pa.field(field.name, writable_type(unified.type)))
+        return pa.schema(fields)
+
+    def _rewrite_written(self, schema: pa.Schema) -> None:
+        """Rewrite the row groups already in the temp file in ``schema``, keeping the writer open on it."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        options = _writer_options(self.write_profile, self.out_path.stem, schema)
+        widened = self.tmp_path.with_name(self.tmp_path.name + ".widen")
+        written = pq.ParquetFile(self.tmp_path)
+        writer = pq.ParquetWriter(widened, schema, **options)
+        try:
+            for rg in range(written.metadata.num_row_groups):
+                batches = written.read_row_group(rg).to_batches()
+                part = pa.Table.from_batches([_conform_batch(b, schema) for b in batches], schema=schema)
+                writer.write_table(part, row_group_size=self.row_group_size)
+        except BaseException:
+            writer.close()
+            widened.unlink(missing_ok=True)
+            raise
+        written.close()
+        os.replace(widened, self.tmp_path)
+        self._writer = writer
+
+    def _conform_pending(self) -> pa.Table:
+        try:
+            batches = [_conform_batch(b, self.schema) for b in self._pending]
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, ValueError):
+            widened = self._widen_schema()
+            if widened.equals(self.schema):
+                raise
+            self._rewrite_written(widened)
+            self.schema = widened
+            self.profiler.add_table(self.out_path.stem, schema_widenings=1)
+            batches = [_conform_batch(b, self.schema) for b in self._pending]
+        return pa.Table.from_batches(batches, schema=self.schema)
+
+    def _flush(self, final: bool) -> None:
+        if not self._pending:
+            return
+        if not self.profiler.enabled:
+            self._write_pending(final)
+            return
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        self._write_pending(final)
+        self.profiler.add_table(
+            self.out_path.stem,
+            write_seconds=time.perf_counter() - wall,
+            write_cpu_seconds=time.thread_time() - cpu,
+            row_groups_flushed=1,
+        )
+
+    def _write_pending(self, final: bool) -> None:
+        if self.schema is None:
+            self.schema = self._infer_schema()
+        table = self._conform_pending()
+        self._pending = []
+        self._pending_rows = 0
+        if self._writer is None:
+            _ensure_dir(self.out_path.parent)
+            options = _writer_options(self.write_profile, self.out_path.stem, self.schema)
+            self._writer = pq.ParquetWriter(self.tmp_path, self.schema, **options)
+        full = table.num_rows if final else table.num_rows - table.num_rows % self.row_group_size
+        if full:
+            self._writer.write_table(table.slice(0, full), row_group_size=self.row_group_size)
+            self.num_rows += full
+        if full < table.num_rows:
+            self._pending = table.slice(full).combine_chunks().to_batches()
+            self._pending_rows = table.num_rows - full
+
+    def close(self) -> int:
+        self._flush(final=True)
+        if self._writer is None:
+            _ensure_dir(self.out_path.parent)
+            pq.write_table(pa.Table.from_pylist([]), self.tmp_path, compression="zstd")
+        else:
+            self._writer.close()
+            self._writer = None
+        os.replace(self.tmp_path, self.out_path)
+        self.profiler.add_table(self.out_path.stem, rows=self.num_rows, bytes=self.out_path.stat().st_size)
+        return self.num_rows
+
+    def abort(self) -> None:
+        self._pending = []
+        self._pending_rows = 0
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self.tmp_path.unlink(missing_ok=True)
+
+
+def _writer_options(write_profile: Optional[WriteProfile], table: str, schema: pa.Schema) -> Dict:
+    if write_profile is None:
+        return {"compression": "zstd"}
+    return write_profile.writer_options(table, schema)
+
+
+def _open_writers(
+    names: Iterable[str],
+    parquet_root: Path,
+    row_group_size: int,
+    profiler: BuildProfiler = NULL_PROFILER,
+    write_profile: Optional[WriteProfile] = None,
+) -> Dict[str, _ParquetTableWriter]:
+    return {
+        name: _ParquetTableWriter(
+            parquet_root / f"{name}.parquet",
+            row_group_size if write_profile is None else write_profile.row_group_size(name, row_group_size),
+            COLUMN_TYPE_OVERRIDES.get(name),
+            profiler,
+            write_profile,
+        )
+        for name in names
+    }
+
+
+def _close_writers(writers: Dict[str, _ParquetTableWriter]) -> Dict[str, int]:
+    return {name: writer.close() for name, writer in writers.items()}
+
+
+def _abort_writers(writers: Dict[str, _ParquetTableWriter]) -> None:
+    for writer in writers.values():
+        writer.abort()
 
 
 def _extract_tar(tar_path: Path, out_dir: Path) -> Path:
@@ -61,272 +347,1007 @@ def _extract_zip(zip_path: Path, out_dir: Path) -> Path:
     return roots[0]
 
 
-def _iter_csv_rows(path: Path) -> Iterable[Dict[str, str]]:
-    if not path.exists():
+def _extract_shopping_level(raw_dir: Path, work_dir: Path, level: int) -> Path:
+    """Extract one shopping level archive; returns the input root holding ``level{k}/database_level{k}``."""
+    shopping_extracted = work_dir / "shopping"
+    _extract_tar(raw_dir / f"database_level{level}.tar.gz", shopping_extracted / f"level{level}")
+    return shopping_extracted
+
+
+def _extract_travel_language(raw_dir: Path, work_dir: Path, lang: str) -> Path:
+    """Extract one travel language archive and link it as ``travel/database_{lang}``; returns ``travel``."""
+    lang_extracted = work_dir / f"travel_{lang}"
+    _extract_zip(raw_dir / f"database_{lang}.zip", lang_extracted)
+    travel_extracted = work_dir / "travel"
+    _ensure_dir(travel_extracted)
+    target = travel_extracted / f"database_{lang}"
+    if not target.exists():
+        target.symlink_to((lang_extracted / f"database_{lang}").resolve())
+    return travel_extracted
+
+
+def _map_ordered(fn: Callable, tasks: Iterable[Tuple], workers: int, pool: Optional[Executor] = None) -> Iterator:
+    """Yield ``fn(*task)`` for each task in order, fanning out to a process pool when ``workers > 1``.
+
+    At most ``2 * workers`` tasks are in flight so finished results never pile up
+    behind a slow case. ``pool`` reuses an existing executor (shared by
+    concurrent build stages) instead of starting one.
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield fn(*task)
+        return
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=workers) as own_pool:
+            yield from _map_ordered(fn, tasks, workers, own_pool)
+        return
+    pending: Deque[Future] = deque()
+    try:
+        for task in tasks:
+            pending.append(pool.submit(fn, *task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _map_cases(
+    fn: Callable,
+    tasks: Iterable[Tuple],
+    workers: int,
+    profiler: BuildProfiler,
+    pool: Optional[Executor] = None,
+) -> Iterator[Dict[str, pa.RecordBatch]]:
+    """``_map_ordered`` for the per-case parse functions, timing each case in its worker when profiling."""
+    if not profiler.enabled:
+        yield from _map_ordered(fn, tasks, workers, pool)
+        return
+    for batches, timing in _map_ordered(partial(timed_call, fn), tasks, workers, pool):
+        profiler.add_work(fn.__name__, timing, rows=sum(b.num_rows for b in batches.values()))
+        yield batches
+
+
+class _CaseFiles:
+    """Read-only view of the files inside one ``case_*`` / ``id_*`` directory.
+
+    Paths are relative to the case directory (``"products.jsonl"``,
+    ``"trains/trains.csv"``). Subclasses only implement ``open_binary``.
+    """
+
+    location = ""
+
+    def open_binary(self, relpath: str) -> Optional[IO[bytes]]:
+        raise NotImplementedError
+
+    def open_text(self, relpath: str, encoding: str = "utf-8", newline: Optional[str] = None) -> Optional[IO[str]]:
+        raw = self.open_binary(relpath)
+        if raw is None:
+            return None
+        return io.TextIOWrapper(raw, encoding=encoding, newline=newline)
+
+    def read_json(self, relpath: str):
+        stream = self.open_text(relpath)
+        if stream is None:
+            raise FileNotFoundError(f"{self.location}/{relpath}")
+        with stream as f:
+            return json.load(f)
+
+
+class _DirCaseFiles(_CaseFiles):
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.location = str(root)
+
+    def open_binary(self, relpath: str) -> Optional[IO[bytes]]:
+        path = self.root / relpath
+        if not path.exists():
+            return None
+        return path.open("rb")
+
+
+class _MemoryCaseFiles(_CaseFiles):
+    def __init__(self, location: str, files: Dict[str, bytes]) -> None:
+        self.location = location
+        self.files = files
+
+    def open_binary(self, relpath: str) -> Optional[IO[bytes]]:
+        data = self.files.get(relpath)
+        if data is None:
+            return None
+        return io.BytesIO(data)
+
+
+_ZIP_HANDLES: Dict[Tuple[int, str], zipfile.ZipFile] = {}
+
+
+def _zip_handle(archive: Path) -> zipfile.ZipFile:
+    # Keyed by pid: a ZipFile inherited across fork shares its file offset with the parent.
+    key = (os.getpid(), str(archive))
+    handle = _ZIP_HANDLES.get(key)
+    if handle is None:
+        handle = zipfile.ZipFile(archive, "r")
+        _ZIP_HANDLES[key] = handle
+    return handle
+
+
+class _ZipCaseFiles(_CaseFiles):
+    """Members of one sample directory inside a zip; picklable, so workers reopen the archive lazily."""
+
+    def __init__(self, archive: Path, prefix: str) -> None:
+        self.archive = archive
+        self.prefix = prefix
+        self.location = f"{archive}:{prefix.rstrip('/')}"
+
+    def open_binary(self, relpath: str) -> Optional[IO[bytes]]:
+        handle = _zip_handle(self.archive)
+        name = self.prefix + relpath
+        if name not in handle.NameToInfo:
+            return None
+        return handle.open(name, "r")
+
+
+def _split_case_member(name: str, dir_re: "re.Pattern[str]") -> Optional[Tuple[str, int, str, str]]:
+    """Split ``root/<case_dir>/rel/path`` into (root, case number, case dir prefix, rel/path)."""
+    parts = [p for p in name.split("/") if p and p != "."]
+    for idx, part in enumerate(parts[:-1]):
+        match = dir_re.fullmatch(part)
+        if match:
+            prefix = "/".join(parts[: idx + 1]) + "/"
+            return "/".join(parts[:idx]), int(match.group(1)), prefix, "/".join(parts[idx + 1 :])
+    return None
+
+
+def _iter_dir_cases(root: Path, dir_re: "re.Pattern[str]") -> Iterator[Tuple[str, _CaseFiles]]:
+    case_dirs = []
+    for p in root.iterdir():
+        match = dir_re.fullmatch(p.name)
+        if match and p.is_dir():
+            case_dirs.append((int(match.group(1)), p))
+    for num, p in sorted(case_dirs, key=lambda item: item[0]):
+        yield str(num), _DirCaseFiles(p)
+
+
+def _iter_tar_cases(tar_path: Path, case_ids: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, _CaseFiles]]:
+    """Stream a ``database_level{n}.tar.gz`` in one sequential pass without extracting it, in case order.
+
+    gzip streams cannot seek, so the files of a case are kept in memory (as
+    bytes) until the stream moves past its directory. The case is handed out
+    then if every smaller id in ``case_ids`` (the level's query ids) has been
+    handed out; a case that is not listed goes out once no smaller listed case
+    is pending. An archive in case order therefore holds one case at a time;
+    other member orders fall back to buffering the cases that arrive early,
+    and with ``case_ids=None`` every case is buffered until the pass finishes.
+    """
+    expected: Deque[int] = deque(sorted({int(c) for c in case_ids or () if str(c).isdigit()}))
+    listed = set(expected)
+    ordered = case_ids is not None
+    cases: Dict[int, Dict[str, bytes]] = {}
+    complete: List[int] = []
+    queued = set()
+    current: Optional[int] = None
+    last = -1
+    roots = set()
+
+    def ready() -> bool:
+        if not ordered or not complete:
+            return False
+        num = complete[0]
+        if num == current:  # its directory came back after the stream had moved on
+            return False
+        if expected and num == expected[0]:
+            return True
+        return num not in listed and (not expected or num < expected[0])
+
+    def release() -> Tuple[str, _CaseFiles]:
+        nonlocal last
+        num = heapq.heappop(complete)
+        queued.discard(num)
+        if expected and num == expected[0]:
+            expected.popleft()
+        last = num
+        return str(num), _MemoryCaseFiles(f"{tar_path}:case_{num}", cases.pop(num))
+
+    with tarfile.open(tar_path, "r|gz") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            split = _split_case_member(member.name, SHOPPING_CASE_DIR_RE)
+            if split is None or split[3] not in SHOPPING_CASE_FILES:
+                continue
+            root, num, _, relpath = split
+            if not root.split("/")[-1].startswith("database_level"):
+                continue
+            roots.add(root)
+            if len(roots) > 1:
+                raise RuntimeError(f"Unexpected tar roots in {tar_path}: {sorted(roots)}")
+            if num <= last:
+                raise RuntimeError(
+                    f"{tar_path}: {member.name} comes after case_{last} was handed out (split case directory)"
+                )
+            if num != current:
+                if current is not None and current not in queued:
+                    heapq.heappush(complete, current)
+                    queued.add(current)
+                current = num
+                while ready():
+                    yield release()
+            f = tf.extractfile(member)
+            if f is not None:
+                cases.setdefault(num, {})[relpath] = f.read()
+    if current is not None and current not in queued:
+        heapq.heappush(complete, current)
+    while complete:
+        yield release()
+
+
+def _iter_zip_samples(zip_path: Path) -> Iterator[Tuple[str, _CaseFiles]]:
+    """List ``id_*`` sample directories from the zip central directory; members are read lazily."""
+    prefixes: Dict[int, str] = {}
+    roots = set()
+    for name in _zip_handle(zip_path).namelist():
+        split = _split_case_member(name, TRAVEL_SAMPLE_DIR_RE)
+        if split is None:
+            continue
+        root, num, prefix, _ = split
+        if not root.split("/")[0].startswith("database_"):
+            continue
+        roots.add(root)
+        prefixes[num] = prefix
+    if len(roots) > 1:
+        raise RuntimeError(f"Unexpected zip roots in {zip_path}: {sorted(roots)}")
+    for num in sorted(prefixes):
+        yield str(num), _ZipCaseFiles(zip_path, prefixes[num])
+
+
+def _shopping_case_sources(
+    input_root: Path, level: int, case_ids: Optional[Iterable[str]] = None
+) -> Iterator[Tuple[str, _CaseFiles]]:
+    archive = input_root / f"database_level{level}.tar.gz"
+    if archive.is_file():
+        return _iter_tar_cases(archive, case_ids)
+    level_dir = input_root / f"database_level{level}"
+    if not level_dir.exists():
+        level_dir = input_root / f"level{level}" / f"database_level{level}"
+    if not level_dir.exists():
+        raise FileNotFoundError(f"Cannot find shopping data for level {level} under {input_root}")
+    return _iter_dir_cases(level_dir, SHOPPING_CASE_DIR_RE)
+
+
+def _travel_sample_sources(input_root: Path, lang: str) -> Iterator[Tuple[str, _CaseFiles]]:
+    archive = input_root / f"database_{lang}.zip"
+    if archive.is_file():
+        return _iter_zip_samples(archive)
+    db_root = input_root / f"database_{lang}"
+    if not db_root.exists():
+        db_root = input_root / lang / f"database_{lang}"
+    if not db_root.exists():
+        raise FileNotFoundError(f"Cannot find travel data for language={lang} under {input_root}")
+    return _iter_dir_cases(db_root, TRAVEL_SAMPLE_DIR_RE)
+
+
+def _iter_csv_rows(files: _CaseFiles, relpath: str) -> Iterable[Dict[str, str]]:
+    stream = files.open_text(relpath, encoding="utf-8-sig", newline="")
+    if stream is None:
         return
-    with path.open("r", encoding="utf-8-sig", newline="") as f:
+    with stream as f:
         reader = csv.DictReader(f)
         for row in reader:
             yield dict(row)
 
 
-def build_shopping_tables(
-    shopping_root: Path,
-    extracted_root: Path,
-    parquet_root: Path,
-) -> Dict[str, int]:
-    queries_by_level: Dict[int, Dict[str, str]] = {}
-    shopping_query_rows: List[Dict] = []
-
-    for level in (1, 2, 3):
-        qpath = shopping_root / "data" / f"level_{level}_query_meta.json"
-        data = _read_json(qpath)
-        qmap: Dict[str, str] = {}
-        for sample in data:
-            sid = str(sample["id"])
-            query = sample.get("query", "")
-            qmap[sid] = query
-            shopping_query_rows.append(
-                {
-                    "domain": "shopping",
-                    "level": level,
-                    "case_id": sid,
-                    "query": query,
-                    "source_query_file": str(qpath),
-                }
-            )
-        queries_by_level[level] = qmap
-
-    shopping_case_rows: List[Dict] = []
-    shopping_gt_product_rows: List[Dict] = []
-    shopping_gt_coupon_rows: List[Dict] = []
-    shopping_product_catalog_rows: List[Dict] = []
-    shopping_user_info_rows: List[Dict] = []
-    shopping_initial_cart_rows: List[Dict] = []
-
-    for level in (1, 2, 3):
-        level_dir = extracted_root / f"database_level{level}"
-        if not level_dir.exists():
-            level_dir = extracted_root / f"level{level}" / f"database_level{level}"
-        if not level_dir.exists():
-            raise FileNotFoundError(f"Cannot find extracted shopping data for level {level} under {extracted_root}")
-        case_dirs = sorted(
-            [p for p in level_dir.glob("case_*") if p.is_dir()],
-            key=lambda p: int(p.name.split("_")[1]),
-        )
+def _read_catalog_jsonl(level: int, case_id: str, files: _CaseFiles) -> Optional[pa.RecordBatch]:
+    """Flat ``shopping_catalog`` batch of one case parsed in bulk by Arrow's JSON reader (``--json-columns nested``).
 
-        for cdir in case_dirs:
-            case_id = str(int(cdir.name.split("_")[1]))
-            validation = _read_json(cdir / "validation_cases.json")
-            user_info = _read_json(cdir / "user_info.json")
-            cart = _read_json(cdir / "cart.json")
+    Returns None, so the caller falls back to the per-line parser, when the
+    file has blank lines (``row_id`` counts them), a field changes type, a
+    string is read as a timestamp, a text column is not plain strings or
+    integers (the per-line parser writes ``str(value)``) or ``shipping_info``
+    is missing or null (the per-line parser defaults it to ``{}``).
+    """
+    stream = files.open_binary("products.jsonl")
+    if stream is None:
+        raise FileNotFoundError(f"{files.location}/products.jsonl")
+    with stream as f:
+        data = f.read()
+    if not data.strip() or any(not line.strip() for line in data.splitlines()):
+        return None
+    try:
+        table = pajson.read_json(io.BytesIO(data))
+    except pa.ArrowInvalid:
+        return None
+    if any(contains_type(field.type, pa.types.is_timestamp) for field in table.schema):
+        return None
+    table = table.combine_chunks()
+    n = table.num_rows
+    columns = {
+        "domain": pa.repeat(pa.scalar("shopping", pa.string()), n),
+        "level": pa.repeat(pa.scalar(level, pa.int64()), n),
+        "case_id": pa.repeat(pa.scalar(case_id, pa.string()), n),
+        "row_id": pa.array(range(n), pa.int64()),
+    }
+    for name in ("product_id", "name", "brand", "color", "size"):
+        if name not in table.column_names:
+            columns[name] = pa.repeat(pa.scalar("", pa.string()), n)
+            continue
+        column = table.column(name).chunk(0)
+        if column.null_count or not (pa.types.is_string(column.type) or pa.types.is_integer(column.type)):
+            return None
+        columns[name] = column.cast(pa.string())
+    if "shipping_info" not in table.column_names or table.column("shipping_info").null_count:
+        return None
+    for name in ("price", "stock_quantity", "rating", "sales_volume", "shipping_info"):
+        columns[name] = table.column(name).chunk(0) if name in table.column_names else pa.nulls(n)
+    columns["product"] = pa.StructArray.from_arrays(
+        [column.chunk(0) for column in table.columns], names=table.column_names
+    )
+    return pa.RecordBatch.from_pydict(columns)
 
-            gt_products = validation.get("ground_truth_products", [])
-            gt_coupons = validation.get("ground_truth_coupons", {})
 
-            shopping_case_rows.append(
-                {
+def _parse_shopping_case(
+    level: int,
+    case_id: str,
+    files: _CaseFiles,
+    query: Optional[str],
+    catalog_layout: str = "flat",
+    json_columns: str = "string",
+) -> Dict[str, pa.RecordBatch]:
+    validation = files.read_json("validation_cases.json")
+    user_info = files.read_json("user_info.json")
+    cart = files.read_json("cart.json")
+
+    gt_products = validation.get("ground_truth_products", [])
+    gt_coupons = validation.get("ground_truth_coupons", {})
+
+    case_rows = [
+        {
+            "domain": "shopping",
+            "level": level,
+            "case_id": case_id,
+            "query": query if query is not None else validation.get("query", ""),
+            "validation_query": validation.get("query", ""),
+            **json_fields("meta_info", validation.get("meta_info", {}), json_columns),
+            "ground_truth_products_count": len(gt_products),
+            "ground_truth_coupons_count": len(gt_coupons),
+        }
+    ]
+
+    gt_product_rows = [
+        {
+            "domain": "shopping",
+            "level": level,
+            "case_id": case_id,
+            "gt_index": idx,
+            "product_id": str(p.get("product_id", "")),
+            "name": str(p.get("name", "")),
+            "price": p.get("price"),
+            "brand": str(p.get("brand", "")),
+            "size": str(p.get("size", "")),
+            "color": str(p.get("color", "")),
+            **json_fields("product", p, json_columns),
+        }
+        for idx, p in enumerate(gt_products)
+    ]
+
+    gt_coupon_rows = [
+        {
+            "domain": "shopping",
+            "level": level,
+            "case_id": case_id,
+            "coupon_name": str(coupon_name),
+            "quantity": int(qty),
+        }
+        for coupon_name, qty in gt_coupons.items()
+    ]
+
+    user_info_rows = [
+        {
+            "domain": "shopping",
+            "level": level,
+            "case_id": case_id,
+            "user_id": str(user_info.get("user_id", "")),
+            "username": str(user_info.get("username", "")),
+            "is_vip": bool(user_info.get("is_vip", False)),
+            **json_fields("user_info", user_info, json_columns),
+        }
+    ]
+
+    initial_cart_rows = [
+        {
+            "domain": "shopping",
+            "level": level,
+            "case_id": case_id,
+            "user_id": str(cart.get("user_id", "")),
+            "items_count": len(cart.get("items", [])),
+            "used_coupons_count": len(cart.get("used_coupons", [])),
+            **json_fields("cart", cart, json_columns),
+        }
+    ]
+
+    catalog_rows: List[Dict] = []
+    product_rows: Dict[str, Dict] = {}
+    membership_rows: List[Dict] = []
+    catalog_batch = None
+    if catalog_layout == "flat" and json_columns == "nested":
+        catalog_batch = _read_catalog_jsonl(level, case_id, files)
+    if catalog_batch is None:
+        products = files.open_text("products.jsonl")
+        if products is None:
+            raise FileNotFoundError(f"{files.location}/products.jsonl")
+        with products as f:
+            for row_idx, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                p = json.loads(line)
+                row = {
                     "domain": "shopping",
                     "level": level,
                     "case_id": case_id,
-                    "query": queries_by_level[level].get(case_id, validation.get("query", "")),
-                    "validation_query": validation.get("query", ""),
-                    "meta_info_json": json.dumps(validation.get("meta_info", {}), ensure_ascii=False),
-                    "ground_truth_products_count": len(gt_products),
-                    "ground_truth_coupons_count": len(gt_coupons),
+                    "row_id": row_idx,
+                    "product_id": str(p.get("product_id", "")),
+                    "name": str(p.get("name", "")),
+                    "brand": str(p.get("brand", "")),
+                    "color": str(p.get("color", "")),
+                    "size": str(p.get("size", "")),
+                    "price": p.get("price"),
+                    "stock_quantity": p.get("stock_quantity"),
+                    "rating": p.get("rating"),
+                    "sales_volume": p.get("sales_volume"),
+                    **json_fields("shipping_info", p.get("shipping_info", {}), json_columns),
                 }
-            )
+                if catalog_layout == "dedup":
+                    product_row, membership_row = split_catalog_row(row, p, json_columns)
+                    product_rows.setdefault(product_row[PRODUCT_HASH_COLUMN], product_row)
+                    membership_rows.append(membership_row)
+                else:
+                    row.update(json_fields("product", p, json_columns))
+                    catalog_rows.append(row)
+
+    tables = {
+        "shopping_cases": case_rows,
+        "shopping_gt_products": gt_product_rows,
+        "shopping_gt_coupons": gt_coupon_rows,
+        "shopping_catalog": catalog_rows,
+        "shopping_products": list(product_rows.values()),
+        "shopping_catalog_membership": membership_rows,
+        "shopping_user_info": user_info_rows,
+        "shopping_initial_cart": initial_cart_rows,
+    }
+    batches = {name: pa.RecordBatch.from_pylist(rows) for name, rows in tables.items() if rows}
+    if catalog_batch is not None:
+        batches[FLAT_TABLE] = catalog_batch
+    return batches
+
+
+def _load_travel_column_types(path: Path = TRAVEL_COLUMN_TYPES_PATH) -> Dict[str, Dict[str, pa.DataType]]:
+    raw = _read_json(path)
+    return {table: {col: pa.type_for_alias(alias) for col, alias in cols.items()} for table, cols in raw.items()}
 
-            for idx, p in enumerate(gt_products):
-                shopping_gt_product_rows.append(
+
+def _read_csv_table(files: _CaseFiles, relpath: str, column_types: Dict[str, pa.DataType]) -> Optional[pa.Table]:
+    """Read one CSV with Arrow's multithreaded reader; undeclared columns stay strings."""
+    stream = files.open_binary(relpath)
+    if stream is None:
+        return None
+    with stream as f:
+        data = f.read()
+    header = next(csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")), [])
+    types = {name: column_types.get(name, pa.string()) for name in header}
+    try:
+        return pacsv.read_csv(
+            io.BytesIO(data),
+            read_options=pacsv.ReadOptions(use_threads=True),
+            convert_options=pacsv.ConvertOptions(column_types=types),
+        )
+    except pa.ArrowInvalid as exc:
+        if "CSV parse error" not in str(exc):
+            raise ValueError(f"{files.location}/{relpath}: {exc} (column types: {TRAVEL_COLUMN_TYPES_PATH.name})") from exc
+
+    # Ragged rows: keep csv.DictReader semantics (missing cells -> null, extra cells dropped).
+    table = pa.Table.from_pylist(list(_iter_csv_rows(files, relpath)))
+    for idx, field in enumerate(table.schema):
+        target = types.get(field.name, pa.string())
+        if field.type == target:
+            continue
+        column = table.column(idx)
+        if pa.types.is_string(field.type):
+            column = pc.if_else(pc.equal(column, ""), pa.scalar(None, field.type), column)
+        try:
+            table = table.set_column(idx, field.name, column.cast(target))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as exc:
+            raise ValueError(f"{files.location}/{relpath}: column {field.name!r}: {exc}") from exc
+    return table
+
+
+def _parse_travel_sample(
+    lang: str,
+    sample_id: str,
+    files: _CaseFiles,
+    db_files: List[Tuple[str, str]],
+    column_types: Dict[str, Dict[str, pa.DataType]],
+) -> Dict[str, pa.RecordBatch]:
+    batches: Dict[str, pa.RecordBatch] = {}
+    for table_name, relpath in db_files:
+        dense = table_name == TRAVEL_DISTANCE_MATRIX_DENSE_FILE[0]
+        types_key = TRAVEL_DISTANCE_MATRIX_FILE[0] if dense else table_name
+        table = _read_csv_table(files, relpath, column_types.get(types_key, {}))
+        if table is None or table.num_rows == 0:
+            continue
+        if dense:
+            try:
+                encoded = encode_distance_matrix(table)
+            except ValueError as exc:
+                raise ValueError(f"{files.location}/{relpath}: {exc}") from exc
+            row = {"domain": "travel", "language": lang, "sample_id": sample_id, **encoded}
+            schema = dense_schema(measure_types(table.schema))
+            batches[table_name] = pa.RecordBatch.from_pylist([row], schema=schema)
+            continue
+        constants = {"domain": "travel", "language": lang, "sample_id": sample_id}
+        table = table.drop_columns([name for name in constants if name in table.column_names])
+        for name, value in constants.items():
+            table = table.append_column(name, pa.repeat(pa.scalar(value, pa.string()), table.num_rows))
+        batches[table_name] = table.combine_chunks().to_batches()[0]
+    return batches
+
+
+def _travel_db_files(include_distance_matrix: bool, distance_matrix_layout: str = "long") -> List[Tuple[str, str]]:
+    if distance_matrix_layout not in DISTANCE_MATRIX_LAYOUTS:
+        raise ValueError(f"Unknown distance matrix layout: {distance_matrix_layout}")
+    db_files = list(TRAVEL_DB_FILES)
+    if include_distance_matrix:
+        if distance_matrix_layout == "dense":
+            db_files.append(TRAVEL_DISTANCE_MATRIX_DENSE_FILE)
+        else:
+            db_files.append(TRAVEL_DISTANCE_MATRIX_FILE)
+    return db_files
+
+
+def _shopping_table_names(catalog_layout: str = "flat") -> List[str]:
+    names: List[str] = []
+    for name in SHOPPING_TABLES:
+        names.extend(layout_tables(catalog_layout) if name == FLAT_TABLE else [name])
+    return names
+
+
+def _known_table_names() -> List[str]:
+    """Every table some combination of --catalog-layout/--include-distance-matrix/--distance-matrix-layout writes."""
+    names: List[str] = []
+    for candidates in [_shopping_table_names(layout) for layout in CATALOG_LAYOUTS] + [
+        _travel_table_names(True, layout) for layout in DISTANCE_MATRIX_LAYOUTS
+    ]:
+        names.extend(name for name in candidates if name not in names)
+    return names
+
+
+def _remove_stale_tables(
+    out_dir: Path, built: Iterable[str], partitioned_dir: Optional[Path], ipc_dir: Path
+) -> List[str]:
+    """Delete tables of other layouts/flags that an earlier build left in the output directories.
+
+    Covers the catalog tables of the other ``--catalog-layout`` and the distance
+    matrix table of the other ``--distance-matrix-layout`` (or both, without
+    ``--include-distance-matrix``), in the flat, partitioned and IPC outputs.
+    """
+    built = set(built)
+    removed: List[str] = []
+    for table in _known_table_names():
+        if table in built:
+            continue
+        paths = [out_dir / f"{table}.parquet", ipc_dir / f"{table}{IPC_SUFFIX}"]
+        if partitioned_dir is not None:
+            paths.append(partitioned_dir / table)
+        for path in paths:
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                path.unlink()
+            else:
+                continue
+            removed.append(str(path))
+    return removed
+
+
+def _drop_seen_products(batch: pa.RecordBatch, seen: set) -> pa.RecordBatch:
+    """Keep only products whose hash has not been written yet (first occurrence wins)."""
+    keep = []
+    for digest in batch.column(PRODUCT_HASH_COLUMN).to_pylist():
+        keep.append(digest not in seen)
+        seen.add(digest)
+    return batch if all(keep) else batch.filter(pa.array(keep))
+
+
+def _travel_table_names(include_distance_matrix: bool, distance_matrix_layout: str = "long") -> List[str]:
+    db_files = _travel_db_files(include_distance_matrix, distance_matrix_layout)
+    return ["travel_queries", "travel_constraints"] + [name for name, _ in db_files]
+
+
+def build_shopping_tables(
+    shopping_root: Path,
+    input_root: Path,
+    parquet_root: Path,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    workers: int = 1,
+    tables: Optional[Iterable[str]] = None,
+    catalog_layout: str = "flat",
+    profiler: BuildProfiler = NULL_PROFILER,
+    json_columns: str = "string",
+    input_root_for: Optional[Callable[[int], Path]] = None,
+    pool: Optional[Executor] = None,
+    write_profile: Optional[WriteProfile] = None,
+) -> Dict[str, int]:
+    """Build the shopping tables.
+
+    ``input_root_for(level)``, when given, is called just before a level's cases
+    are read and returns that level's input root, so a scheduler can start on
+    level 1 while later levels are still being extracted. ``pool`` is a shared
+    process pool for case parsing. ``write_profile`` sets per-table encodings
+    and row-group sizes (``schemas/write_profiles.json``).
+    """
+    all_tables = _shopping_table_names(catalog_layout)
+    selected = set(all_tables if tables is None else tables)
+    writers = _open_writers(
+        [t for t in all_tables if t in selected], parquet_root, row_group_size, profiler, write_profile
+    )
+    try:
+        queries_by_level: Dict[int, Dict[str, str]] = {}
+        for level in (1, 2, 3):
+            qpath = shopping_root / "data" / f"level_{level}_query_meta.json"
+            data = _read_json(qpath)
+            qmap: Dict[str, str] = {}
+            query_rows: List[Dict] = []
+            for sample in data:
+                sid = str(sample["id"])
+                query = sample.get("query", "")
+                qmap[sid] = query
+                query_rows.append(
                     {
                         "domain": "shopping",
                         "level": level,
-                        "case_id": case_id,
-                        "gt_index": idx,
-                        "product_id": str(p.get("product_id", "")),
-                        "name": str(p.get("name", "")),
-                        "price": p.get("price"),
-                        "brand": str(p.get("brand", "")),
-                        "size": str(p.get("size", "")),
-                        "color": str(p.get("color", "")),
-                        "product_json": json.dumps(p, ensure_ascii=False),
+                        "case_id": sid,
+                        "query": query,
+                        "source_query_file": str(qpath),
                     }
                 )
+            if "shopping_queries" in writers:
+                writers["shopping_queries"].write_rows(query_rows)
+            queries_by_level[level] = qmap
 
-            for coupon_name, qty in gt_coupons.items():
-                shopping_gt_coupon_rows.append(
+        if any(name in writers for name in all_tables[1:]):
+            tasks = (
+                (level, case_id, files, queries_by_level[level].get(case_id), catalog_layout, json_columns)
+                for level in (1, 2, 3)
+                for case_id, files in _shopping_case_sources(
+                    input_root if input_root_for is None else input_root_for(level), level, queries_by_level[level]
+                )
+            )
+            seen_products: set = set()
+            with profiler.stage("cases", workers=workers):
+                for batches in _map_cases(_parse_shopping_case, tasks, workers, profiler, pool):
+                    for table_name, batch in batches.items():
+                        if table_name not in writers:
+                            continue
+                        if table_name == PRODUCTS_TABLE:
+                            batch = _drop_seen_products(batch, seen_products)
+                        writers[table_name].write_batch(batch)
+    except BaseException:
+        _abort_writers(writers)
+        raise
+    with profiler.stage("close"):
+        return _close_writers(writers)
+
+
+def build_travel_tables(
+    travel_root: Path,
+    input_root: Path,
+    parquet_root: Path,
+    include_distance_matrix: bool,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    workers: int = 1,
+    tables: Optional[Iterable[str]] = None,
+    distance_matrix_layout: str = "long",
+    profiler: BuildProfiler = NULL_PROFILER,
+    json_columns: str = "string",
+    input_root_for: Optional[Callable[[str], Path]] = None,
+    pool: Optional[Executor] = None,
+    write_profile: Optional[WriteProfile] = None,
+) -> Dict[str, int]:
+    """Build the travel tables; ``input_root_for``, ``pool`` and ``write_profile`` as in ``build_shopping_tables``."""
+    all_tables = _travel_table_names(include_distance_matrix, distance_matrix_layout)
+    selected = set(all_tables if tables is None else tables)
+    db_files = [
+        (name, relpath)
+        for name, relpath in _travel_db_files(include_distance_matrix, distance_matrix_layout)
+        if name in selected
+    ]
+    writers = _open_writers(
+        [t for t in all_tables if t in selected], parquet_root, row_group_size, profiler, write_profile
+    )
+    try:
+        for lang in ("en", "zh"):
+            qpath = travel_root / "data" / f"travelplanning_query_{lang}.json"
+            data = _read_json(qpath)
+            query_rows: List[Dict] = []
+            constraint_rows: List[Dict] = []
+            for sample in data:
+                sample_id = str(sample.get("id"))
+                meta = sample.get("meta_info", {})
+                query_rows.append(
                     {
-                        "domain": "shopping",
-                        "level": level,
-                        "case_id": case_id,
-                        "coupon_name": str(coupon_name),
-                        "quantity": int(qty),
+                        "domain": "travel",
+                        "language": lang,
+                        "sample_id": sample_id,
+                        "query": sample.get("query", ""),
+                        "query_with_constraints": sample.get("query_with_constraints", ""),
+                        "source_query_file": str(qpath),
+                    }
+                )
+                constraint_rows.append(
+                    {
+                        "domain": "travel",
+                        "language": lang,
+                        "sample_id": sample_id,
+                        "org": str(meta.get("org", "")),
+                        **json_fields("dest", meta.get("dest", []), json_columns),
+                        "days": meta.get("days"),
+                        "depart_date": str(meta.get("depart_date", "")),
+                        "return_date": str(meta.get("return_date", "")),
+                        "people_number": meta.get("people_number"),
+                        "room_number": meta.get("room_number"),
+                        "depart_weekday": meta.get("depart_weekday"),
+                        **json_fields("hard_constraints", meta.get("hard_constraints", {}), json_columns),
+                        **json_fields("meta_info", meta, json_columns),
                     }
                 )
+            if "travel_queries" in writers:
+                writers["travel_queries"].write_rows(query_rows)
+            if "travel_constraints" in writers:
+                writers["travel_constraints"].write_rows(constraint_rows)
 
-            shopping_user_info_rows.append(
-                {
-                    "domain": "shopping",
-                    "level": level,
-                    "case_id": case_id,
-                    "user_id": str(user_info.get("user_id", "")),
-                    "username": str(user_info.get("username", "")),
-                    "is_vip": bool(user_info.get("is_vip", False)),
-                    "user_info_json": json.dumps(user_info, ensure_ascii=False),
-                }
+        if db_files:
+            column_types = _load_travel_column_types()
+            tasks = (
+                (lang, sample_id, files, db_files, column_types)
+                for lang in ("en", "zh")
+                for sample_id, files in _travel_sample_sources(
+                    input_root if input_root_for is None else input_root_for(lang), lang
+                )
             )
+            with profiler.stage("samples", workers=workers):
+                for batches in _map_cases(_parse_travel_sample, tasks, workers, profiler, pool):
+                    for table_name, batch in batches.items():
+                        writers[table_name].write_batch(batch)
+    except BaseException:
+        _abort_writers(writers)
+        raise
+    with profiler.stage("close"):
+        return _close_writers(writers)
 
-            shopping_initial_cart_rows.append(
-                {
-                    "domain": "shopping",
-                    "level": level,
-                    "case_id": case_id,
-                    "user_id": str(cart.get("user_id", "")),
-                    "items_count": len(cart.get("items", [])),
-                    "used_coupons_count": len(cart.get("used_coupons", [])),
-                    "cart_json": json.dumps(cart, ensure_ascii=False),
-                }
-            )
 
-            products_path = cdir / "products.jsonl"
-            with products_path.open("r", encoding="utf-8") as f:
-                for row_idx, line in enumerate(f):
-                    line = line.strip()
-                    if not line:
-                        continue
-                    p = json.loads(line)
-                    shopping_product_catalog_rows.append(
-                        {
-                            "domain": "shopping",
-                            "level": level,
-                            "case_id": case_id,
-                            "row_id": row_idx,
-                            "product_id": str(p.get("product_id", "")),
-                            "name": str(p.get("name", "")),
-                            "brand": str(p.get("brand", "")),
-                            "color": str(p.get("color", "")),
-                            "size": str(p.get("size", "")),
-                            "price": p.get("price"),
-                            "stock_quantity": p.get("stock_quantity"),
-                            "rating": p.get("rating"),
-                            "sales_volume": p.get("sales_volume"),
-                            "shipping_info_json": json.dumps(p.get("shipping_info", {}), ensure_ascii=False),
-                            "product_json": json.dumps(p, ensure_ascii=False),
-                        }
-                    )
+def _partition_layout(table_name: str, contracts: Dict) -> Tuple[Optional[str], List[str]]:
+    """Derive (partition column, sort columns) from the domain primary keys in table_contracts.json.
 
-    counts = {
-        "shopping_queries": _write_parquet(shopping_query_rows, parquet_root / "shopping_queries.parquet"),
-        "shopping_cases": _write_parquet(shopping_case_rows, parquet_root / "shopping_cases.parquet"),
-        "shopping_gt_products": _write_parquet(shopping_gt_product_rows, parquet_root / "shopping_gt_products.parquet"),
-        "shopping_gt_coupons": _write_parquet(shopping_gt_coupon_rows, parquet_root / "shopping_gt_coupons.parquet"),
-        "shopping_catalog": _write_parquet(shopping_product_catalog_rows, parquet_root / "shopping_catalog.parquet"),
-        "shopping_user_info": _write_parquet(shopping_user_info_rows, parquet_root / "shopping_user_info.parquet"),
-        "shopping_initial_cart": _write_parquet(shopping_initial_cart_rows, parquet_root / "shopping_initial_cart.parquet"),
-    }
-    return counts
+    Keys are ``[domain, level|language, case_id|sample_id]``: the constant domain
+    column is skipped, the second key partitions and the rest sort. Shared
+    tables (not per case) are not partitioned and sort by their own keys.
+    """
+    for domain in contracts.values():
+        if f"{table_name}.parquet" in domain["tables"]:
+            keys = domain["primary_keys"]
+            return keys[1], keys[2:]
+        shared = domain.get("shared_tables", {}).get(f"{table_name}.parquet")
+        if shared is not None:
+            return None, list(shared["primary_keys"])
+    raise KeyError(f"{table_name} is not declared in {TABLE_CONTRACTS_PATH.name}")
 
 
-def build_travel_tables(
+def _key_aligned_slices(table: pa.Table, key: str, target_rows: int) -> Iterator[pa.Table]:
+    """Split a key-sorted table into ~target_rows slices that never cut through a key run."""
+    column = table.column(key)
+    if table.num_rows > 1:
+        changed = pc.not_equal(column.slice(1), column.slice(0, table.num_rows - 1))
+        boundaries = [i + 1 for i in pc.indices_nonzero(pc.fill_null(changed, True)).to_pylist()]
+    else:
+        boundaries = []
+    start = 0
+    for boundary in boundaries + [table.num_rows]:
+        if boundary - start >= target_rows or boundary == table.num_rows:
+            yield table.slice(start, boundary - start)
+            start = boundary
+
+
+def _write_key_sorted(
+    part: pa.Table,
+    out_path: Path,
+    sort_by: List[str],
+    row_group_size: int,
+    write_profile: Optional[WriteProfile] = None,
+    table_name: Optional[str] = None,
+) -> None:
+    part = part.sort_by([(name, "ascending") for name in sort_by])
+    _ensure_dir(out_path.parent)
+    options = _writer_options(write_profile, table_name or out_path.stem, part.schema)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    with pq.ParquetWriter(tmp_path, part.schema, **options) as writer:
+        for chunk in _key_aligned_slices(part, sort_by[0], row_group_size):
+            writer.write_table(chunk, row_group_size=max(chunk.num_rows, 1))
+    os.replace(tmp_path, out_path)
+
+
+def write_partitioned_table(
+    src: Path,
+    dest_dir: Path,
+    partition_by: Optional[str],
+    sort_by: List[str],
+    row_group_size: int = DEFAULT_PARTITIONED_ROW_GROUP_SIZE,
+    write_profile: Optional[WriteProfile] = None,
+) -> int:
+    """Rewrite one flat table as ``dest_dir/<partition_by>=<value>/part-0.parquet``, key-sorted.
+
+    Each partition is read on its own, sorted by ``sort_by`` (stable, so the
+    builder's order is kept within a key) and written in row groups that end on
+    key boundaries, so min/max statistics on the sort key are disjoint. With
+    ``partition_by=None`` the whole table goes to ``dest_dir/part-0.parquet``.
+    ``write_profile`` sets the encodings; its row-group size does not apply here.
+    """
+    if dest_dir.exists():
+        shutil.rmtree(dest_dir)
+    schema = pq.read_schema(src)
+    if partition_by is None:
+        if any(name not in schema.names for name in sort_by):
+            return 0
+        _write_key_sorted(
+            pq.read_table(src), dest_dir / "part-0.parquet", sort_by, row_group_size, write_profile, src.stem
+        )
+        return 1
+    if partition_by not in schema.names:
+        return 0
+    values = pc.unique(pq.read_table(src, columns=[partition_by]).column(0)).to_pylist()
+    dataset = ds.dataset(src, format="parquet")
+    for value in sorted(v for v in values if v is not None):
+        part = dataset.to_table(filter=pc.field(partition_by) == value).drop_columns([partition_by])
+        _write_key_sorted(
+            part,
+            dest_dir / f"{partition_by}={value}" / "part-0.parquet",
+            sort_by,
+            row_group_size,
+            write_profile,
+            src.stem,
+        )
+    return len(values)
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _code_fingerprints() -> Dict[str, str]:
+    """sha256 of this script and of every ``etl/deepplanning_*.py`` module it has imported, directly or not."""
+    here = Path(__file__).resolve()
+    paths = {here}
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if path is None:
+            continue
+        path = Path(path).resolve()
+        if path.parent == here.parent and path.name.startswith("deepplanning_") and path.suffix == ".py":
+            paths.add(path)
+    return {path.name: _sha256_file(path) for path in sorted(paths)}
+
+
+def _fingerprint_inputs(paths: Dict[str, Path], previous: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Hash every build input, reusing the previous digest when size and mtime are unchanged."""
+    fingerprints: Dict[str, Dict] = {}
+    for label, path in sorted(paths.items()):
+        stat = path.stat()
+        prev = previous.get(label, {})
+        if prev.get("size") == stat.st_size and prev.get("mtime_ns") == stat.st_mtime_ns and prev.get("sha256"):
+            sha = prev["sha256"]
+        else:
+            sha = _sha256_file(path)
+        fingerprints[label] = {"sha256": sha, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return fingerprints
+
+
+def _table_dependencies(
+    shopping_root: Path,
     travel_root: Path,
-    extracted_root: Path,
-    parquet_root: Path,
+    raw_dir: Path,
     include_distance_matrix: bool,
-) -> Dict[str, int]:
-    travel_query_rows: List[Dict] = []
-    travel_constraints_rows: List[Dict] = []
-
-    for lang in ("en", "zh"):
-        qpath = travel_root / "data" / f"travelplanning_query_{lang}.json"
-        data = _read_json(qpath)
-        for sample in data:
-            sample_id = str(sample.get("id"))
-            meta = sample.get("meta_info", {})
-            travel_query_rows.append(
-                {
-                    "domain": "travel",
-                    "language": lang,
-                    "sample_id": sample_id,
-                    "query": sample.get("query", ""),
-                    "query_with_constraints": sample.get("query_with_constraints", ""),
-                    "source_query_file": str(qpath),
-                }
-            )
-            travel_constraints_rows.append(
-                {
-                    "domain": "travel",
-                    "language": lang,
-                    "sample_id": sample_id,
-                    "org": str(meta.get("org", "")),
-                    "dest_json": json.dumps(meta.get("dest", []), ensure_ascii=False),
-                    "days": meta.get("days"),
-                    "depart_date": str(meta.get("depart_date", "")),
-                    "return_date": str(meta.get("return_date", "")),
-                    "people_number": meta.get("people_number"),
-                    "room_number": meta.get("room_number"),
-                    "depart_weekday": meta.get("depart_weekday"),
-                    "hard_constraints_json": json.dumps(meta.get("hard_constraints", {}), ensure_ascii=False),
-                    "meta_info_json": json.dumps(meta, ensure_ascii=False),
-                }
-            )
-
-    table_to_rows: Dict[str, List[Dict]] = {
-        "travel_db_trains": [],
-        "travel_db_flights": [],
-        "travel_db_hotels": [],
-        "travel_db_restaurants": [],
-        "travel_db_attractions": [],
-        "travel_db_locations": [],
+    distance_matrix_layout: str = "long",
+    catalog_layout: str = "flat",
+) -> Dict[str, Dict[str, Path]]:
+    """Map every output table to the input files (label -> path) its content is derived from."""
+    shopping_queries = {
+        str(p): p for p in (shopping_root / "data" / f"level_{level}_query_meta.json" for level in (1, 2, 3))
     }
-    if include_distance_matrix:
-        table_to_rows["travel_db_transportation"] = []
-
-    for lang in ("en", "zh"):
-        db_root = extracted_root / f"database_{lang}"
-        if not db_root.exists():
-            db_root = extracted_root / lang / f"database_{lang}"
-        if not db_root.exists():
-            raise FileNotFoundError(f"Cannot find extracted travel data for language={lang} under {extracted_root}")
-        id_dirs = sorted([p for p in db_root.glob("id_*") if p.is_dir()], key=lambda p: int(p.name.split("_")[1]))
-
-        for id_dir in id_dirs:
-            sample_id = str(int(id_dir.name.split("_")[1]))
-            file_map: List[Tuple[str, Path]] = [
-                ("travel_db_trains", id_dir / "trains" / "trains.csv"),
-                ("travel_db_flights", id_dir / "flights" / "flights.csv"),
-                ("travel_db_hotels", id_dir / "hotels" / "hotels.csv"),
-                ("travel_db_restaurants", id_dir / "restaurants" / "restaurants.csv"),
-                ("travel_db_attractions", id_dir / "attractions" / "attractions.csv"),
-                ("travel_db_locations", id_dir / "locations" / "locations_coords.csv"),
-            ]
-            if include_distance_matrix:
-                file_map.append(("travel_db_transportation", id_dir / "transportation" / "distance_matrix.csv"))
-
-            for table_name, csv_path in file_map:
-                for row in _iter_csv_rows(csv_path):
-                    row["domain"] = "travel"
-                    row["language"] = lang
-                    row["sample_id"] = sample_id
-                    table_to_rows[table_name].append(row)
-
-    counts = {
-        "travel_queries": _write_parquet(travel_query_rows, parquet_root / "travel_queries.parquet"),
-        "travel_constraints": _write_parquet(travel_constraints_rows, parquet_root / "travel_constraints.parquet"),
+    travel_queries = {
+        str(p): p for p in (travel_root / "data" / f"travelplanning_query_{lang}.json" for lang in ("en", "zh"))
     }
-    for table_name, rows in table_to_rows.items():
-        counts[table_name] = _write_parquet(rows, parquet_root / f"{table_name}.parquet")
-    return counts
+    shopping_archives = {f"database_level{level}.tar.gz": raw_dir / f"database_level{level}.tar.gz" for level in (1, 2, 3)}
+    travel_archives = {f"database_{lang}.zip": raw_dir / f"database_{lang}.zip" for lang in ("en", "zh")}
+
+    deps: Dict[str, Dict[str, Path]] = {}
+    for name in _shopping_table_names(catalog_layout):
+        if name == "shopping_queries":
+            deps[name] = shopping_queries
+        elif name == "shopping_cases":
+            deps[name] = {**shopping_queries, **shopping_archives}
+        else:
+            deps[name] = shopping_archives
+    for name in _travel_table_names(include_distance_matrix, distance_matrix_layout):
+        deps[name] = travel_queries if name in ("travel_queries", "travel_constraints") else travel_archives
+    return deps
+
+
+def _table_fingerprint(labels: Iterable[str], inputs: Dict[str, Dict], options: Dict) -> str:
+    payload = {"inputs": {label: inputs[label]["sha256"] for label in sorted(labels)}, "options": options}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _stage_key(payload: Dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _download_raw_file(file_name: str, raw_cache_dir: Path, profiler: BuildProfiler, results: Dict) -> str:
+    """Download one raw archive (``hf_hub_download`` resumes partial files and skips up-to-date ones)."""
+    with profiler.stage(f"download[{file_name}]"):
+        return hf_hub_download(
+            repo_id=HF_DATASET_ID,
+            repo_type="dataset",
+            filename=file_name,
+            local_dir=str(raw_cache_dir),
+        )
+
 
+def _load_manifest(path: Path) -> Dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
 
-def build_manifest(out_path: Path, counts: Dict[str, int], include_distance_matrix: bool, source_qwen_agent_root: Path) -> None:
+
+def build_manifest(
+    out_path: Path,
+    counts: Dict[str, int],
+    include_distance_matrix: bool,
+    source_qwen_agent_root: Path,
+    inputs: Optional[Dict[str, Dict]] = None,
+    table_fingerprints: Optional[Dict[str, str]] = None,
+    distance_matrix_layout: str = "long",
+    partitioned: Optional[Dict] = None,
+    profile: Optional[Dict] = None,
+    catalog_layout: str = "flat",
+    json_columns: str = "string",
+    ipc: Optional[Dict] = None,
+    write_profile: str = DEFAULT_WRITE_PROFILE,
+) -> None:
     manifest = {
         "dataset": "DeepPlanning-parquet",
         "source_dataset": HF_DATASET_ID,
         "source_qwen_agent_root": str(source_qwen_agent_root),
         "include_distance_matrix": include_distance_matrix,
+        "distance_matrix_layout": distance_matrix_layout,
+        "catalog_layout": catalog_layout,
+        "json_columns": json_columns,
+        "write_profile": write_profile,
         "tables": counts,
     }
+    if inputs is not None:
+        manifest["inputs"] = inputs
+    if table_fingerprints is not None:
+        manifest["table_fingerprints"] = table_fingerprints
+    if partitioned is not None:
+        manifest["partitioned"] = partitioned
+    if ipc is not None:
+        manifest["ipc"] = ipc
+    if profile is not None:
+        manifest["profile"] = profile
     out_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
@@ -344,11 +1365,21 @@ def main() -> None:
         default=Path("artifacts/raw_hf"),
         help="Directory for downloaded raw archives",
     )
+    parser.add_argument(
+        "--skip-download",
+        action="store_true",
+        help="Use the archives already in --raw-cache-dir instead of downloading them (offline runs)",
+    )
     parser.add_argument(
         "--work-dir",
         type=Path,
         default=Path("artifacts/work"),
-        help="Temporary extraction working directory",
+        help="Extraction working directory (only used with --extract)",
+    )
+    parser.add_argument(
+        "--extract",
+        action="store_true",
+        help="Extract archives into --work-dir before building instead of streaming them",
     )
     parser.add_argument(
         "--out-dir",
@@ -361,53 +1392,409 @@ def main() -> None:
         action="store_true",
         help="Include travel distance matrix table (largest table)",
     )
+    parser.add_argument(
+        "--distance-matrix-layout",
+        choices=DISTANCE_MATRIX_LAYOUTS,
+        default="long",
+        help="long: one row per location pair (travel_db_transportation); "
+        "dense: one row per sample with a location list and n*n measure lists (travel_db_transportation_dense)",
+    )
+    parser.add_argument(
+        "--catalog-layout",
+        choices=CATALOG_LAYOUTS,
+        default="flat",
+        help="flat: shopping_catalog with one full product row per case; "
+        "dedup: distinct products once in shopping_products (keyed by content hash) "
+        "plus per-case shopping_catalog_membership",
+    )
+    parser.add_argument(
+        "--json-columns",
+        choices=JSON_COLUMN_MODES,
+        default="string",
+        help="string: JSON-valued fields as json.dumps strings in *_json columns; "
+        "nested: native Arrow struct/list columns without the _json suffix; "
+        "both: nested columns plus the *_json strings as audit columns",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=DEFAULT_ROW_GROUP_SIZE,
+        help="Rows buffered per table before a parquet row group is flushed",
+    )
+    parser.add_argument(
+        "--write-profile",
+        choices=sorted(load_write_profiles()),
+        default=DEFAULT_WRITE_PROFILE,
+        help="Parquet encodings, zstd level, page and row-group size per table from "
+        f"schemas/{WRITE_PROFILES_PATH.name} (publish-small: Hub downloads, fast-scan: local analytics, "
+        "archive: smallest); a profile's row-group size overrides --row-group-size",
+    )
+    parser.add_argument(
+        "--write-profile-report",
+        action="store_true",
+        help=f"After the build, re-encode every table with each write profile and write file size and "
+        f"full-scan decode time per profile to <out-dir>/{WRITE_PROFILE_REPORT_FILE}",
+    )
+    parser.add_argument(
+        "--partitioned-dir",
+        type=Path,
+        default=None,
+        help="Also write a Hive-partitioned, key-sorted copy of every table here "
+        "(shopping by level=, travel by language=)",
+    )
+    parser.add_argument(
+        "--partitioned-row-group-size",
+        type=int,
+        default=DEFAULT_PARTITIONED_ROW_GROUP_SIZE,
+        help="Target rows per row group in the partitioned layout (row groups end on case/sample boundaries)",
+    )
+    parser.add_argument(
+        "--ipc-companions",
+        choices=("none",) + IPC_COMPRESSIONS,
+        default="none",
+        help="Also write an Arrow IPC (Feather v2) copy of every table for memory-mapped loading; "
+        "uncompressed is zero-copy, lz4 is smaller but decompressed on read",
+    )
+    parser.add_argument(
+        "--ipc-dir",
+        type=Path,
+        default=None,
+        help=f"Directory for --ipc-companions files (default: <out-dir>/{DEFAULT_IPC_DIR_NAME})",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every table even if its input fingerprints match manifest.json",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes used to parse shopping cases / travel samples (0 = all CPUs)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record per-stage/per-table wall time, CPU time, rows, bytes and peak RSS "
+        "into manifest.json and a Chrome trace (see --profile-trace)",
+    )
+    parser.add_argument(
+        "--profile-trace",
+        type=Path,
+        default=None,
+        help="Chrome trace / Perfetto JSON path for --profile (default: <out-dir>/build_trace.json)",
+    )
     args = parser.parse_args()
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    profiler = BuildProfiler() if args.profile else NULL_PROFILER
+    write_profile = load_write_profiles()[args.write_profile]
 
     _ensure_dir(args.raw_cache_dir)
-    _ensure_dir(args.work_dir)
     _ensure_dir(args.out_dir)
 
-    snapshot_download(
-        repo_id=HF_DATASET_ID,
-        repo_type="dataset",
-        allow_patterns=RAW_FILES,
-        local_dir=str(args.raw_cache_dir),
-        local_dir_use_symlinks=False,
-    )
-
     shopping_root = args.qwen_agent_root / "shoppingplanning"
     travel_root = args.qwen_agent_root / "travelplanning"
 
     if not shopping_root.exists() or not travel_root.exists():
         raise FileNotFoundError(f"Invalid qwen-agent root: {args.qwen_agent_root}")
 
-    shopping_extracted = args.work_dir / "shopping"
-    travel_en_extracted = args.work_dir / "travel_en"
-    travel_zh_extracted = args.work_dir / "travel_zh"
+    manifest_path = args.out_dir / "manifest.json"
+    previous = _load_manifest(manifest_path)
+    deps = _table_dependencies(
+        shopping_root,
+        travel_root,
+        args.raw_cache_dir,
+        args.include_distance_matrix,
+        args.distance_matrix_layout,
+        args.catalog_layout,
+    )
+    options = {
+        # Any change to the builder or a helper module it imports (catalog split, distance encoding,
+        # JSON column expansion, write profiles, ...) rebuilds every table.
+        "builder": _code_fingerprints(),
+        "column_types": _sha256_file(TRAVEL_COLUMN_TYPES_PATH),
+        "row_group_size": args.row_group_size,
+        "json_columns": args.json_columns,
+        "write_profile": args.write_profile,
+        "write_profiles": _sha256_file(WRITE_PROFILES_PATH),
+    }
+    previous_counts = previous.get("tables", {})
+    previous_fingerprints = previous.get("table_fingerprints", {})
+    domain_tables = {
+        "shopping": _shopping_table_names(args.catalog_layout),
+        "travel": _travel_table_names(args.include_distance_matrix, args.distance_matrix_layout),
+    }
+    domain_archives = {
+        "shopping": {level: f"database_level{level}.tar.gz" for level in (1, 2, 3)},
+        "travel": {lang: f"database_{lang}.zip" for lang in ("en", "zh")},
+    }
+    extract_fns = {"shopping": _extract_shopping_level, "travel": _extract_travel_language}
+
+    # Stage DAG (one chain per domain, joined only by the manifest):
+    #   download[archive] -> plan[domain] -> extract[archive] (--extract) ~> build_<domain> -> partitioned[t], ipc[t]
+    # build_<domain> waits for each extract[archive] only when it reaches that level/language.
+    scheduler = StageScheduler(args.out_dir / STAGE_STATE_FILE, cpu_workers=workers, resume=not args.force)
+
+    def plan(domain: str, results: Dict) -> Dict:
+        labels = {label: path for table in domain_tables[domain] for label, path in deps[table].items()}
+        with profiler.stage(f"fingerprint[{domain}]", inputs=len(labels)):
+            inputs = _fingerprint_inputs(labels, previous.get("inputs", {}))
+        fingerprints = {table: _table_fingerprint(deps[table], inputs, options) for table in domain_tables[domain]}
+        stale = [
+            table
+            for table, fingerprint in fingerprints.items()
+            if args.force
+            or previous_fingerprints.get(table) != fingerprint
+            or table not in previous_counts
+            or not (args.out_dir / f"{table}.parquet").exists()
+        ]
+        return {"inputs": inputs, "fingerprints": fingerprints, "stale": stale}
+
+    def needs_archive(domain: str, archive: str, results: Dict) -> bool:
+        return any(archive in deps[table] for table in results[f"plan[{domain}]"]["stale"])
 
-    _extract_tar(args.raw_cache_dir / "database_level1.tar.gz", shopping_extracted / "level1")
-    _extract_tar(args.raw_cache_dir / "database_level2.tar.gz", shopping_extracted / "level2")
-    _extract_tar(args.raw_cache_dir / "database_level3.tar.gz", shopping_extracted / "level3")
+    def extract(domain: str, part, results: Dict) -> Optional[str]:
+        archive = domain_archives[domain][part]
+        if not needs_archive(domain, archive, results):
+            return None
+        with profiler.stage(f"extract[{archive}]"):
+            return str(extract_fns[domain](args.raw_cache_dir, args.work_dir, part))
 
-    _extract_zip(args.raw_cache_dir / "database_en.zip", travel_en_extracted)
-    _extract_zip(args.raw_cache_dir / "database_zh.zip", travel_zh_extracted)
+    def extract_key(domain: str, part, results: Dict) -> Optional[str]:
+        archive = domain_archives[domain][part]
+        if not needs_archive(domain, archive, results):
+            return None
+        return _stage_key(
+            {"archive": results[f"plan[{domain}]"]["inputs"][archive]["sha256"], "work_dir": str(args.work_dir)}
+        )
+
+    def extract_outputs(domain: str, part, result: Optional[str]) -> List[Path]:
+        if domain == "shopping":
+            return [args.work_dir / "shopping" / f"level{part}"]
+        return [args.work_dir / f"travel_{part}", args.work_dir / "travel" / f"database_{part}"]
+
+    def build(domain: str, results: Dict) -> Dict[str, int]:
+        stale = results[f"plan[{domain}]"]["stale"]
+        if not stale:
+            return {}
+        input_root_for = None
+        if args.extract:
+            input_root_for = lambda part: Path(scheduler.result(f"extract[{domain_archives[domain][part]}]"))
+        common = dict(
+            row_group_size=args.row_group_size,
+            workers=workers,
+            tables=stale,
+            profiler=profiler,
+            json_columns=args.json_columns,
+            input_root_for=input_root_for,
+            pool=scheduler.process_pool,
+            write_profile=write_profile,
+        )
+        with profiler.stage(f"build_{domain}") as stage:
+            if domain == "shopping":
+                built = build_shopping_tables(
+                    shopping_root, args.raw_cache_dir, args.out_dir, catalog_layout=args.catalog_layout, **common
+                )
+            else:
+                built = build_travel_tables(
+                    travel_root,
+                    args.raw_cache_dir,
+                    args.out_dir,
+                    args.include_distance_matrix,
+                    distance_matrix_layout=args.distance_matrix_layout,
+                    **common,
+                )
+            stage["rows"] = sum(built.values())
+        return built
+
+    def build_key(domain: str, results: Dict) -> Optional[str]:
+        plan_result = results[f"plan[{domain}]"]
+        if not plan_result["stale"]:
+            return None
+        return _stage_key({table: plan_result["fingerprints"][table] for table in plan_result["stale"]})
+
+    def table_rows(domain: str, table: str, results: Dict) -> int:
+        return results[f"build_{domain}"].get(table, previous_counts.get(table, 0))
+
+    for domain in ("shopping", "travel"):
+        download_stages = []
+        if not args.skip_download:
+            for archive in domain_archives[domain].values():
+                download_stages.append(f"download[{archive}]")
+                scheduler.add(download_stages[-1], partial(_download_raw_file, archive, args.raw_cache_dir, profiler))
+        scheduler.add(f"plan[{domain}]", partial(plan, domain), deps=download_stages)
+        if args.extract:
+            for part, archive in domain_archives[domain].items():
+                scheduler.add(
+                    f"extract[{archive}]",
+                    partial(extract, domain, part),
+                    deps=[f"plan[{domain}]"],
+                    key=partial(extract_key, domain, part),
+                    outputs=partial(extract_outputs, domain, part),
+                )
+        scheduler.add(
+            f"build_{domain}",
+            partial(build, domain),
+            deps=[f"plan[{domain}]"],
+            key=partial(build_key, domain),
+            outputs=lambda built: [args.out_dir / f"{table}.parquet" for table in built],
+        )
+
+    partition_layouts: Dict[str, Tuple[Optional[str], List[str]]] = {}
+    if args.partitioned_dir is not None:
+        contracts = _read_json(TABLE_CONTRACTS_PATH)
+        prev_partitioned = previous.get("partitioned", {})
+        layout_changed = (
+            prev_partitioned.get("row_group_size") != args.partitioned_row_group_size
+            or prev_partitioned.get("root") != str(args.partitioned_dir)
+            or prev_partitioned.get("write_profile", DEFAULT_WRITE_PROFILE) != args.write_profile
+        )
+
+        def write_partitioned(domain: str, table: str, results: Dict) -> Dict:
+            partition_by, sort_by = partition_layouts[table]
+            dest = args.partitioned_dir / table
+            if table in results[f"plan[{domain}]"]["stale"] or layout_changed or not dest.exists():
+                with profiler.stage(f"partitioned[{table}]", rows=table_rows(domain, table, results)):
+                    scheduler.cpu(
+                        write_partitioned_table,
+                        args.out_dir / f"{table}.parquet",
+                        dest,
+                        partition_by,
+                        sort_by,
+                        args.partitioned_row_group_size,
+                        write_profile,
+                    )
+            return {"partition_by": partition_by, "sort_by": sort_by}
+
+        def partitioned_key(domain: str, table: str, results: Dict) -> str:
+            return _stage_key(
+                {
+                    "table": results[f"plan[{domain}]"]["fingerprints"][table],
+                    "root": str(args.partitioned_dir),
+                    "row_group_size": args.partitioned_row_group_size,
+                    "write_profile": args.write_profile,
+                }
+            )
+
+        for domain, tables in domain_tables.items():
+            for table in tables:
+                partition_layouts[table] = _partition_layout(table, contracts)
+                scheduler.add(
+                    f"partitioned[{table}]",
+                    partial(write_partitioned, domain, table),
+                    deps=[f"plan[{domain}]", f"build_{domain}"],
+                    key=partial(partitioned_key, domain, table),
+                    outputs=lambda _, table=table: [args.partitioned_dir / table],
+                )
+
+    ipc_dir = args.ipc_dir or args.out_dir / DEFAULT_IPC_DIR_NAME
+    if args.ipc_companions != "none":
+        prev_ipc = previous.get("ipc", {}).get("tables", {})
+
+        def write_ipc(domain: str, table: str, results: Dict) -> Dict:
+            dest = ipc_dir / f"{table}{IPC_SUFFIX}"
+            relpath = os.path.relpath(dest, args.out_dir)
+            entry = prev_ipc.get(table, {})
+            if (
+                table in results[f"plan[{domain}]"]["stale"]
+                or entry.get("path") != relpath
+                or entry.get("compression") != args.ipc_companions
+                or not dest.exists()
+            ):
+                with profiler.stage(f"ipc[{table}]", rows=table_rows(domain, table, results)):
+                    written = scheduler.cpu(
+                        write_ipc_companion, args.out_dir / f"{table}.parquet", dest, args.ipc_companions
+                    )
+                entry = {"path": relpath, **written}
+            return entry
+
+        def ipc_key(domain: str, table: str, results: Dict) -> str:
+            return _stage_key(
+                {
+                    "table": results[f"plan[{domain}]"]["fingerprints"][table],
+                    "dir": str(ipc_dir),
+                    "compression": args.ipc_companions,
+                }
+            )
+
+        for domain, tables in domain_tables.items():
+            for table in tables:
+                scheduler.add(
+                    f"ipc[{table}]",
+                    partial(write_ipc, domain, table),
+                    deps=[f"plan[{domain}]", f"build_{domain}"],
+                    key=partial(ipc_key, domain, table),
+                    outputs=lambda _, table=table: [ipc_dir / f"{table}{IPC_SUFFIX}"],
+                )
+
+    results = scheduler.run()
+    removed = _remove_stale_tables(
+        args.out_dir, [t for tables in domain_tables.values() for t in tables], args.partitioned_dir, ipc_dir
+    )
 
+    inputs: Dict[str, Dict] = {}
+    fingerprints: Dict[str, str] = {}
+    stale = set()
     counts: Dict[str, int] = {}
-    counts.update(build_shopping_tables(shopping_root, shopping_extracted, args.out_dir))
+    for domain in ("shopping", "travel"):
+        plan_result = results[f"plan[{domain}]"]
+        inputs.update(plan_result["inputs"])
+        fingerprints.update(plan_result["fingerprints"])
+        stale.update(plan_result["stale"])
+        counts.update(results[f"build_{domain}"])
+    inputs = dict(sorted(inputs.items()))
+    counts = {table: counts[table] if table in stale else previous_counts[table] for table in fingerprints}
 
-    travel_extracted = args.work_dir / "travel"
-    _ensure_dir(travel_extracted)
-    en_target = travel_extracted / "database_en"
-    zh_target = travel_extracted / "database_zh"
-    if not en_target.exists():
-        en_target.symlink_to((travel_en_extracted / "database_en").resolve())
-    if not zh_target.exists():
-        zh_target.symlink_to((travel_zh_extracted / "database_zh").resolve())
+    partitioned: Optional[Dict] = None
+    if args.partitioned_dir is not None:
+        partitioned = {
+            "root": str(args.partitioned_dir),
+            "row_group_size": args.partitioned_row_group_size,
+            "write_profile": args.write_profile,
+            "tables": {table: results[f"partitioned[{table}]"] for table in fingerprints},
+        }
 
-    counts.update(build_travel_tables(travel_root, travel_extracted, args.out_dir, args.include_distance_matrix))
+    ipc: Optional[Dict] = None
+    if args.ipc_companions != "none":
+        ipc = {
+            "root": str(ipc_dir),
+            "compression": args.ipc_companions,
+            "tables": {table: results[f"ipc[{table}]"] for table in fingerprints},
+        }
 
-    build_manifest(args.out_dir / "manifest.json", counts, args.include_distance_matrix, args.qwen_agent_root)
-    print(json.dumps({"status": "ok", "out_dir": str(args.out_dir), "tables": counts}, indent=2, ensure_ascii=False))
+    build_manifest(
+        manifest_path,
+        counts,
+        args.include_distance_matrix,
+        args.qwen_agent_root,
+        inputs,
+        fingerprints,
+        args.distance_matrix_layout,
+        partitioned,
+        profiler.summary() if profiler.enabled else None,
+        args.catalog_layout,
+        args.json_columns,
+        ipc,
+        args.write_profile,
+    )
+    if profiler.enabled:
+        profiler.write_chrome_trace(args.profile_trace or args.out_dir / "build_trace.json")
+    output = {
+        "status": "ok",
+        "out_dir": str(args.out_dir),
+        "write_profile": args.write_profile,
+        "tables": counts,
+        "rebuilt": sorted(stale),
+        "skipped": sorted(set(fingerprints) - stale),
+        "resumed_stages": sorted(scheduler.resumed),
+        "removed": removed,
+    }
+    if args.write_profile_report:
+        report = write_profile_report(args.out_dir, tables=list(fingerprints))
+        report_path = args.out_dir / WRITE_PROFILE_REPORT_FILE
+        report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        output["write_profile_report"] = {"path": str(report_path), "profiles": report["profiles"]}
+    print(json.dumps(output, indent=2, ensure_ascii=False))
 
 
 if __name__ == "__main__":
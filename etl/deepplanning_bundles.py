@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""Stream the DeepPlanning parquet artifacts one case (or travel sample) at a time.
+
+``iter_bundles`` opens every table of a domain listed in
+``schemas/table_contracts.json``, reads each one row group at a time and
+merge-joins them on the domain primary keys, yielding one bundle (table name ->
+``pa.Table`` of that case's rows) per key in key order. Memory stays bounded by
+about one row group per table; only the shared ``shopping_products`` table of
+the dedup catalog layout is loaded whole, to rebuild ``shopping_catalog``.
+
+The builder writes every table in the same key order (level or language, then
+numeric case/sample id), which is what the merge relies on; a table that is
+not in that order raises ``ValueError``. ``to_iterable_dataset`` wraps the
+stream as a Hugging Face ``datasets.IterableDataset``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from deepplanning_catalog import (
+    FLAT_TABLE,
+    MEMBERSHIP_TABLE,
+    PRODUCT_HASH_COLUMN,
+    PRODUCTS_TABLE,
+    manifest_catalog_layout,
+    off_layout_tables,
+    reconstruct_catalog,
+)
+from deepplanning_profile import peak_rss_mb
+
+TABLE_CONTRACTS_PATH = Path(__file__).resolve().parent.parent / "schemas" / "table_contracts.json"
+
+Key = Tuple[str, object, str]
+
+
+def _order(key: Key) -> Tuple:
+    """Sort position of a key: level/language, then numeric ids before any non-numeric id."""
+    _, part, item_id = key
+    return (part, (0, int(item_id), "") if item_id.isdigit() else (1, 0, item_id))
+
+
+class _TableCursor:
+    """Key runs of one table, read one row group at a time."""
+
+    def __init__(self, path: Path, key_columns: List[str], parts: Optional[set]) -> None:
+        self.name = path.stem
+        self.key_columns = key_columns
+        self.parts = parts
+        self._file = pq.ParquetFile(path, memory_map=True)
+        self._row_groups = iter(self._selected_row_groups())
+        self._runs: List[Tuple[Key, pa.Table]] = []
+        self._last: Optional[Key] = None
+        self.head: Optional[Key] = None
+        self._advance()
+
+    def _selected_row_groups(self) -> List[int]:
+        """Row groups that may hold one of ``parts``, judged from the part column statistics."""
+        metadata = self._file.metadata
+        if self.parts is None:
+            return list(range(metadata.num_row_groups))
+        part_column = self.key_columns[1]
+        idx = next(
+            (i for i in range(metadata.num_columns) if metadata.schema.column(i).path == part_column), None
+        )
+        selected = []
+        for rg in range(metadata.num_row_groups):
+            stats = metadata.row_group(rg).column(idx).statistics if idx is not None else None
+            if stats is not None and stats.has_min_max and not any(stats.min <= p <= stats.max for p in self.parts):
+                continue
+            selected.append(rg)
+        return selected
+
+    def _load_runs(self) -> bool:
+        for rg in self._row_groups:
+            table = self._file.read_row_group(rg)
+            n = table.num_rows
+            if n == 0:
+                continue
+            columns = [table.column(name) for name in self.key_columns]
+            starts = [0]
+            if n > 1:
+                changed = None
+                for column in columns:
+                    diff = pc.fill_null(pc.not_equal(column.slice(1), column.slice(0, n - 1)), True)
+                    changed = diff if changed is None else pc.or_(changed, diff)
+                starts.extend(i + 1 for i in pc.indices_nonzero(changed).to_pylist())
+            heads = [column.take(pa.array(starts)).to_pylist() for column in columns]
+            for pos, start in enumerate(starts):
+                stop = starts[pos + 1] if pos + 1 < len(starts) else n
+                key = (heads[0][pos], heads[1][pos], str(heads[2][pos]))
+                if self.parts is None or key[1] in self.parts:
+                    self._runs.append((key, table.slice(start, stop - start)))
+            if self._runs:
+                self._runs.reverse()
+                return True
+        return False
+
+    def _advance(self) -> None:
+        if not self._runs and not self._load_runs():
+            self.head = None
+            return
+        self.head = self._runs[-1][0]
+        if self._last is not None and _order(self.head) < _order(self._last):
+            raise ValueError(f"{self.name} is not sorted by key: {self.head} after {self._last}")
+
+    def take(self, key: Key) -> List[pa.Table]:
+        """Pop every run of ``key`` at the head of the table (a key may span row groups)."""
+        pieces = []
+        while self.head == key:
+            pieces.append(self._runs.pop()[1])
+            self._last = key
+            self._advance()
+        return pieces
+
+    def empty(self) -> pa.Table:
+        return self._file.schema_arrow.empty_table()
+
+
+def _domain_tables(parquet_dir: Path, domain: str, contracts_path: Path) -> Tuple[List[str], List[str]]:
+    contracts = json.loads(Path(contracts_path).read_text(encoding="utf-8"))
+    if domain not in contracts:
+        raise KeyError(f"Unknown domain {domain!r}; expected one of {sorted(contracts)}")
+    spec = contracts[domain]
+    skipped = set(off_layout_tables(manifest_catalog_layout(parquet_dir)))
+    names = [
+        t[: -len(".parquet")]
+        for t in spec["tables"]
+        if t[: -len(".parquet")] not in skipped and (parquet_dir / t).exists()
+    ]
+    return names, list(spec["primary_keys"])
+
+
+def iter_bundles(
+    parquet_dir: Path,
+    domain: str,
+    tables: Optional[Iterable[str]] = None,
+    parts: Optional[Iterable] = None,
+    contracts_path: Path = TABLE_CONTRACTS_PATH,
+) -> Iterator[Tuple[Key, Dict[str, pa.Table]]]:
+    """Yield ``((domain, level|language, case_id|sample_id), {table: rows})`` for every key, in key order.
+
+    ``tables`` restricts the bundle (``shopping_catalog`` also works in the dedup
+    layout); ``parts`` keeps only some levels/languages and skips row groups
+    that cannot contain them. Every bundle has every selected table, possibly empty.
+    """
+    parquet_dir = Path(parquet_dir)
+    names, key_columns = _domain_tables(parquet_dir, domain, contracts_path)
+    dedup = domain == "shopping" and manifest_catalog_layout(parquet_dir) == "dedup"
+    wanted = set(names if tables is None else tables)
+    if tables is None and dedup:
+        wanted.add(FLAT_TABLE)
+    rebuild_catalog = dedup and FLAT_TABLE in wanted
+    keep_membership = tables is not None and MEMBERSHIP_TABLE in wanted
+    if rebuild_catalog:
+        wanted.add(MEMBERSHIP_TABLE)
+    part_filter = None if parts is None else set(parts)
+
+    cursors: Dict[str, _TableCursor] = {}
+    for name in names:
+        if name not in wanted:
+            continue
+        path = parquet_dir / f"{name}.parquet"
+        if all(column in pq.read_schema(path).names for column in key_columns):
+            cursors[name] = _TableCursor(path, key_columns, part_filter)
+
+    products: Optional[Tuple[pa.Table, Dict[str, int]]] = None
+    if rebuild_catalog:
+        table = pq.read_table(parquet_dir / f"{PRODUCTS_TABLE}.parquet", memory_map=True)
+        products = (table, {digest: idx for idx, digest in enumerate(table.column(PRODUCT_HASH_COLUMN).to_pylist())})
+
+    while True:
+        heads = [cursor.head for cursor in cursors.values() if cursor.head is not None]
+        if not heads:
+            return
+        key = min(heads, key=_order)
+        bundle: Dict[str, pa.Table] = {}
+        for name, cursor in cursors.items():
+            pieces = cursor.take(key)
+            if not pieces:
+                bundle[name] = cursor.empty()
+            else:
+                bundle[name] = pieces[0] if len(pieces) == 1 else pa.concat_tables(pieces)
+        if products is not None:
+            membership = bundle[MEMBERSHIP_TABLE] if keep_membership else bundle.pop(MEMBERSHIP_TABLE)
+            table, position = products
+            picked = sorted({position[h] for h in membership.column(PRODUCT_HASH_COLUMN).to_pylist() if h in position})
+            bundle[FLAT_TABLE] = reconstruct_catalog(membership, table.take(pa.array(picked, pa.int64())))
+        yield key, bundle
+
+
+def _bundle_example(key: Key, bundle: Dict[str, pa.Table], key_columns: List[str]) -> Dict:
+    example: Dict = dict(zip(key_columns, key))
+    for name, table in bundle.items():
+        example[name] = table.to_pylist()
+    return example
+
+
+def _generate_examples(
+    parquet_dir: str, domain: str, tables: Optional[List[str]], parts: List, contracts_path: str
+) -> Iterator[Dict]:
+    _, key_columns = _domain_tables(Path(parquet_dir), domain, Path(contracts_path))
+    for key, bundle in iter_bundles(Path(parquet_dir), domain, tables, parts, Path(contracts_path)):
+        yield _bundle_example(key, bundle, key_columns)
+
+
+def to_iterable_dataset(
+    parquet_dir: Path,
+    domain: str,
+    tables: Optional[Iterable[str]] = None,
+    parts: Optional[Iterable] = None,
+    contracts_path: Path = TABLE_CONTRACTS_PATH,
+):
+    """``datasets.IterableDataset`` of bundle examples: key columns plus one list of row dicts per table.
+
+    ``parts`` (default: every level/language) is the shard list, so
+    ``DataLoader(num_workers=...)`` streams different levels/languages in
+    different workers.
+    """
+    try:
+        from datasets import IterableDataset
+    except ImportError as exc:
+        raise ImportError("to_iterable_dataset needs the `datasets` package (pip install datasets)") from exc
+
+    parquet_dir = Path(parquet_dir)
+    if parts is None:
+        contracts = json.loads(Path(contracts_path).read_text(encoding="utf-8"))
+        part_column = contracts[domain]["primary_keys"][1]
+        parts = contracts[domain]["key_values"][part_column]
+    return IterableDataset.from_generator(
+        _generate_examples,
+        gen_kwargs={
+            "parquet_dir": str(parquet_dir),
+            "domain": domain,
+            "tables": None if tables is None else list(tables),
+            "parts": list(parts),
+            "contracts_path": str(contracts_path),
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stream DeepPlanning bundles one case at a time")
+    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
+    parser.add_argument("--domain", choices=["shopping", "travel"], required=True)
+    parser.add_argument("--tables", nargs="+", default=None)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many bundles")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    bundles = 0
+    rows: Dict[str, int] = {}
+    first: Optional[Key] = None
+    last: Optional[Key] = None
+    for key, bundle in iter_bundles(args.parquet_dir, args.domain, args.tables):
+        first = first or key
+        last = key
+        bundles += 1
+        for name, table in bundle.items():
+            rows[name] = rows.get(name, 0) + table.num_rows
+        if args.limit is not None and bundles >= args.limit:
+            break
+    print(
+        json.dumps(
+            {
+                "domain": args.domain,
+                "bundles": bundles,
+                "first": first,
+                "last": last,
+                "rows": rows,
+                "seconds": round(time.perf_counter() - started, 4),
+                "peak_rss_mb": peak_rss_mb(),
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Content-addressed layout for the shopping catalog and its lossless reconstruction.
+
+The flat ``shopping_catalog`` table repeats every product (and its full
+``product_json``) once per case. The dedup layout splits it in two:
+
+- ``shopping_products``: one row per distinct product, keyed by ``product_hash``.
+  Case-specific fields (``CATALOG_CASE_FIELDS``) are nulled in place in its
+  ``product_json`` so identical products hash the same in every case.
+- ``shopping_catalog_membership``: one row per (case, ``row_id``) with the
+  ``product_hash`` and the case-specific values as columns. Integer or null
+  values are restored from those columns; any other value (floats, huge ints,
+  strings, nested) keeps its exact JSON in ``case_fields_json``, null otherwise.
+
+``reconstruct_catalog`` joins the two back into the flat schema; its rows and
+``product_json`` strings match what the flat layout writes. Readers pick the
+layout from ``catalog_layout`` in ``manifest.json`` (``manifest_catalog_layout``),
+never from which files happen to exist in the directory. With
+``--json-columns nested``/``both`` the products carry the template as a native
+``product`` struct too, and the rebuilt struct takes the case fields from the
+membership columns.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from deepplanning_nested import expand_json_column
+
+FLAT_TABLE = "shopping_catalog"
+PRODUCTS_TABLE = "shopping_products"
+MEMBERSHIP_TABLE = "shopping_catalog_membership"
+PRODUCT_HASH_COLUMN = "product_hash"
+CASE_FIELDS_COLUMN = "case_fields_json"
+CATALOG_CASE_FIELDS = ("stock_quantity", "sales_volume")
+CATALOG_LAYOUTS = ("flat", "dedup")
+# Largest integer a float64 column holds exactly (the column widens to float64 when sources mix ints and floats).
+EXACT_INT_LIMIT = 2**53
+
+# Column order of the flat shopping_catalog table and where each column lives in the dedup layout.
+FLAT_COLUMNS: List[Tuple[str, str]] = [
+    ("domain", MEMBERSHIP_TABLE),
+    ("level", MEMBERSHIP_TABLE),
+    ("case_id", MEMBERSHIP_TABLE),
+    ("row_id", MEMBERSHIP_TABLE),
+    ("product_id", PRODUCTS_TABLE),
+    ("name", PRODUCTS_TABLE),
+    ("brand", PRODUCTS_TABLE),
+    ("color", PRODUCTS_TABLE),
+    ("size", PRODUCTS_TABLE),
+    ("price", PRODUCTS_TABLE),
+    ("stock_quantity", MEMBERSHIP_TABLE),
+    ("rating", PRODUCTS_TABLE),
+    ("sales_volume", MEMBERSHIP_TABLE),
+    ("shipping_info_json", PRODUCTS_TABLE),
+    ("product_json", PRODUCTS_TABLE),
+]
+
+
+def layout_tables(catalog_layout: str) -> List[str]:
+    """Catalog tables written by one ``--catalog-layout``."""
+    if catalog_layout not in CATALOG_LAYOUTS:
+        raise ValueError(f"Unknown catalog layout: {catalog_layout}")
+    return [FLAT_TABLE] if catalog_layout == "flat" else [PRODUCTS_TABLE, MEMBERSHIP_TABLE]
+
+
+def off_layout_tables(catalog_layout: str) -> List[str]:
+    """Catalog tables of the other layouts, which a build in ``catalog_layout`` must not leave behind."""
+    current = set(layout_tables(catalog_layout))
+    return [name for layout in CATALOG_LAYOUTS for name in layout_tables(layout) if name not in current]
+
+
+def manifest_catalog_layout(parquet_dir: Path) -> str:
+    """``catalog_layout`` recorded in ``manifest.json``; builds that predate it are flat."""
+    path = Path(parquet_dir) / "manifest.json"
+    manifest = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    return manifest.get("catalog_layout", "flat")
+
+
+def flat_columns(json_columns: str = "string") -> List[Tuple[str, str]]:
+    """``FLAT_COLUMNS`` with the JSON columns expanded for a ``--json-columns`` mode."""
+    return [(out, table) for name, table in FLAT_COLUMNS for out in expand_json_column(name, json_columns)]
+
+
+def _json_columns_of(products: pa.Table) -> str:
+    names = products.column_names
+    if "product" in names:
+        return "both" if "product_json" in names else "nested"
+    return "string"
+
+
+def product_template(product: Dict) -> Dict:
+    """Copy of ``product`` with the case-specific fields it has set to null, key order kept."""
+    template = dict(product)
+    for name in CATALOG_CASE_FIELDS:
+        if name in template:
+            template[name] = None
+    return template
+
+
+def product_hash(template_json: str) -> str:
+    return hashlib.sha256(template_json.encode("utf-8")).hexdigest()[:32]
+
+
+def split_catalog_row(row: Dict, product: Dict, json_columns: str = "string") -> Tuple[Dict, Dict]:
+    """Split one flat catalog row built from ``product`` into (products row, membership row)."""
+    template = product_template(product)
+    template_json = json.dumps(template, ensure_ascii=False)
+    digest = product_hash(template_json)
+    product_row = {PRODUCT_HASH_COLUMN: digest}
+    membership_row = {}
+    for name, table in flat_columns(json_columns):
+        if name == "product_json":
+            product_row[name] = template_json
+        elif name == "product":
+            product_row[name] = template
+        elif table == PRODUCTS_TABLE:
+            product_row[name] = row[name]
+        else:
+            membership_row[name] = row[name]
+    membership_row[PRODUCT_HASH_COLUMN] = digest
+    case_values = {name: product[name] for name in CATALOG_CASE_FIELDS if name in product}
+    exact = all(
+        value is None or (type(value) is int and abs(value) <= EXACT_INT_LIMIT) for value in case_values.values()
+    )
+    membership_row[CASE_FIELDS_COLUMN] = None if exact else json.dumps(case_values, ensure_ascii=False)
+    return product_row, membership_row
+
+
+def _product_json(membership: pa.Table, picked: pa.Table) -> List[str]:
+    case_columns = {name: membership.column(name).to_pylist() for name in CATALOG_CASE_FIELDS}
+    product_json = []
+    for idx, (template_json, case_json) in enumerate(
+        zip(picked.column("product_json").to_pylist(), membership.column(CASE_FIELDS_COLUMN).to_pylist())
+    ):
+        product = json.loads(template_json)
+        if case_json is not None:
+            product.update(json.loads(case_json))
+        else:
+            # Only ints/nulls take this path, so a float column value here was an int in the source.
+            for name in CATALOG_CASE_FIELDS:
+                if name in product:
+                    value = case_columns[name][idx]
+                    product[name] = None if value is None else int(value)
+        product_json.append(json.dumps(product, ensure_ascii=False))
+    return product_json
+
+
+def _product_struct(membership: pa.Table, picked: pa.Table) -> pa.StructArray:
+    """Template ``product`` structs with their (nulled) case fields taken from the membership columns."""
+    templates = picked.column("product").combine_chunks()
+    if not pa.types.is_struct(templates.type):
+        return templates
+    children = []
+    fields = []
+    for field, child in zip(templates.type, templates.flatten()):
+        if field.name in CATALOG_CASE_FIELDS:
+            child = membership.column(field.name).combine_chunks()
+            field = field.with_type(child.type)
+        children.append(child)
+        fields.append(field)
+    return pa.StructArray.from_arrays(children, fields=fields, mask=templates.is_null())
+
+
+def reconstruct_catalog(membership: pa.Table, products: pa.Table) -> pa.Table:
+    """Rebuild flat ``shopping_catalog`` rows for ``membership`` from the deduplicated products."""
+    position = {digest: idx for idx, digest in enumerate(products.column(PRODUCT_HASH_COLUMN).to_pylist())}
+    try:
+        take = [position[digest] for digest in membership.column(PRODUCT_HASH_COLUMN).to_pylist()]
+    except KeyError as exc:
+        raise ValueError(f"{MEMBERSHIP_TABLE} references unknown {PRODUCT_HASH_COLUMN} {exc.args[0]}") from None
+    picked = products.take(pa.array(take, pa.int64()))
+
+    json_columns = _json_columns_of(products)
+    rebuilt = {}
+    if json_columns != "nested":
+        rebuilt["product_json"] = pa.chunked_array([pa.array(_product_json(membership, picked), pa.string())])
+    if json_columns != "string":
+        rebuilt["product"] = pa.chunked_array([_product_struct(membership, picked)])
+
+    columns = []
+    fields = []
+    for name, table in flat_columns(json_columns):
+        if name in rebuilt:
+            column = rebuilt[name]
+        else:
+            column = (membership if table == MEMBERSHIP_TABLE else picked).column(name)
+        columns.append(column)
+        fields.append(pa.field(name, column.type))
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+
+def read_catalog(parquet_dir: Path, filters: Optional[List] = None) -> pa.Table:
+    """Flat catalog view over a parquet directory in either layout; ``filters`` apply to case keys."""
+    parquet_dir = Path(parquet_dir)
+    if manifest_catalog_layout(parquet_dir) == "flat":
+        return pq.read_table(parquet_dir / f"{FLAT_TABLE}.parquet", filters=filters)
+    membership = pq.read_table(parquet_dir / f"{MEMBERSHIP_TABLE}.parquet", filters=filters)
+    hashes = pc.unique(membership.column(PRODUCT_HASH_COLUMN))
+    products = pq.read_table(
+        parquet_dir / f"{PRODUCTS_TABLE}.parquet", filters=pc.field(PRODUCT_HASH_COLUMN).isin(hashes)
+    )
+    return reconstruct_catalog(membership, products)
@@ -0,0 +1,135 @@
+"""Dense per-sample encoding of the travel distance matrices and O(1) lookups over it.
+
+Each ``distance_matrix.csv`` holds one row per (origin, destination) pair. The
+dense layout stores one row per sample instead: the ordered location list plus
+one row-major ``n * n`` list per measure column (distance, duration, ...).
+The first two CSV columns name the origin and destination; every other column
+is a measure. Numeric columns (the ones typed in ``travel_db_column_types.json``)
+become float64 lists; any other column is kept as a string list, as it is in
+the long table. A matrix holds one value per pair, so duplicate
+(origin, destination) rows are an error; the long layout keeps them.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+KEY_COLUMNS = ("domain", "language", "sample_id")
+LOCATIONS_COLUMN = "locations"
+SIZE_COLUMN = "n_locations"
+
+
+def measure_types(schema: pa.Schema) -> Dict[str, pa.DataType]:
+    """Value type of every measure column: float64 for numeric columns, string otherwise."""
+    return {
+        field.name: pa.float64() if pa.types.is_floating(field.type) or pa.types.is_integer(field.type) else pa.string()
+        for field in list(schema)[2:]
+    }
+
+
+def encode_distance_matrix(table: pa.Table) -> Dict[str, object]:
+    """Turn one sample's long distance table into ``{"locations", "n_locations", <measure>: flat list}``."""
+    if table.num_columns < 3:
+        raise ValueError(f"distance matrix needs origin, destination and measure columns, got {table.column_names}")
+    origin_col, destination_col = table.column_names[:2]
+    origins = table.column(origin_col).cast(pa.string())
+    destinations = table.column(destination_col).cast(pa.string())
+
+    locations = pc.unique(pa.chunked_array(origins.chunks + destinations.chunks, type=pa.string()))
+    n = len(locations)
+    flat_index = pc.add(
+        pc.multiply(pc.index_in(origins, value_set=locations).cast(pa.int64()), n),
+        pc.index_in(destinations, value_set=locations).cast(pa.int64()),
+    ).to_pylist()
+    if None in flat_index:
+        raise ValueError(f"distance matrix has a row with a null {origin_col!r} or {destination_col!r}")
+    if len(set(flat_index)) != len(flat_index):
+        seen: set = set()
+        for row, pos in enumerate(flat_index):
+            if pos in seen:
+                pair = (origins[row].as_py(), destinations[row].as_py())
+                raise ValueError(
+                    f"duplicate (origin, destination) pair {pair!r}; the dense layout holds one value per pair, "
+                    "use --distance-matrix-layout long to keep every row"
+                )
+            seen.add(pos)
+
+    encoded: Dict[str, object] = {LOCATIONS_COLUMN: locations.to_pylist(), SIZE_COLUMN: n}
+    for name, value_type in measure_types(table.schema).items():
+        values = table.column(name).cast(value_type).to_pylist()
+        dense: List[Optional[object]] = [None] * (n * n)
+        for pos, value in zip(flat_index, values):
+            dense[pos] = value
+        encoded[name] = dense
+    return encoded
+
+
+def dense_schema(measures: Dict[str, pa.DataType]) -> pa.Schema:
+    """Schema of the dense table for ``measure_types`` of the long table."""
+    fields = [pa.field(name, pa.string()) for name in KEY_COLUMNS]
+    fields.append(pa.field(LOCATIONS_COLUMN, pa.list_(pa.string())))
+    fields.append(pa.field(SIZE_COLUMN, pa.int64()))
+    fields.extend(pa.field(name, pa.list_(value_type)) for name, value_type in measures.items())
+    return pa.schema(fields)
+
+
+class DistanceMatrix:
+    """Distance/duration lookups for one travel sample in constant time."""
+
+    def __init__(self, locations: List[str], measures: Dict[str, List[Optional[float]]]) -> None:
+        self.locations = locations
+        self.index = {name: idx for idx, name in enumerate(locations)}
+        self.size = len(locations)
+        self._measures = measures
+
+    @property
+    def measures(self) -> List[str]:
+        return list(self._measures)
+
+    @classmethod
+    def from_row(cls, row: Dict) -> "DistanceMatrix":
+        measures = {
+            name: value
+            for name, value in row.items()
+            if name not in KEY_COLUMNS and name not in (LOCATIONS_COLUMN, SIZE_COLUMN)
+        }
+        return cls(row[LOCATIONS_COLUMN], measures)
+
+    def _position(self, origin: str, destination: str) -> int:
+        try:
+            return self.index[origin] * self.size + self.index[destination]
+        except KeyError as exc:
+            raise KeyError(f"Unknown location {exc.args[0]!r}") from None
+
+    def lookup(self, origin: str, destination: str, measure: str = "distance") -> Optional[float]:
+        return self._measures[measure][self._position(origin, destination)]
+
+    def get(self, origin: str, destination: str) -> Dict[str, Optional[float]]:
+        pos = self._position(origin, destination)
+        return {name: values[pos] for name, values in self._measures.items()}
+
+
+def iter_distance_matrices(path: Path, language: Optional[str] = None) -> Iterator[Tuple[Tuple[str, str], DistanceMatrix]]:
+    """Yield ``((language, sample_id), DistanceMatrix)`` from a ``travel_db_transportation_dense`` file."""
+    pf = pq.ParquetFile(path)
+    for rg in range(pf.metadata.num_row_groups):
+        for row in pf.read_row_group(rg).to_pylist():
+            if language is not None and row["language"] != language:
+                continue
+            yield (row["language"], row["sample_id"]), DistanceMatrix.from_row(row)
+
+
+def load_distance_matrices(path: Path, language: Optional[str] = None) -> Dict[Tuple[str, str], DistanceMatrix]:
+    return dict(iter_distance_matrices(path, language))
+
+
+def read_distance_matrix(path: Path, language: str, sample_id: str) -> DistanceMatrix:
+    table = pq.read_table(path, filters=[("language", "=", language), ("sample_id", "=", str(sample_id))])
+    if table.num_rows != 1:
+        raise KeyError(f"No distance matrix for language={language} sample_id={sample_id} in {path}")
+    return DistanceMatrix.from_row(table.to_pylist()[0])
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Arrow IPC (Feather v2) companions of the parquet tables, for memory-mapped loading.
+
+Parquet tables are zstd-compressed, so every process that opens one decodes it
+into private memory. ``--ipc-companions uncompressed|lz4`` makes the builder
+also write ``<ipc-dir>/<table>.arrow`` next to each table and list them in
+``manifest.json`` under ``ipc``. Each parquet row group becomes one record
+batch, so row-group indexes (``DeepPlanningStore``) apply to both files.
+
+Uncompressed companions are read zero-copy from a memory map: any number of
+processes share one page-cached copy and load in near-constant time. LZ4
+companions are smaller on disk but each batch is decompressed on read.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+IPC_COMPRESSIONS = ("uncompressed", "lz4")
+IPC_SUFFIX = ".arrow"
+DEFAULT_IPC_DIR_NAME = "ipc"
+
+
+def _row_group_batch(pf: pq.ParquetFile, rg: int) -> pa.RecordBatch:
+    """Row group ``rg`` as exactly one record batch, so batch and row-group numbers stay aligned."""
+    batches = pf.read_row_group(rg).combine_chunks().to_batches()
+    if not batches:
+        return pa.RecordBatch.from_pylist([], schema=pf.schema_arrow)
+    if len(batches) > 1:
+        raise ValueError(f"row group {rg} does not fit in one record batch")
+    return batches[0]
+
+
+def write_ipc_companion(parquet_path: Path, out_path: Path, compression: str = "uncompressed") -> Dict:
+    """Rewrite one parquet file as an Arrow IPC file, one record batch per row group."""
+    if compression not in IPC_COMPRESSIONS:
+        raise ValueError(f"Unknown IPC compression: {compression}")
+    pf = pq.ParquetFile(parquet_path, memory_map=True)
+    options = pa.ipc.IpcWriteOptions(compression=None if compression == "uncompressed" else compression)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    rows = 0
+    with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, pf.schema_arrow, options=options) as writer:
+        for rg in range(pf.metadata.num_row_groups):
+            batch = _row_group_batch(pf, rg)
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    tmp_path.replace(out_path)
+    return {
+        "compression": compression,
+        "rows": rows,
+        "record_batches": pf.metadata.num_row_groups,
+        "bytes": out_path.stat().st_size,
+    }
+
+
+def open_ipc_file(path: Path) -> pa.ipc.RecordBatchFileReader:
+    """Open an IPC file over a memory map; batches of uncompressed files reference the mapped pages."""
+    return pa.ipc.open_file(pa.memory_map(str(path), "r"))
+
+
+def read_ipc_table(path: Path) -> pa.Table:
+    return open_ipc_file(path).read_all()
+
+
+def _read_manifest(parquet_dir: Path) -> Dict:
+    path = parquet_dir / "manifest.json"
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+
+def ipc_companions(parquet_dir: Path, manifest: Optional[Dict] = None) -> Dict[str, Path]:
+    """Table name -> companion path for every companion in ``manifest.json`` that matches its table's row count."""
+    parquet_dir = Path(parquet_dir)
+    if manifest is None:
+        manifest = _read_manifest(parquet_dir)
+    counts = manifest.get("tables", {})
+    companions: Dict[str, Path] = {}
+    for name, entry in manifest.get("ipc", {}).get("tables", {}).items():
+        path = parquet_dir / entry["path"]
+        if path.exists() and entry.get("rows") == counts.get(name):
+            companions[name] = path
+    return companions
+
+
+def load_tables(parquet_dir: Path, tables: Optional[Iterable[str]] = None) -> Dict[str, pa.Table]:
+    """Load tables by name, memory-mapping IPC companions and falling back to the parquet files.
+
+    ``tables=None`` loads every table in ``manifest.json``.
+    """
+    parquet_dir = Path(parquet_dir)
+    manifest = _read_manifest(parquet_dir)
+    companions = ipc_companions(parquet_dir, manifest)
+    names = list(manifest.get("tables", {})) if tables is None else list(tables)
+    loaded: Dict[str, pa.Table] = {}
+    for name in names:
+        if name in companions:
+            loaded[name] = read_ipc_table(companions[name])
+        else:
+            loaded[name] = pq.read_table(parquet_dir / f"{name}.parquet", memory_map=True)
+    return loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load DeepPlanning tables, memory-mapping IPC companions")
+    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
+    parser.add_argument("--tables", nargs="+", default=None, help="Table names (default: all in manifest.json)")
+    args = parser.parse_args()
+
+    companions = ipc_companions(args.parquet_dir)
+    report: Dict = {}
+    for name in args.tables or list(_read_manifest(args.parquet_dir).get("tables", {})):
+        started = time.perf_counter()
+        table = load_tables(args.parquet_dir, [name])[name]
+        report[name] = {
+            "source": "ipc" if name in companions else "parquet",
+            "rows": table.num_rows,
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Native nested columns for the JSON-valued fields of the DeepPlanning tables.
+
+By default (``--json-columns string``) the builder stores ``meta_info``,
+``product``, ``user_info``, ``cart``, ``shipping_info``, ``dest`` and
+``hard_constraints`` as ``json.dumps`` strings in ``<name>_json`` columns.
+``nested`` stores the parsed value as an Arrow struct/list column named
+``<name>`` instead, so readers can project and filter nested fields without
+decoding JSON; ``both`` also keeps the ``<name>_json`` string as an audit column.
+
+Nested types are inferred by the table writer from its first row group and
+pinned for the rest of the file. Later rows may omit struct fields (they read
+back as null) but may not add fields or change a field's type. Nested columns
+do not distinguish a missing key from a null value, and an empty object ``{}``
+in a column that never has keys reads back as null; ``both`` keeps the exact
+source JSON.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Callable, Dict, List
+
+import pyarrow as pa
+
+JSON_COLUMN_MODES = ("string", "nested", "both")
+JSON_SUFFIX = "_json"
+# ``*_json`` columns that hold a whole source object; ``case_fields_json`` (dedup layout) stays a string.
+NESTED_JSON_COLUMNS = frozenset(
+    {
+        "meta_info_json",
+        "product_json",
+        "user_info_json",
+        "cart_json",
+        "shipping_info_json",
+        "dest_json",
+        "hard_constraints_json",
+    }
+)
+
+
+def json_fields(name: str, value, json_columns: str = "string") -> Dict:
+    """Row entries for the JSON-valued field ``name``: ``<name>`` (native) and/or ``<name>_json`` (string)."""
+    fields = {}
+    if json_columns != "string":
+        fields[name] = value
+    if json_columns != "nested":
+        fields[name + JSON_SUFFIX] = json.dumps(value, ensure_ascii=False)
+    return fields
+
+
+def expand_json_column(column: str, json_columns: str = "string") -> List[str]:
+    """Columns written in place of the contract column ``column`` for a ``--json-columns`` mode."""
+    if column not in NESTED_JSON_COLUMNS or json_columns == "string":
+        return [column]
+    nested = column[: -len(JSON_SUFFIX)]
+    return [nested] if json_columns == "nested" else [nested, column]
+
+
+def is_nested(data_type: pa.DataType) -> bool:
+    return pa.types.is_struct(data_type) or pa.types.is_list(data_type) or pa.types.is_large_list(data_type)
+
+
+def contains_type(data_type: pa.DataType, predicate: Callable[[pa.DataType], bool]) -> bool:
+    """Whether ``data_type`` or any type nested in it satisfies ``predicate``."""
+    if predicate(data_type):
+        return True
+    if pa.types.is_struct(data_type):
+        return any(contains_type(field.type, predicate) for field in data_type)
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        return contains_type(data_type.value_type, predicate)
+    return False
+
+
+def writable_type(data_type: pa.DataType) -> pa.DataType:
+    """``data_type`` with empty structs (``{}`` everywhere) replaced by null, which parquet can store."""
+    if pa.types.is_struct(data_type):
+        if data_type.num_fields == 0:
+            return pa.null()
+        return pa.struct([field.with_type(writable_type(field.type)) for field in data_type])
+    if pa.types.is_list(data_type):
+        return pa.list_(data_type.value_field.with_type(writable_type(data_type.value_type)))
+    if pa.types.is_large_list(data_type):
+        return pa.large_list(data_type.value_field.with_type(writable_type(data_type.value_type)))
+    return data_type
+
+
+def conform_array(array: pa.Array, target: pa.DataType, path: str) -> pa.Array:
+    """Cast ``array`` to ``target``, filling struct fields it lacks with nulls.
+
+    Raises ``ValueError`` for struct fields missing from ``target``: the file
+    schema is already fixed, so they would be dropped silently.
+    """
+    if array.type == target:
+        return array
+    if pa.types.is_null(target):
+        if pa.types.is_null(array.type) or (pa.types.is_struct(array.type) and array.type.num_fields == 0):
+            return pa.nulls(len(array))
+        raise ValueError(f"{path}: values of type {array.type} after the schema fixed it as null")
+    if pa.types.is_struct(target) and pa.types.is_struct(array.type):
+        extra = [field.name for field in array.type if target.get_field_index(field.name) < 0]
+        if extra:
+            raise ValueError(f"{path}: fields {extra} first seen after the schema was fixed")
+        children = dict(zip([field.name for field in array.type], array.flatten()))
+        arrays = [
+            conform_array(children[field.name], field.type, f"{path}.{field.name}")
+            if field.name in children
+            else pa.nulls(len(array), field.type)
+            for field in target
+        ]
+        return pa.StructArray.from_arrays(arrays, fields=list(target), mask=array.is_null())
+    if pa.types.is_list(target) and pa.types.is_list(array.type):
+        values = conform_array(array.values, target.value_type, f"{path}[]")
+        return pa.ListArray.from_arrays(array.offsets, values, type=target, mask=array.is_null())
+    try:
+        return array.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as exc:
+        raise ValueError(f"{path}: cannot convert {array.type} to {target}: {exc}") from exc
@@ -0,0 +1,168 @@
+"""Stage-level profiling for the DeepPlanning build (``--profile``).
+
+``BuildProfiler`` records nested stages (wall time, CPU time, rows, bytes and
+the peak RSS seen so far), per-table writer totals and per-case parse spans
+timed inside worker processes. CPU time is that of the calling thread
+(``time.thread_time``): build stages run concurrently on threads of one
+process, so process-wide CPU time would count every other stage running at
+the same time. Work handed to the process pool (or Arrow's own threads) is
+not part of a stage's ``cpu_seconds``; pool work shows up under ``work``.
+``summary()`` goes into ``manifest.json`` and ``write_chrome_trace()`` writes
+a Chrome trace / Perfetto JSON file. A disabled profiler turns every call into
+a no-op.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its finished children, in MiB."""
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    unit = 1 if platform.system() == "Darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return round(peak * unit / 2**20, 1)
+
+
+def timed_call(fn: Callable, *args) -> Tuple[object, Dict]:
+    """Run ``fn(*args)`` and return ``(result, timing)``; picklable, so it also times pool workers.
+
+    Leading str/int arguments (the case key for the parse functions) become the timing label.
+    """
+    start_ns = time.time_ns()
+    cpu = time.thread_time()
+    result = fn(*args)
+    key = []
+    for arg in args:
+        if not isinstance(arg, (str, int)):
+            break
+        key.append(str(arg))
+    timing = {
+        "label": "/".join(key),
+        "pid": os.getpid(),
+        "start_ns": start_ns,
+        "end_ns": time.time_ns(),
+        "cpu_seconds": time.thread_time() - cpu,
+    }
+    return result, timing
+
+
+class BuildProfiler:
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.stages: List[Dict] = []
+        self.tables: Dict[str, Dict] = {}
+        self.work: Dict[str, Dict] = {}
+        self._events: List[Dict] = []
+        self._origin_ns = time.time_ns()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _stack(self) -> List[str]:
+        """Open stage names of the calling thread (stages of concurrent build stages nest per thread)."""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _trace_event(self, name: str, cat: str, start_ns: int, end_ns: int, pid: int, tid: int, args: Dict) -> None:
+        self._events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (start_ns - self._origin_ns) / 1000,
+                "dur": max(end_ns - start_ns, 0) / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            }
+        )
+
+    @contextmanager
+    def stage(self, name: str, **fields) -> Iterator[Dict]:
+        """Time a stage; the yielded dict may be updated with ``rows``/``bytes`` before the block ends."""
+        info: Dict = dict(fields)
+        if not self.enabled:
+            yield info
+            return
+        path = "/".join(self._stack + [name])
+        self._stack.append(name)
+        start_ns = time.time_ns()
+        cpu = time.thread_time()
+        try:
+            yield info
+        finally:
+            end_ns = time.time_ns()
+            self._stack.pop()
+            record = {
+                "name": path,
+                "wall_seconds": round((end_ns - start_ns) / 1e9, 4),
+                "cpu_seconds": round(time.thread_time() - cpu, 4),
+                **info,
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            with self._lock:
+                self.stages.append(record)
+                self._trace_event(path, "stage", start_ns, end_ns, os.getpid(), threading.get_ident(), record)
+
+    def add_table(self, table: str, **totals: float) -> None:
+        """Accumulate per-table counters (``rows``, ``bytes``, ``write_seconds``, ...)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self.tables.setdefault(table, {})
+            for key, value in totals.items():
+                entry[key] = entry.get(key, 0) + value
+
+    def add_work(self, name: str, timing: Dict, **args) -> None:
+        """Record one unit of work timed by ``timed_call`` (possibly in another process)."""
+        if not self.enabled:
+            return
+        wall = (timing["end_ns"] - timing["start_ns"]) / 1e9
+        with self._lock:
+            entry = self.work.setdefault(name, {"count": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+            entry["count"] += 1
+            entry["wall_seconds"] += wall
+            entry["cpu_seconds"] += timing["cpu_seconds"]
+            self._trace_event(
+                name, "work", timing["start_ns"], timing["end_ns"], timing["pid"], 0, {"key": timing["label"], **args}
+            )
+
+    def summary(self) -> Dict:
+        def _rounded(entries: Dict[str, Dict]) -> Dict[str, Dict]:
+            return {
+                name: {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()}
+                for name, entry in entries.items()
+            }
+
+        return {
+            "wall_seconds": round((time.time_ns() - self._origin_ns) / 1e9, 4),
+            "stages": self.stages,
+            "tables": _rounded(self.tables),
+            "work": _rounded(self.work),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def write_chrome_trace(self, path: Path) -> None:
+        events = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": "build (main)"}}]
+        for pid in sorted({e["pid"] for e in self._events if e["pid"] != os.getpid()}):
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"worker {pid}"}})
+        payload = {"traceEvents": events + sorted(self._events, key=lambda e: e["ts"]), "displayTimeUnit": "ms"}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+
+
+NULL_PROFILER = BuildProfiler(enabled=False)
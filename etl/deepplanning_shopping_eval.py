@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""Columnar batch evaluator for the DeepPlanning shopping benchmark.
+
+Upstream ``evaluation_pipeline.py`` / ``score_statistics.py`` score one run at a
+time by walking per-case directories. ``evaluate_shopping`` takes the final
+carts of any number of runs as one Arrow table (``CART_SCHEMA``: one row per
+run and case) and scores them all against ``shopping_gt_products`` /
+``shopping_gt_coupons`` with hash joins and group-bys:
+
+- per case: ``matched_count = |cart products ∩ gt products| + matched coupons``,
+  ``expected_count = |gt products| + |gt coupons|``, ``score`` and ``case_score``;
+  a coupon matches when the cart uses it exactly the ground-truth quantity;
+- per run and level: ``average_case_score`` and ``incomplete_rate``;
+- per run: ``match_rate`` (``total_matched_products_sum /
+  total_expected_products_sum``, products only, as in docs/02),
+  ``match_rate_with_coupons`` (coupons counted too) and
+  ``weighted_average_case_score`` (level averages weighted by case count).
+
+docs/02 calls a level invalid when its ``incomplete_rate`` is "too high" but
+names no threshold, so ``valid`` (per level, and per run: every level valid)
+is only reported when ``incomplete_rate_threshold`` /
+``--incomplete-rate-threshold`` is given.
+
+A case is incomplete when its run has no cart row for it or the row's
+``product_ids`` is null; it scores 0 but still counts towards ``expected_count``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pajson
+import pyarrow.parquet as pq
+
+from deepplanning_ipc import load_tables
+
+CASE_KEYS = ["level", "case_id"]
+RUN_CASE_KEYS = ["run", "level", "case_id"]
+COUPON_TYPE = pa.struct([("coupon_name", pa.string()), ("quantity", pa.int64())])
+CART_SCHEMA = pa.schema(
+    [
+        ("run", pa.string()),
+        ("level", pa.int64()),
+        ("case_id", pa.string()),
+        ("product_ids", pa.list_(pa.string())),
+        ("coupons", pa.list_(COUPON_TYPE)),
+    ]
+)
+
+
+def cart_row(run: str, level: int, case_id, cart: Optional[Dict]) -> Dict:
+    """One ``CART_SCHEMA`` row from a ``cart.json`` dict (``None``: the run left no cart).
+
+    ``items`` entries are product dicts (``product_id``) or ids; ``used_coupons``
+    is a list of names (one per use), of ``{"coupon_name"|"name", "quantity"}``
+    dicts, or a name -> quantity dict.
+    """
+    if cart is None:
+        return {"run": run, "level": int(level), "case_id": str(case_id), "product_ids": None, "coupons": None}
+    product_ids = [str(item.get("product_id", "")) if isinstance(item, dict) else str(item) for item in cart.get("items", [])]
+    used = cart.get("used_coupons", [])
+    quantities: Dict[str, int] = {}
+    for name, qty in (used.items() if isinstance(used, dict) else ((c, 1) for c in used)):
+        if isinstance(name, dict):
+            name, qty = name.get("coupon_name", name.get("name", "")), name.get("quantity", 1)
+        quantities[str(name)] = quantities.get(str(name), 0) + int(qty)
+    coupons = [{"coupon_name": name, "quantity": qty} for name, qty in quantities.items()]
+    return {"run": run, "level": int(level), "case_id": str(case_id), "product_ids": product_ids, "coupons": coupons}
+
+
+def carts_from_database_dirs(run: str, database_dirs: Iterable[Path]) -> pa.Table:
+    """Carts of one run from upstream ``database_infered/database_{model}_level{L}_{ts}`` directories."""
+    rows = []
+    for database_dir in database_dirs:
+        database_dir = Path(database_dir)
+        match = re.search(r"level_?(\d+)", database_dir.name)
+        if match is None:
+            raise ValueError(f"Cannot tell the level of {database_dir}")
+        for case_dir in sorted(database_dir.glob("case_*")):
+            cart_path = case_dir / "cart.json"
+            cart = json.loads(cart_path.read_text(encoding="utf-8")) if cart_path.exists() else None
+            rows.append(cart_row(run, int(match.group(1)), case_dir.name[len("case_") :], cart))
+    return pa.Table.from_pylist(rows, schema=CART_SCHEMA)
+
+
+def read_carts(path: Path) -> pa.Table:
+    """Carts from a parquet file or a JSON-lines file of ``CART_SCHEMA`` rows."""
+    path = Path(path)
+    if path.suffix in (".jsonl", ".json"):
+        table = pajson.read_json(path, parse_options=pajson.ParseOptions(explicit_schema=CART_SCHEMA))
+    else:
+        table = pq.read_table(path)
+    return _conform_carts(table)
+
+
+def _conform_carts(carts: pa.Table) -> pa.Table:
+    missing = [name for name in ("run", "level", "case_id", "product_ids") if name not in carts.column_names]
+    if missing:
+        raise ValueError(f"Cart table lacks columns {missing}")
+    if "coupons" not in carts.column_names:
+        carts = carts.append_column("coupons", pa.nulls(carts.num_rows, CART_SCHEMA.field("coupons").type))
+    return carts.select(CART_SCHEMA.names).cast(CART_SCHEMA).combine_chunks()
+
+
+def _count(table: pa.Table, keys: List[str], name: str) -> pa.Table:
+    counts = table.group_by(keys, use_threads=False).aggregate([([], "count_all")])
+    return counts.select(keys + ["count_all"]).rename_columns(keys + [name])
+
+
+def _fill_zero(table: pa.Table, names: Iterable[str]) -> pa.Table:
+    for name in names:
+        idx = table.schema.get_field_index(name)
+        table = table.set_column(idx, name, pc.fill_null(table.column(name), 0))
+    return table
+
+
+def _ground_truth(parquet_dir: Path) -> Dict[str, pa.Table]:
+    tables = load_tables(parquet_dir, ["shopping_cases", "shopping_gt_products", "shopping_gt_coupons"])
+    cases = tables["shopping_cases"].select(CASE_KEYS)
+    cases = cases.append_column("position", pa.array(range(cases.num_rows), pa.int64()))
+    gt_products = tables["shopping_gt_products"].select(CASE_KEYS + ["product_id"])
+    gt_products = gt_products.group_by(gt_products.column_names, use_threads=False).aggregate([])
+    gt_coupons = tables["shopping_gt_coupons"].select(CASE_KEYS + ["coupon_name", "quantity"])
+    expected = cases.join(_count(gt_products, CASE_KEYS, "expected_products"), CASE_KEYS, join_type="left outer")
+    expected = expected.join(_count(gt_coupons, CASE_KEYS, "expected_coupons"), CASE_KEYS, join_type="left outer")
+    expected = _fill_zero(expected, ["expected_products", "expected_coupons"])
+    return {"cases": expected, "gt_products": gt_products, "gt_coupons": gt_coupons}
+
+
+def _case_scores(carts: pa.Table, gt: Dict[str, pa.Table]) -> pa.Table:
+    cases = gt["cases"]
+    duplicates = _count(carts.select(RUN_CASE_KEYS), RUN_CASE_KEYS, "n").filter(pc.greater(pc.field("n"), 1))
+    if duplicates.num_rows:
+        raise ValueError(f"Duplicate carts for {duplicates.select(RUN_CASE_KEYS).slice(0, 5).to_pylist()}")
+
+    runs = pc.unique(carts.column("run")).to_pylist()
+    n_cases = cases.num_rows
+    grid = pa.table({"run": pa.array([run for run in runs for _ in range(n_cases)], pa.string())})
+    case_index = pa.array([i for _ in runs for i in range(n_cases)], pa.int64())
+    for name in cases.column_names:
+        grid = grid.append_column(name, cases.column(name).take(case_index))
+
+    product_ids = carts.column("product_ids").combine_chunks()
+    coupons = carts.column("coupons").combine_chunks()
+    present = carts.select(RUN_CASE_KEYS).append_column("complete", pc.is_valid(product_ids))
+
+    parents = pc.list_parent_indices(product_ids)
+    items = carts.select(RUN_CASE_KEYS).take(parents).append_column("product_id", pc.list_flatten(product_ids))
+    items = items.group_by(items.column_names, use_threads=False).aggregate([])
+    matched_products = _count(
+        items.join(gt["gt_products"], CASE_KEYS + ["product_id"], join_type="inner"), RUN_CASE_KEYS, "matched_products"
+    )
+
+    parents = pc.list_parent_indices(coupons)
+    flat = pc.list_flatten(coupons)
+    used = carts.select(RUN_CASE_KEYS).take(parents).append_column("coupon_name", pc.struct_field(flat, "coupon_name"))
+    used = used.append_column("used", pc.struct_field(flat, "quantity"))
+    used = used.group_by(RUN_CASE_KEYS + ["coupon_name"], use_threads=False).aggregate([("used", "sum")])
+    used = used.join(gt["gt_coupons"], CASE_KEYS + ["coupon_name"], join_type="inner")
+    matched_coupons = _count(
+        used.filter(pc.equal(pc.field("used_sum"), pc.field("quantity"))), RUN_CASE_KEYS, "matched_coupons"
+    )
+
+    scores = grid.join(present, RUN_CASE_KEYS, join_type="left outer")
+    scores = scores.join(matched_products, RUN_CASE_KEYS, join_type="left outer")
+    scores = scores.join(matched_coupons, RUN_CASE_KEYS, join_type="left outer")
+    scores = _fill_zero(scores, ["matched_products", "matched_coupons"])
+    complete = pc.fill_null(scores.column("complete"), False)
+    matched = pc.add(scores.column("matched_products"), scores.column("matched_coupons"))
+    expected = pc.add(scores.column("expected_products"), scores.column("expected_coupons"))
+    score = pc.if_else(
+        pc.equal(expected, 0), pc.cast(complete, pa.float64()), pc.divide(pc.cast(matched, pa.float64()), expected)
+    )
+    scores = scores.set_column(scores.schema.get_field_index("complete"), "complete", complete)
+    scores = scores.append_column("matched_count", matched).append_column("expected_count", expected)
+    scores = scores.append_column("score", score)
+    scores = scores.append_column("case_score", pc.cast(pc.and_(complete, pc.equal(matched, expected)), pa.int64()))
+    scores = scores.append_column("run_order", pc.index_in(scores.column("run"), value_set=pa.array(runs, pa.string())))
+    return scores.sort_by([("run_order", "ascending"), ("position", "ascending")]).drop_columns(["run_order", "position"])
+
+
+def _ratio(numerator: pa.ChunkedArray, denominator: pa.ChunkedArray) -> pa.ChunkedArray:
+    return pc.if_else(
+        pc.equal(denominator, 0), pa.scalar(0.0), pc.divide(pc.cast(numerator, pa.float64()), denominator)
+    )
+
+
+def evaluate_shopping(
+    carts: pa.Table, parquet_dir: Path, incomplete_rate_threshold: Optional[float] = None
+) -> Dict[str, pa.Table]:
+    """Score every run in ``carts``; returns ``{"cases", "levels", "runs"}`` tables in run order.
+
+    ``valid`` columns are added only when ``incomplete_rate_threshold`` is given.
+    """
+    carts = _conform_carts(carts)
+    cases = _case_scores(carts, _ground_truth(Path(parquet_dir)))
+
+    levels = cases.append_column("incomplete", pc.cast(pc.invert(cases.column("complete")), pa.int64()))
+    levels = levels.group_by(["run", "level"], use_threads=False).aggregate(
+        [
+            ([], "count_all"),
+            ("incomplete", "sum"),
+            ("case_score", "mean"),
+            ("score", "mean"),
+            ("matched_products", "sum"),
+            ("expected_products", "sum"),
+            ("matched_count", "sum"),
+            ("expected_count", "sum"),
+        ]
+    )
+    sums = ["matched_products", "expected_products", "matched_count", "expected_count"]
+    levels = levels.select(
+        ["run", "level", "count_all", "incomplete_sum", "case_score_mean", "score_mean"] + [f"{n}_sum" for n in sums]
+    ).rename_columns(["run", "level", "cases", "incomplete", "average_case_score", "average_score"] + sums)
+    incomplete_rate = pc.divide(pc.cast(levels.column("incomplete"), pa.float64()), levels.column("cases"))
+    levels = levels.append_column("incomplete_rate", incomplete_rate)
+    if incomplete_rate_threshold is not None:
+        levels = levels.append_column("valid", pc.less_equal(incomplete_rate, incomplete_rate_threshold))
+
+    weighted = levels.append_column(
+        "weighted_case_score", pc.multiply(levels.column("average_case_score"), levels.column("cases"))
+    )
+    totals = ["cases", "incomplete"] + sums + ["weighted_case_score"]
+    if incomplete_rate_threshold is not None:
+        totals.append("valid")
+    runs = weighted.group_by(["run"], use_threads=False).aggregate(
+        [(name, "all" if name == "valid" else "sum") for name in totals]
+    )
+    runs = runs.select(["run"] + [f"{n}_all" if n == "valid" else f"{n}_sum" for n in totals]).rename_columns(
+        ["run"] + totals
+    )
+    runs = runs.append_column("match_rate", _ratio(runs.column("matched_products"), runs.column("expected_products")))
+    runs = runs.append_column(
+        "match_rate_with_coupons", _ratio(runs.column("matched_count"), runs.column("expected_count"))
+    )
+    runs = runs.append_column(
+        "weighted_average_case_score", pc.divide(runs.column("weighted_case_score"), runs.column("cases"))
+    ).drop_columns(["weighted_case_score"])
+
+    order = pa.array(pc.unique(cases.column("run")).to_pylist(), pa.string())
+    levels = levels.append_column("run_order", pc.index_in(levels.column("run"), value_set=order))
+    levels = levels.sort_by([("run_order", "ascending"), ("level", "ascending")]).drop_columns(["run_order"])
+    runs = runs.take(pc.index_in(order, value_set=runs.column("run")))
+    return {"cases": cases, "levels": levels, "runs": runs}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Score many shopping runs' final carts in one columnar pass")
+    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
+    parser.add_argument("--carts", type=Path, nargs="*", default=[], help="Cart tables (.parquet or .jsonl, CART_SCHEMA rows)")
+    parser.add_argument(
+        "--run-dir",
+        action="append",
+        default=[],
+        metavar="RUN=DIR",
+        help="Upstream database_infered/database_{model}_level{L}_{ts} directory of a run (repeatable)",
+    )
+    parser.add_argument("--out-dir", type=Path, default=None, help="Write cases/levels/runs parquet tables here")
+    parser.add_argument(
+        "--incomplete-rate-threshold",
+        type=float,
+        default=None,
+        help="Mark a level valid when its incomplete_rate is at most this (no default: docs/02 names no threshold; "
+        "without it no valid columns are reported)",
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    parts = [read_carts(path) for path in args.carts]
+    by_run: Dict[str, List[Path]] = {}
+    for spec in args.run_dir:
+        run, sep, directory = spec.partition("=")
+        if not sep:
+            raise ValueError(f"--run-dir expects RUN=DIR, got {spec!r}")
+        by_run.setdefault(run, []).append(Path(directory))
+    parts.extend(carts_from_database_dirs(run, dirs) for run, dirs in by_run.items())
+    if not parts:
+        parser.error("give --carts and/or --run-dir")
+
+    results = evaluate_shopping(pa.concat_tables(parts), args.parquet_dir, args.incomplete_rate_threshold)
+    if args.out_dir is not None:
+        args.out_dir.mkdir(parents=True, exist_ok=True)
+        for name, table in results.items():
+            pq.write_table(table, args.out_dir / f"shopping_eval_{name}.parquet", compression="zstd")
+    levels: Dict[str, Dict] = {}
+    for row in results["levels"].to_pylist():
+        levels.setdefault(row.pop("run"), {})[f"level_{row.pop('level')}"] = row
+    report = [{**row, "levels": levels.get(row["run"], {})} for row in results["runs"].to_pylist()]
+    print(
+        json.dumps(
+            {"runs": report, "seconds": round(time.perf_counter() - started, 4)}, ensure_ascii=False, indent=2
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
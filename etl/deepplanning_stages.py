@@ -0,0 +1,206 @@
+"""Dependency-aware, resumable stage scheduler for the DeepPlanning build.
+
+Stages form a DAG. Each stage runs on its own thread as soon as its
+dependencies have finished, so downloads, archive extraction and parquet
+writes of independent chains overlap. CPU-bound work inside a stage goes to
+one process pool shared by every stage (``process_pool`` / ``cpu``), which
+keeps the machine busy without oversubscribing it. A stage may also block on
+another stage it does not formally depend on with ``result`` (e.g. the shopping
+build waits for level 2 to be extracted only when it reaches level 2).
+
+A stage declared with a ``key`` is resumable: after it succeeds, its key,
+JSON result and output file stamps are recorded in a state file, and a later
+run (say, after a crash) reuses the recorded result instead of running the
+stage again, as long as the key is the same and the outputs are unchanged.
+"""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+STAGE_STATE_FILE = "build_stages.json"
+WORKER_START_TIMEOUT = 120.0
+
+_worker_barrier = None
+
+
+def _init_worker(barrier) -> None:
+    global _worker_barrier
+    _worker_barrier = barrier
+
+
+def _wait_for_all_workers() -> None:
+    _worker_barrier.wait(WORKER_START_TIMEOUT)
+
+
+def _stamp(path: Path) -> Optional[Dict[str, int]]:
+    """Size/mtime of a file, or file count, total size and newest mtime of a directory tree."""
+    if path.is_file():
+        stat = path.stat()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if path.is_dir():
+        files = [p.stat() for p in path.rglob("*") if p.is_file()]
+        return {
+            "files": len(files),
+            "size": sum(s.st_size for s in files),
+            "mtime_ns": max((s.st_mtime_ns for s in files), default=0),
+        }
+    return None
+
+
+class _Stage:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Dict[str, object]], object],
+        deps: List[str],
+        key: Optional[Callable[[Dict[str, object]], Optional[str]]],
+        outputs: Optional[Callable[[object], Iterable[Path]]],
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.deps = deps
+        self.key = key
+        self.outputs = outputs
+
+
+class StageScheduler:
+    """Run a DAG of stages on threads with a shared process pool for CPU work.
+
+    Example::
+
+        scheduler = StageScheduler(out_dir / STAGE_STATE_FILE, cpu_workers=8)
+        scheduler.add("fetch", lambda deps: download())
+        scheduler.add("parse", lambda deps: scheduler.cpu(parse, deps["fetch"]), deps=["fetch"],
+                      key=lambda deps: digest(deps["fetch"]), outputs=lambda result: [Path(result)])
+        results = scheduler.run()
+    """
+
+    def __init__(self, state_path: Optional[Path] = None, cpu_workers: int = 1, resume: bool = True) -> None:
+        """``state_path=None`` disables recording; ``resume=False`` records but never reuses (``--force``)."""
+        self.state_path = state_path
+        self.cpu_workers = cpu_workers
+        self.resume = resume
+        self.resumed: List[str] = []
+        self._stages: Dict[str, _Stage] = {}
+        self._results: Dict[str, object] = {}
+        self._failed = False
+        self._done = threading.Condition()
+        self._state_lock = threading.Lock()
+        self._state: Dict[str, Dict] = {}
+        if state_path is not None and state_path.exists():
+            self._state = json.loads(state_path.read_text(encoding="utf-8"))
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[[Dict[str, object]], object],
+        deps: Iterable[str] = (),
+        key: Optional[Callable[[Dict[str, object]], Optional[str]]] = None,
+        outputs: Optional[Callable[[object], Iterable[Path]]] = None,
+    ) -> None:
+        """Add a stage; ``fn``/``key`` get ``{dep: result}``. Dependencies must already be added."""
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage {name!r}")
+        deps = list(deps)
+        unknown = [dep for dep in deps if dep not in self._stages]
+        if unknown:
+            raise KeyError(f"Stage {name!r} depends on unknown stages {unknown}")
+        self._stages[name] = _Stage(name, fn, deps, key, outputs)
+
+    def cpu(self, fn: Callable, *args):
+        """Run ``fn(*args)`` in the shared process pool (inline when there is none)."""
+        if self.process_pool is None:
+            return fn(*args)
+        return self.process_pool.submit(fn, *args).result()
+
+    def result(self, name: str):
+        """Block until stage ``name`` has finished and return its result."""
+        if name not in self._stages:
+            raise KeyError(f"Unknown stage {name!r}")
+        with self._done:
+            while name not in self._results:
+                if self._failed:
+                    raise RuntimeError(f"Stage {name!r} did not run because another stage failed")
+                self._done.wait()
+            return self._results[name]
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self._state, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp_path.replace(self.state_path)
+
+    def _run_stage(self, stage: _Stage, inputs: Dict[str, object]):
+        key = stage.key(inputs) if stage.key is not None and self.state_path is not None else None
+        if key is not None and self.resume:
+            with self._state_lock:
+                record = self._state.get(stage.name)
+            if (
+                record is not None
+                and record["key"] == key
+                and all(_stamp(Path(path)) == stamp for path, stamp in record["outputs"].items())
+            ):
+                self.resumed.append(stage.name)
+                return record["result"]
+        result = stage.fn(inputs)
+        if key is not None:
+            outputs = [Path(p) for p in stage.outputs(result)] if stage.outputs is not None else []
+            record = {"key": key, "result": result, "outputs": {str(p): _stamp(p) for p in outputs}}
+            with self._state_lock:
+                self._state[stage.name] = record
+                self._save_state()
+        return result
+
+    def run(self) -> Dict[str, object]:
+        """Run every stage once its dependencies are done; re-raise the first failure after running stages stop."""
+        self._results = {}
+        self._failed = False
+        self.resumed = []
+        failure: Optional[BaseException] = None
+        if self.cpu_workers > 1:
+            # Start every worker now: forking once stage threads exist could copy a lock another thread holds.
+            # Each start task blocks at a barrier until all of them run, so no worker can take two of them
+            # and the pool has to start ``cpu_workers`` processes before ``run`` goes on.
+            context = multiprocessing.get_context()
+            barrier = context.Barrier(self.cpu_workers)
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.cpu_workers, mp_context=context, initializer=_init_worker, initargs=(barrier,)
+            )
+            for future in [self.process_pool.submit(_wait_for_all_workers) for _ in range(self.cpu_workers)]:
+                future.result()
+        try:
+            with ThreadPoolExecutor(max_workers=max(len(self._stages), 1), thread_name_prefix="stage") as threads:
+                pending = dict(self._stages)
+                running: Dict[Future, str] = {}
+                while pending or running:
+                    if failure is None:
+                        for name, stage in list(pending.items()):
+                            if all(dep in self._results for dep in stage.deps):
+                                del pending[name]
+                                inputs = {dep: self._results[dep] for dep in stage.deps}
+                                running[threads.submit(self._run_stage, stage, inputs)] = name
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    with self._done:
+                        for future in finished:
+                            name = running.pop(future)
+                            if future.exception() is not None:
+                                failure = failure or future.exception()
+                                self._failed = True
+                            else:
+                                self._results[name] = future.result()
+                        self._done.notify_all()
+        finally:
+            if self.process_pool is not None:
+                self.process_pool.shutdown(cancel_futures=failure is not None)
+                self.process_pool = None
+        if failure is not None:
+            raise failure
+        return dict(self._results)
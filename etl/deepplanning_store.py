@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""Indexed random access to per-case bundles in the DeepPlanning parquet artifacts.
+
+``DeepPlanningStore`` keeps a sidecar index (``store_index.json``) that maps every
+``(domain, level|language, case_id|sample_id)`` key to the row ranges holding it,
+as ``(row group, offset, length)`` per table listed in ``schemas/table_contracts.json``.
+Parquet files are memory-mapped and decoded row groups are kept in an LRU cache,
+so repeated per-case lookups only touch the row groups they need. Each thread
+decodes through its own file handles (parquet readers are not thread-safe) and
+outside the cache lock; a thread asking for a row group that another thread is
+already decoding waits for that result. Tables with an Arrow IPC companion in
+``manifest.json`` (``--ipc-companions``) are read from it instead: record batch
+i is row group i, and uncompressed batches are zero-copy views of the
+memory-mapped file shared by every process.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from deepplanning_catalog import (
+    FLAT_TABLE,
+    MEMBERSHIP_TABLE,
+    PRODUCT_HASH_COLUMN,
+    PRODUCTS_TABLE,
+    manifest_catalog_layout,
+    off_layout_tables,
+    reconstruct_catalog,
+)
+from deepplanning_ipc import ipc_companions, open_ipc_file, read_ipc_table
+
+TABLE_CONTRACTS_PATH = Path(__file__).resolve().parent.parent / "schemas" / "table_contracts.json"
+INDEX_FILE_NAME = "store_index.json"
+INDEX_VERSION = 1
+DEFAULT_CACHE_ROW_GROUPS = 32
+
+Key = Tuple[str, str, str]
+Range = Tuple[int, int, int]
+
+
+def _key(domain: str, part, item_id) -> Key:
+    return domain, str(part), str(item_id)
+
+
+def _encode_key(key: Key) -> str:
+    return "/".join(key)
+
+
+def _decode_key(raw: str) -> Key:
+    domain, part, item_id = raw.split("/", 2)
+    return domain, part, item_id
+
+
+def _file_stamp(path: Path) -> Dict[str, int]:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def index_table(path: Path, key_columns: List[str]) -> Dict[Key, List[Range]]:
+    """Scan only the key columns of one table and record the contiguous row runs of every key."""
+    pf = pq.ParquetFile(path, memory_map=True)
+    if any(name not in pf.schema_arrow.names for name in key_columns):
+        return {}
+    domain_col, part_col, id_col = key_columns
+    ranges: Dict[Key, List[Range]] = {}
+    for rg in range(pf.metadata.num_row_groups):
+        keys = pf.read_row_group(rg, columns=key_columns)
+        n = keys.num_rows
+        if n == 0:
+            continue
+        columns = [keys.column(name).cast(pa.string()) for name in (domain_col, part_col, id_col)]
+        starts = [0]
+        if n > 1:
+            changed = None
+            for column in columns:
+                diff = pc.fill_null(pc.not_equal(column.slice(1), column.slice(0, n - 1)), True)
+                changed = diff if changed is None else pc.or_(changed, diff)
+            starts.extend(i + 1 for i in pc.indices_nonzero(changed).to_pylist())
+        heads = [column.take(pa.array(starts)).to_pylist() for column in columns]
+        for pos, start in enumerate(starts):
+            stop = starts[pos + 1] if pos + 1 < len(starts) else n
+            key = _key(heads[0][pos], heads[1][pos], heads[2][pos])
+            ranges.setdefault(key, []).append((rg, start, stop - start))
+    return ranges
+
+
+class DeepPlanningStore:
+    """Serve per-case bundles from a flat DeepPlanning parquet directory.
+
+    Example::
+
+        store = DeepPlanningStore("artifacts/deepplanning_parquet")
+        bundle = store.shopping_case(2, 37)       # {"shopping_cases": Table, "shopping_catalog": Table, ...}
+        bundle = store.travel_sample("en", 88)
+    """
+
+    def __init__(
+        self,
+        parquet_dir: Path,
+        index_path: Optional[Path] = None,
+        cache_row_groups: int = DEFAULT_CACHE_ROW_GROUPS,
+        contracts_path: Path = TABLE_CONTRACTS_PATH,
+        use_ipc: bool = True,
+    ) -> None:
+        self.parquet_dir = Path(parquet_dir)
+        self.index_path = Path(index_path) if index_path is not None else self.parquet_dir / INDEX_FILE_NAME
+        self.cache_row_groups = cache_row_groups
+        contracts = json.loads(Path(contracts_path).read_text(encoding="utf-8"))
+        self.catalog_layout = manifest_catalog_layout(self.parquet_dir)
+        skipped = set(off_layout_tables(self.catalog_layout))
+
+        self.tables_by_domain: Dict[str, List[str]] = {}
+        self.key_columns: Dict[str, List[str]] = {}
+        for domain, spec in contracts.items():
+            names = []
+            for file_name in spec["tables"]:
+                name = file_name[: -len(".parquet")]
+                if name not in skipped and (self.parquet_dir / file_name).exists():
+                    names.append(name)
+                    self.key_columns[name] = list(spec["primary_keys"])
+            self.tables_by_domain[domain] = names
+
+        self._handles = threading.local()
+        self._ipc_paths: Dict[str, Path] = ipc_companions(self.parquet_dir) if use_ipc else {}
+        self._products: Optional[Tuple[pa.Table, Dict[str, int]]] = None
+        self._cache: "OrderedDict[Tuple[str, int], pa.Table]" = OrderedDict()
+        self._loading: Dict[Tuple[str, int], "Future[pa.Table]"] = {}
+        self._lock = threading.Lock()
+        self._products_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._ranges: Dict[str, Dict[Key, List[Range]]] = self._load_or_build_index()
+
+    # -- index -----------------------------------------------------------------
+
+    def _load_or_build_index(self) -> Dict[str, Dict[Key, List[Range]]]:
+        previous: Dict = {}
+        if self.index_path.exists():
+            previous = json.loads(self.index_path.read_text(encoding="utf-8"))
+            if previous.get("version") != INDEX_VERSION:
+                previous = {}
+        prev_tables = previous.get("tables", {})
+
+        tables: Dict[str, Dict] = {}
+        ranges: Dict[str, Dict[Key, List[Range]]] = {}
+        dirty = False
+        for name, key_columns in self.key_columns.items():
+            path = self.parquet_dir / f"{name}.parquet"
+            stamp = _file_stamp(path)
+            cached = prev_tables.get(name)
+            if cached is not None and cached.get("file") == stamp and cached.get("key_columns") == key_columns:
+                table_ranges = {_decode_key(k): [tuple(r) for r in v] for k, v in cached["ranges"].items()}
+            else:
+                table_ranges = index_table(path, key_columns)
+                dirty = True
+            ranges[name] = table_ranges
+            tables[name] = {
+                "file": stamp,
+                "key_columns": key_columns,
+                "ranges": {_encode_key(k): [list(r) for r in v] for k, v in table_ranges.items()},
+            }
+        if dirty or set(prev_tables) != set(tables):
+            payload = {"version": INDEX_VERSION, "tables": tables}
+            self.index_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        return ranges
+
+    def keys(self, domain: str) -> List[Key]:
+        seen = set()
+        for name in self.tables_by_domain.get(domain, []):
+            seen.update(k for k in self._ranges[name] if k[0] == domain)
+        return sorted(seen, key=lambda k: (k[1], int(k[2]) if k[2].isdigit() else k[2]))
+
+    # -- row access ------------------------------------------------------------
+
+    def _thread_handles(self) -> Tuple[Dict[str, pq.ParquetFile], Dict[str, pa.ipc.RecordBatchFileReader]]:
+        """Open files of the calling thread; memory maps of the same file share their pages."""
+        if not hasattr(self._handles, "files"):
+            self._handles.files = {}
+            self._handles.ipc_files = {}
+        return self._handles.files, self._handles.ipc_files
+
+    def _file(self, name: str) -> pq.ParquetFile:
+        files, _ = self._thread_handles()
+        pf = files.get(name)
+        if pf is None:
+            pf = pq.ParquetFile(self.parquet_dir / f"{name}.parquet", memory_map=True)
+            files[name] = pf
+        return pf
+
+    def _ipc_file(self, name: str) -> Optional[pa.ipc.RecordBatchFileReader]:
+        _, ipc_files = self._thread_handles()
+        reader = ipc_files.get(name)
+        if reader is not None:
+            return reader
+        path = self._ipc_paths.get(name)
+        if path is None:
+            return None
+        reader = open_ipc_file(path)
+        if reader.num_record_batches != self._file(name).metadata.num_row_groups:
+            # Companion does not follow the parquet row groups; the index would not apply.
+            self._ipc_paths.pop(name, None)
+            return None
+        ipc_files[name] = reader
+        return reader
+
+    def _read_row_group(self, name: str, rg: int) -> pa.Table:
+        reader = self._ipc_file(name)
+        if reader is None:
+            return self._file(name).read_row_group(rg)
+        return pa.Table.from_batches([reader.get_batch(rg)])
+
+    def _row_group(self, name: str, rg: int) -> pa.Table:
+        cache_key = (name, rg)
+        with self._lock:
+            table = self._cache.get(cache_key)
+            if table is not None:
+                self._cache.move_to_end(cache_key)
+                self.cache_hits += 1
+                return table
+            loading = self._loading.get(cache_key)
+            if loading is not None:
+                # Another thread is decoding it: wait for that instead of decoding it twice.
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+                self._loading[cache_key] = Future()
+        if loading is not None:
+            return loading.result()
+
+        try:
+            table = self._read_row_group(name, rg)
+        except BaseException as exc:
+            with self._lock:
+                self._loading.pop(cache_key).set_exception(exc)
+            raise
+        with self._lock:
+            self._cache[cache_key] = table
+            while len(self._cache) > self.cache_row_groups:
+                self._cache.popitem(last=False)
+            self._loading.pop(cache_key).set_result(table)
+        return table
+
+    def rows(self, name: str, domain: str, part, item_id) -> pa.Table:
+        ranges = self._ranges[name].get(_key(domain, part, item_id), [])
+        if not ranges:
+            return self._file(name).schema_arrow.empty_table()
+        pieces = [self._row_group(name, rg).slice(offset, length) for rg, offset, length in ranges]
+        return pieces[0] if len(pieces) == 1 else pa.concat_tables(pieces)
+
+    def bundle(self, domain: str, part, item_id, tables: Optional[Iterable[str]] = None) -> Dict[str, pa.Table]:
+        names = self.tables_by_domain.get(domain, []) if tables is None else list(tables)
+        return {name: self.rows(name, domain, part, item_id) for name in names}
+
+    def shopping_case(self, level: int, case_id, tables: Optional[Iterable[str]] = None) -> Dict[str, pa.Table]:
+        return self.bundle("shopping", level, case_id, tables)
+
+    def _product_rows(self, hashes: List[str]) -> pa.Table:
+        # Its own lock: loading the products table must not hold up row group cache hits.
+        with self._products_lock:
+            if self._products is None:
+                if PRODUCTS_TABLE in self._ipc_paths:
+                    table = read_ipc_table(self._ipc_paths[PRODUCTS_TABLE])
+                else:
+                    table = pq.read_table(self.parquet_dir / f"{PRODUCTS_TABLE}.parquet", memory_map=True)
+                position = {digest: idx for idx, digest in enumerate(table.column(PRODUCT_HASH_COLUMN).to_pylist())}
+                self._products = (table, position)
+        table, position = self._products
+        return table.take(pa.array(sorted({position[h] for h in hashes if h in position}), pa.int64()))
+
+    def shopping_catalog(self, level: int, case_id) -> pa.Table:
+        """Flat catalog rows of one case; rebuilt from ``shopping_products`` in the dedup layout."""
+        if self.catalog_layout == "flat":
+            return self.rows(FLAT_TABLE, "shopping", level, case_id)
+        membership = self.rows(MEMBERSHIP_TABLE, "shopping", level, case_id)
+        return reconstruct_catalog(membership, self._product_rows(membership.column(PRODUCT_HASH_COLUMN).to_pylist()))
+
+    def travel_sample(self, language: str, sample_id, tables: Optional[Iterable[str]] = None) -> Dict[str, pa.Table]:
+        return self.bundle("travel", language, sample_id, tables)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the DeepPlanning store index and look up one case")
+    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
+    parser.add_argument("--index-path", type=Path, default=None, help=f"Defaults to <parquet-dir>/{INDEX_FILE_NAME}")
+    parser.add_argument("--cache-row-groups", type=int, default=DEFAULT_CACHE_ROW_GROUPS)
+    parser.add_argument("--lookup", default=None, help="Key to fetch, e.g. shopping/2/37 or travel/en/88")
+    parser.add_argument("--no-ipc", action="store_true", help="Read parquet even when IPC companions are listed")
+    args = parser.parse_args()
+
+    if not args.parquet_dir.exists():
+        raise FileNotFoundError(args.parquet_dir)
+
+    started = time.perf_counter()
+    store = DeepPlanningStore(args.parquet_dir, args.index_path, args.cache_row_groups, use_ipc=not args.no_ipc)
+    report: Dict = {
+        "index": str(store.index_path),
+        "ipc_tables": sorted(store._ipc_paths),
+        "open_seconds": round(time.perf_counter() - started, 4),
+        "keys": {domain: len(store.keys(domain)) for domain in store.tables_by_domain},
+    }
+    if args.lookup:
+        domain, part, item_id = _decode_key(args.lookup)
+        started = time.perf_counter()
+        bundle = store.bundle(domain, part, item_id)
+        report["lookup"] = {
+            "key": args.lookup,
+            "seconds": round(time.perf_counter() - started, 4),
+            "rows": {name: table.num_rows for name, table in bundle.items()},
+        }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Generate fake DeepPlanning raw inputs for offline benchmarking.
+
+Writes the same layout the builder consumes, with no network access:
+
+    <root>/raw/database_level{1,2,3}.tar.gz
+    <root>/raw/database_{en,zh}.zip
+    <root>/qwen_agent/shoppingplanning/data/level_{n}_query_meta.json
+    <root>/qwen_agent/travelplanning/data/travelplanning_query_{lang}.json
+
+Scale 1 matches the published benchmark size (40 shopping cases per level,
+120 travel samples per language); larger scales multiply the number of cases
+and samples, keeping per-case sizes fixed. Case catalogs are drawn from a
+shared product pool with per-case stock and sales, as in the real data where
+products repeat across cases and levels. Output is deterministic per seed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import random
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Dict, List
+
+SHOPPING_CASES_PER_LEVEL = 40
+TRAVEL_SAMPLES_PER_LANGUAGE = 120
+PRODUCTS_PER_CASE = 200
+PRODUCT_POOL_SIZE = 2000
+GT_PRODUCTS_PER_CASE = 3
+TRAVEL_ROWS_PER_TABLE = 30
+LOCATIONS_PER_SAMPLE = 25
+
+BRANDS = ["Acme", "Borealis", "Cobalt", "Dune", "Ember", "Fjord", "Granite", "Harbor"]
+COLORS = ["black", "white", "red", "blue", "green", "grey"]
+SIZES = ["XS", "S", "M", "L", "XL"]
+CITIES = ["Beijing", "Shanghai", "Hangzhou", "Chengdu", "Xi'an", "Guangzhou", "Shenzhen", "Nanjing"]
+
+
+def _add_tar_member(tf: tarfile.TarFile, name: str, text: str) -> None:
+    data = text.encode("utf-8")
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tf.addfile(info, io.BytesIO(data))
+
+
+def _csv_text(header: List[str], rows: List[List]) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buf.getvalue()
+
+
+def _product(rnd: random.Random, idx: int) -> Dict:
+    return {
+        "product_id": f"P{rnd.randint(0, 99999):05d}",
+        "name": f"{rnd.choice(BRANDS)} item {idx}",
+        "brand": rnd.choice(BRANDS),
+        "color": rnd.choice(COLORS),
+        "size": rnd.choice(SIZES),
+        "price": round(rnd.uniform(5, 500), 2),
+        "stock_quantity": rnd.randint(0, 500),
+        "rating": round(rnd.uniform(1, 5), 1),
+        "sales_volume": rnd.randint(0, 10000),
+        "shipping_info": {"days": rnd.randint(1, 7), "free": rnd.random() < 0.5},
+    }
+
+
+def generate_shopping(root: Path, raw_dir: Path, scale: int, rnd: random.Random) -> Dict[str, int]:
+    data_dir = root / "shoppingplanning" / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    n_cases = SHOPPING_CASES_PER_LEVEL * scale
+    pool = [_product(rnd, idx) for idx in range(PRODUCT_POOL_SIZE * scale)]
+    for level in (1, 2, 3):
+        queries = [{"id": i, "query": f"Level {level} shopping task {i}"} for i in range(1, n_cases + 1)]
+        (data_dir / f"level_{level}_query_meta.json").write_text(json.dumps(queries), encoding="utf-8")
+        with tarfile.open(raw_dir / f"database_level{level}.tar.gz", "w:gz") as tf:
+            for case_id in range(1, n_cases + 1):
+                base = f"database_level{level}/case_{case_id}/"
+                products = [
+                    {**p, "stock_quantity": rnd.randint(0, 500), "sales_volume": rnd.randint(0, 10000)}
+                    for p in rnd.sample(pool, PRODUCTS_PER_CASE)
+                ]
+                coupons = {f"coupon_{k}": rnd.randint(1, 3) for k in range(rnd.randint(1, 3))} if level == 3 else {}
+                validation = {
+                    "query": f"Level {level} shopping task {case_id}",
+                    "meta_info": {"budget": rnd.randint(100, 2000)},
+                    "ground_truth_products": rnd.sample(products, GT_PRODUCTS_PER_CASE),
+                    "ground_truth_coupons": coupons,
+                }
+                user = {"user_id": f"u{case_id}", "username": f"user{case_id}", "is_vip": rnd.random() < 0.3}
+                cart = {"user_id": f"u{case_id}", "items": [], "used_coupons": []}
+                _add_tar_member(tf, base + "products.jsonl", "".join(json.dumps(p) + "\n" for p in products))
+                _add_tar_member(tf, base + "validation_cases.json", json.dumps(validation))
+                _add_tar_member(tf, base + "user_info.json", json.dumps(user))
+                _add_tar_member(tf, base + "cart.json", json.dumps(cart))
+    return {
+        "shopping_cases": 3 * n_cases,
+        "shopping_catalog_rows": 3 * n_cases * PRODUCTS_PER_CASE,
+        "shopping_product_pool": len(pool),
+    }
+
+
+def _travel_sample_files(rnd: random.Random) -> Dict[str, str]:
+    n = TRAVEL_ROWS_PER_TABLE
+
+    def city() -> str:
+        return rnd.choice(CITIES)
+
+    def coord() -> str:
+        return f"{rnd.uniform(20, 40):.6f}"
+
+    files = {
+        "trains/trains.csv": _csv_text(
+            ["train_number", "origin", "destination", "dep_datetime", "price"],
+            [[f"G{rnd.randint(1, 9999)}", city(), city(), "2025-05-01 08:00", f"{rnd.uniform(50, 900):.1f}"] for _ in range(n)],
+        ),
+        "flights/flights.csv": _csv_text(
+            ["flight_no", "origin", "destination", "dep_datetime", "price"],
+            [[f"CA{rnd.randint(100, 9999)}", city(), city(), "2025-05-01 09:30", f"{rnd.uniform(300, 3000):.1f}"] for _ in range(n)],
+        ),
+    }
+    for name in ("hotels", "restaurants", "attractions"):
+        files[f"{name}/{name}.csv"] = _csv_text(
+            ["name", "city", "price", "rating", "latitude", "longitude"],
+            [[f"{name[:-1]} {k}", city(), f"{rnd.uniform(0, 1500):.0f}", f"{rnd.uniform(1, 5):.1f}", coord(), coord()] for k in range(n)],
+        )
+    locations = [f"Location {k}" for k in range(LOCATIONS_PER_SAMPLE)]
+    files["locations/locations_coords.csv"] = _csv_text(
+        ["name", "latitude", "longitude"], [[loc, coord(), coord()] for loc in locations]
+    )
+    files["transportation/distance_matrix.csv"] = _csv_text(
+        ["origin", "destination", "distance", "duration"],
+        [
+            [a, b, f"{rnd.uniform(0.5, 60):.2f}", f"{rnd.uniform(2, 120):.1f}"]
+            for a in locations
+            for b in locations
+            if a != b
+        ],
+    )
+    return files
+
+
+def generate_travel(root: Path, raw_dir: Path, scale: int, rnd: random.Random) -> Dict[str, int]:
+    data_dir = root / "travelplanning" / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    n_samples = TRAVEL_SAMPLES_PER_LANGUAGE * scale
+    for lang in ("en", "zh"):
+        queries = []
+        with zipfile.ZipFile(raw_dir / f"database_{lang}.zip", "w", zipfile.ZIP_DEFLATED) as zf:
+            for sample_id in range(n_samples):
+                days = rnd.randint(2, 7)
+                queries.append(
+                    {
+                        "id": sample_id,
+                        "query": f"Plan a {days}-day trip",
+                        "query_with_constraints": f"Plan a {days}-day trip under budget",
+                        "meta_info": {
+                            "org": rnd.choice(CITIES),
+                            "dest": [rnd.choice(CITIES)],
+                            "days": days,
+                            "depart_date": "2025-05-01",
+                            "return_date": f"2025-05-{days:02d}",
+                            "people_number": rnd.randint(1, 4),
+                            "room_number": rnd.randint(1, 2),
+                            "depart_weekday": rnd.randint(1, 7),
+                            "hard_constraints": {"budget": rnd.randint(2000, 20000)},
+                        },
+                    }
+                )
+                for relpath, text in _travel_sample_files(rnd).items():
+                    zf.writestr(f"database_{lang}/id_{sample_id}/{relpath}", text)
+        (data_dir / f"travelplanning_query_{lang}.json").write_text(json.dumps(queries), encoding="utf-8")
+    pairs = LOCATIONS_PER_SAMPLE * (LOCATIONS_PER_SAMPLE - 1)
+    return {"travel_samples": 2 * n_samples, "travel_distance_rows": 2 * n_samples * pairs}
+
+
+def generate(root: Path, scale: int = 1, seed: int = 0) -> Dict:
+    """Write a synthetic raw cache (``root/raw``) and Qwen-Agent tree (``root/qwen_agent``)."""
+    root = Path(root)
+    raw_dir = root / "raw"
+    qwen_agent_root = root / "qwen_agent"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    rnd = random.Random(seed)
+    sizes = generate_shopping(qwen_agent_root, raw_dir, scale, rnd)
+    sizes.update(generate_travel(qwen_agent_root, raw_dir, scale, rnd))
+    return {
+        "raw_cache_dir": str(raw_dir),
+        "qwen_agent_root": str(qwen_agent_root),
+        "scale": scale,
+        "seed": seed,
+        "sizes": sizes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic DeepPlanning raw inputs")
+    parser.add_argument("--out-dir", type=Path, required=True)
+    parser.add_argument("--scale", type=int, default=1, help="Multiplier on the number of cases/samples (1, 10, 100)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(generate(args.out_dir, args.scale, args.seed), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""Cached, indexed query backend for agent tool calls over the DeepPlanning parquet artifacts.
+
+The Qwen-Agent tools re-read the per-sample CSV/JSONL files on every call.
+``ToolBackend`` answers the same lookups from the parquet artifacts: the first
+query on a case or travel sample loads its bundle through ``DeepPlanningStore``
+(row-group index, IPC companions when built) and keeps it in an LRU cache of
+hot samples. Per-sample hash indexes (equality on column tuples) and sorted
+indexes (ranges on one column), declared per table in
+``schemas/tool_indexes.json``, are built on first use. ``serve`` puts a small
+asyncio HTTP/1.1 front-end on top, so many rollout processes can share one warm
+backend.
+
+Query shape (library keywords and ``POST /search`` body)::
+
+    {"domain": "travel", "part": "en", "id": "88", "table": "travel_db_flights",
+     "where": {"origin": "Beijing", "destination": "Shanghai", "dep_datetime:date": "2025-05-01"},
+     "ranges": {"price": [null, 1500]}, "order_by": "price", "limit": 10}
+
+``where`` values are scalars or lists (any of); ``<column>:date`` compares the
+first 10 characters (the date of an ISO datetime). ``ranges`` bounds are
+inclusive and ``null`` leaves a side open.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from deepplanning_catalog import FLAT_TABLE, MEMBERSHIP_TABLE
+from deepplanning_store import DeepPlanningStore, Key
+
+TOOL_INDEXES_PATH = Path(__file__).resolve().parent.parent / "schemas" / "tool_indexes.json"
+DEFAULT_CACHE_SAMPLES = 256
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DATE_SUFFIX = ":date"
+MAX_BODY_BYTES = 1 << 20
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large"}
+
+
+def _column_name(component: str) -> str:
+    return component[: -len(DATE_SUFFIX)] if component.endswith(DATE_SUFFIX) else component
+
+
+def _component_array(table: pa.Table, component: str) -> pa.ChunkedArray:
+    """Values of a column, or the date part of a datetime column for ``<column>:date``."""
+    column = table.column(_column_name(component))
+    if component.endswith(DATE_SUFFIX):
+        return pc.utf8_slice_codeunits(column.cast(pa.string()), 0, 10)
+    return column
+
+
+class _IndexedTable:
+    """Rows of one table for one sample, with lazily built hash and sorted indexes."""
+
+    def __init__(self, table: pa.Table, spec: Dict) -> None:
+        self.table = table
+        names = set(table.column_names)
+        self.hash_keys = [
+            tuple(key) for key in spec.get("hash", []) if all(_column_name(c) in names for c in key)
+        ]
+        self.sorted_columns = [c for c in spec.get("sorted", []) if c in names]
+        self._hash: Dict[Tuple[str, ...], Dict[Tuple, List[int]]] = {}
+        self._sorted: Dict[str, Tuple[List, List[int]]] = {}
+        self._lock = threading.Lock()
+
+    def hash_index(self, key: Tuple[str, ...]) -> Dict[Tuple, List[int]]:
+        with self._lock:
+            index = self._hash.get(key)
+            if index is None:
+                index = {}
+                columns = [_component_array(self.table, c).to_pylist() for c in key]
+                for row, values in enumerate(zip(*columns)):
+                    index.setdefault(values, []).append(row)
+                self._hash[key] = index
+            return index
+
+    def sorted_index(self, column: str) -> Tuple[List, List[int]]:
+        """(non-null values in ascending order, their row numbers)."""
+        with self._lock:
+            entry = self._sorted.get(column)
+            if entry is None:
+                values = self.table.column(column)
+                order = pc.array_sort_indices(values)
+                order = order.slice(0, len(values) - values.null_count)
+                entry = (values.take(order).to_pylist(), order.to_pylist())
+                self._sorted[column] = entry
+            return entry
+
+    def search(
+        self,
+        where: Dict,
+        ranges: Dict[str, Sequence],
+        order_by: Optional[str],
+        descending: bool,
+        limit: Optional[int],
+        columns: Optional[List[str]],
+    ) -> Tuple[pa.Table, str]:
+        names = set(self.table.column_names)
+        for component in list(where) + list(ranges) + ([order_by] if order_by else []) + (columns or []):
+            if _column_name(component) not in names:
+                raise KeyError(f"unknown column {component!r}; available: {sorted(names)}")
+
+        rows: Optional[List[int]] = None
+        plan = "scan"
+        where = dict(where)
+        ranges = dict(ranges)
+        scalars = {c: v for c, v in where.items() if not isinstance(v, list)}
+        hash_key = max((k for k in self.hash_keys if all(c in scalars for c in k)), key=len, default=None)
+        sorted_column = next((c for c in ranges if c in self.sorted_columns), None)
+        if hash_key is not None:
+            rows = self.hash_index(hash_key).get(tuple(scalars[c] for c in hash_key), [])
+            plan = "hash:" + ",".join(hash_key)
+            for component in hash_key:
+                del where[component]
+        elif sorted_column is not None:
+            values, order = self.sorted_index(sorted_column)
+            low, high = ranges.pop(sorted_column)
+            start = 0 if low is None else bisect_left(values, low)
+            stop = len(values) if high is None else bisect_right(values, high)
+            rows = sorted(order[start:stop])
+            plan = "sorted:" + sorted_column
+
+        table = self.table if rows is None else self.table.take(pa.array(rows, pa.int64()))
+        mask = None
+        for component, value in where.items():
+            array = _component_array(table, component)
+            if isinstance(value, list):
+                condition = pc.is_in(array, value_set=pa.array(value, array.type))
+            else:
+                condition = pc.equal(array, pa.scalar(value, array.type))
+            mask = condition if mask is None else pc.and_kleene(mask, condition)
+        for column, (low, high) in ranges.items():
+            array = table.column(column)
+            for bound, compare in ((low, pc.greater_equal), (high, pc.less_equal)):
+                if bound is not None:
+                    condition = compare(array, pa.scalar(bound, array.type))
+                    mask = condition if mask is None else pc.and_kleene(mask, condition)
+        if mask is not None:
+            table = table.filter(mask)
+        if order_by:
+            table = table.sort_by([(order_by, "descending" if descending else "ascending")])
+        if limit is not None:
+            table = table.slice(0, limit)
+        if columns:
+            table = table.select(columns)
+        return table, plan
+
+
+class ToolBackend:
+    """In-process query backend: LRU cache of indexed samples on top of ``DeepPlanningStore``.
+
+    Thread-safe; the HTTP front-end runs queries on a thread pool.
+    """
+
+    def __init__(
+        self,
+        parquet_dir: Path,
+        cache_samples: int = DEFAULT_CACHE_SAMPLES,
+        index_spec_path: Path = TOOL_INDEXES_PATH,
+        index_path: Optional[Path] = None,
+        use_ipc: bool = True,
+    ) -> None:
+        self.store = DeepPlanningStore(parquet_dir, index_path, use_ipc=use_ipc)
+        self.index_spec: Dict[str, Dict] = json.loads(Path(index_spec_path).read_text(encoding="utf-8"))
+        self.cache_samples = cache_samples
+        self._samples: "OrderedDict[Key, Dict[str, _IndexedTable]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.sample_hits = 0
+        self.sample_misses = 0
+        self.plans: Counter = Counter()
+
+    def _load(self, key: Key) -> Dict[str, _IndexedTable]:
+        domain, part, item_id = key
+        bundle = self.store.bundle(domain, part, item_id)
+        if self.store.catalog_layout == "dedup" and MEMBERSHIP_TABLE in bundle:
+            bundle.pop(MEMBERSHIP_TABLE)
+            bundle[FLAT_TABLE] = self.store.shopping_catalog(int(part), item_id)
+        if not any(table.num_rows for table in bundle.values()):
+            raise KeyError(f"unknown sample {'/'.join(key)}")
+        return {name: _IndexedTable(table, self.index_spec.get(name, {})) for name, table in bundle.items()}
+
+    def sample(self, domain: str, part, item_id) -> Dict[str, _IndexedTable]:
+        key = (domain, str(part), str(item_id))
+        with self._lock:
+            tables = self._samples.get(key)
+            if tables is not None:
+                self._samples.move_to_end(key)
+                self.sample_hits += 1
+                return tables
+        tables = self._load(key)
+        with self._lock:
+            self.sample_misses += 1
+            self._samples[key] = tables
+            while len(self._samples) > self.cache_samples:
+                self._samples.popitem(last=False)
+        return tables
+
+    def search(
+        self,
+        domain: str,
+        part,
+        item_id,
+        table: str,
+        where: Optional[Dict] = None,
+        ranges: Optional[Dict[str, Sequence]] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Dict:
+        tables = self.sample(domain, part, item_id)
+        if table not in tables:
+            raise KeyError(f"unknown table {table!r}; available: {sorted(tables)}")
+        try:
+            result, plan = tables[table].search(where or {}, ranges or {}, order_by, descending, limit, columns)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, TypeError) as exc:
+            raise ValueError(f"{table}: {exc}") from exc
+        with self._lock:
+            self.plans[plan.split(":")[0]] += 1
+        return {"rows": result.to_pylist(), "count": result.num_rows, "plan": plan}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "cached_samples": len(self._samples),
+                "cache_samples": self.cache_samples,
+                "sample_hits": self.sample_hits,
+                "sample_misses": self.sample_misses,
+                "queries": dict(self.plans),
+                "row_group_cache": {"hits": self.store.cache_hits, "misses": self.store.cache_misses},
+            }
+
+
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def _check_search_request(request) -> None:
+    """Raise ``ValueError`` unless ``request`` has the shape ``ToolBackend.search`` expects."""
+    if not isinstance(request, dict):
+        raise ValueError("request body must be a JSON object")
+    missing = [name for name in ("domain", "part", "id", "table") if name not in request]
+    if missing:
+        raise ValueError(f"missing fields {missing}")
+    if not isinstance(request["table"], str):
+        raise ValueError("table must be a string")
+    where = request.get("where")
+    if where is not None:
+        if not isinstance(where, dict):
+            raise ValueError("where must be an object of column -> value or list of values")
+        for column, value in where.items():
+            values = value if isinstance(value, list) else [value]
+            if not all(isinstance(v, _SCALAR_TYPES) for v in values):
+                raise ValueError(f"where[{column!r}] must be a scalar or a list of scalars")
+    ranges = request.get("ranges")
+    if ranges is not None:
+        if not isinstance(ranges, dict):
+            raise ValueError("ranges must be an object of column -> [low, high]")
+        for column, bounds in ranges.items():
+            if (
+                not isinstance(bounds, list)
+                or len(bounds) != 2
+                or not all(isinstance(b, _SCALAR_TYPES) and not isinstance(b, bool) for b in bounds)
+            ):
+                raise ValueError(f"ranges[{column!r}] must be [low, high] (null for an open end)")
+    if request.get("order_by") is not None and not isinstance(request["order_by"], str):
+        raise ValueError("order_by must be a column name")
+    limit = request.get("limit")
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 0):
+        raise ValueError("limit must be a non-negative integer")
+    columns = request.get("columns")
+    if columns is not None and (not isinstance(columns, list) or not all(isinstance(c, str) for c in columns)):
+        raise ValueError("columns must be a list of column names")
+
+
+def _search_request(backend: ToolBackend, request: Dict) -> Dict:
+    _check_search_request(request)
+    return backend.search(
+        request["domain"],
+        request["part"],
+        request["id"],
+        request["table"],
+        where=request.get("where"),
+        ranges=request.get("ranges"),
+        order_by=request.get("order_by"),
+        descending=bool(request.get("descending", False)),
+        limit=request.get("limit"),
+        columns=request.get("columns"),
+    )
+
+
+async def _dispatch(backend: ToolBackend, method: str, path: str, body: bytes) -> Tuple[int, Dict]:
+    if method == "GET" and path == "/health":
+        return 200, {"status": "ok"}
+    if method == "GET" and path == "/stats":
+        return 200, backend.stats()
+    if method == "POST" and path == "/search":
+        try:
+            request = json.loads(body or b"{}")
+            loop = asyncio.get_running_loop()
+            return 200, await loop.run_in_executor(None, partial(_search_request, backend, request))
+        except KeyError as exc:
+            return 400, {"error": exc.args[0] if exc.args else str(exc)}
+        except (ValueError, TypeError, AttributeError) as exc:
+            # TypeError/AttributeError: a request shape _check_search_request let through; still the client's input.
+            return 400, {"error": str(exc)}
+    return 404, {"error": f"no route {method} {path}"}
+
+
+async def _handle_connection(backend: ToolBackend, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Serve HTTP/1.1 requests on one connection (keep-alive unless the client sends ``Connection: close``)."""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers: Dict[str, str] = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            parts = request_line.decode("latin-1").split()
+            length = int(headers.get("content-length", "0") or 0)
+            keep_alive = headers.get("connection", "").lower() != "close"
+            if len(parts) != 3:
+                status, payload, keep_alive = 400, {"error": "malformed request line"}, False
+            elif length > MAX_BODY_BYTES:
+                status, payload, keep_alive = 413, {"error": f"body larger than {MAX_BODY_BYTES} bytes"}, False
+            else:
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await _dispatch(backend, parts[0], parts[1].split("?", 1)[0], body)
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            head = (
+                f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            )
+            writer.write(head.encode("latin-1") + data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(backend: ToolBackend, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+    """Serve ``GET /health``, ``GET /stats`` and ``POST /search`` until cancelled."""
+    server = await asyncio.start_server(partial(_handle_connection, backend), host, port)
+    bound = server.sockets[0].getsockname()
+    print(json.dumps({"status": "listening", "host": bound[0], "port": bound[1]}), flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Indexed DeepPlanning tool backend (library + HTTP front-end)")
+    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-samples", type=int, default=DEFAULT_CACHE_SAMPLES, help="Hot samples kept indexed")
+    parser.add_argument("--index-spec", type=Path, default=TOOL_INDEXES_PATH)
+    parser.add_argument("--no-ipc", action="store_true", help="Read parquet even when IPC companions are listed")
+    parser.add_argument("--query", default=None, help="Run one /search JSON request, print the result and exit")
+    args = parser.parse_args()
+
+    if not args.parquet_dir.exists():
+        raise FileNotFoundError(args.parquet_dir)
+    backend = ToolBackend(args.parquet_dir, args.cache_samples, args.index_spec, use_ipc=not args.no_ipc)
+    if args.query is not None:
+        print(json.dumps(_search_request(backend, json.loads(args.query)), ensure_ascii=False, indent=2))
+        return
+    try:
+        asyncio.run(serve(backend, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""Incremental multi-run travel results store and leaderboard for DeepPlanning.
+
+Upstream ``aggregate_results.py`` re-reads one ``evaluation_summary.json`` per
+model and language on every refresh. ``TravelResultsStore`` keeps per-sample
+evaluation results of any number of runs in a Hive-partitioned table keyed like
+``travel_constraints``::
+
+    <results-dir>/travel_results/run=<run>/language=<language>/part-0.parquet
+    <results-dir>/travel_summary.parquet     per (run, language) sums
+    <results-dir>/shopping_summary.parquet   per run shopping metrics (deepplanning_shopping_eval)
+
+``ingest`` writes only the runs it is given and upserts their rows in the
+summary, so ``leaderboard`` (language averages, travel means over languages and
+``avg_acc = (shopping weighted_average_case_score + travel case_acc) / 2``) is
+computed from the small summary without rescanning older runs. ``slice``
+breaks a metric down by ``days``, ``people_number`` or hard-constraint type,
+reading only the partitions of the requested runs.
+
+Every sample of ``travel_constraints`` counts: a sample a run did not deliver
+scores 0 and lowers ``delivery_rate``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.json as pajson
+import pyarrow.parquet as pq
+
+from deepplanning_ipc import load_tables
+
+RESULTS_TABLE = "travel_results"
+TRAVEL_SUMMARY_FILE = "travel_summary.parquet"
+SHOPPING_SUMMARY_FILE = "shopping_summary.parquet"
+SAMPLE_KEYS = ["language", "sample_id"]
+METRICS = ["composite_score", "case_acc", "commonsense_score", "personalized_score"]
+SLICE_COLUMNS = ("days", "people_number", "hard_constraint")
+RESULT_SCHEMA = pa.schema(
+    [
+        ("run", pa.string()),
+        ("language", pa.string()),
+        ("sample_id", pa.string()),
+        ("delivered", pa.bool_()),
+        ("commonsense_score", pa.float64()),
+        ("personalized_score", pa.float64()),
+        ("composite_score", pa.float64()),
+        ("case_acc", pa.float64()),
+    ]
+)
+SUMMARY_SCHEMA = pa.schema(
+    [("run", pa.string()), ("language", pa.string()), ("samples", pa.int64()), ("delivered", pa.int64())]
+    + [(f"{metric}_sum", pa.float64()) for metric in METRICS]
+)
+
+
+def read_results(path: Path) -> pa.Table:
+    """Per-sample results from parquet or JSON lines.
+
+    Required columns: ``run, language, sample_id, commonsense_score,
+    personalized_score``; ``composite_score``, ``case_acc`` and ``delivered``
+    are derived when absent.
+    """
+    path = Path(path)
+    if path.suffix in (".jsonl", ".json"):
+        return pajson.read_json(path)
+    return pq.read_table(path)
+
+
+def _write_atomic(table: pa.Table, path: Path) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    tmp_path.replace(path)
+
+
+def _constraint_types(constraints: pa.Table) -> pa.Table:
+    """``(language, sample_id, hard_constraint)``: one row per hard constraint a sample declares."""
+    if "hard_constraints_json" in constraints.column_names:
+        values = [json.loads(v) if v else {} for v in constraints.column("hard_constraints_json").to_pylist()]
+    else:
+        values = constraints.column("hard_constraints").to_pylist()
+    rows = {"language": [], "sample_id": [], "hard_constraint": []}
+    for language, sample_id, value in zip(
+        constraints.column("language").to_pylist(), constraints.column("sample_id").to_pylist(), values
+    ):
+        for name, setting in (value or {}).items():
+            if setting is not None:
+                rows["language"].append(language)
+                rows["sample_id"].append(sample_id)
+                rows["hard_constraint"].append(name)
+    return pa.table(rows, schema=pa.schema([(name, pa.string()) for name in rows]))
+
+
+class TravelResultsStore:
+    """Partitioned per-sample travel results of many runs plus incrementally maintained summaries."""
+
+    def __init__(self, results_dir: Path, parquet_dir: Path) -> None:
+        self.results_dir = Path(results_dir)
+        self.parquet_dir = Path(parquet_dir)
+        self.results_path = self.results_dir / RESULTS_TABLE
+        self.summary_path = self.results_dir / TRAVEL_SUMMARY_FILE
+        self.shopping_path = self.results_dir / SHOPPING_SUMMARY_FILE
+        constraints = load_tables(self.parquet_dir, ["travel_constraints"])["travel_constraints"]
+        self.constraints = constraints.append_column("position", pa.array(range(constraints.num_rows), pa.int64()))
+
+    # -- ingest ----------------------------------------------------------------
+
+    def summary(self) -> pa.Table:
+        return pq.read_table(self.summary_path) if self.summary_path.exists() else SUMMARY_SCHEMA.empty_table()
+
+    def runs(self) -> List[str]:
+        return pc.unique(self.summary().column("run")).to_pylist()
+
+    def _complete(self, results: pa.Table) -> pa.Table:
+        """Conform one run's results and add an undelivered, zero-score row for every missing sample."""
+        missing = [name for name in ("run", "language", "sample_id") if name not in results.column_names]
+        if missing:
+            raise ValueError(f"Results lack columns {missing}")
+        n = results.num_rows
+        columns: Dict[str, pa.ChunkedArray] = {}
+        for field in RESULT_SCHEMA:
+            if field.name in results.column_names:
+                columns[field.name] = results.column(field.name).cast(field.type)
+        for name in ("commonsense_score", "personalized_score"):
+            if name not in columns:
+                raise ValueError(f"Results lack column {name!r}")
+        if "delivered" not in columns:
+            columns["delivered"] = pa.chunked_array([pa.array([True] * n, pa.bool_())])
+        if "composite_score" not in columns:
+            columns["composite_score"] = pc.divide(
+                pc.add(columns["commonsense_score"], columns["personalized_score"]), 2.0
+            )
+        if "case_acc" not in columns:
+            perfect = pc.and_(pc.equal(columns["commonsense_score"], 1.0), pc.equal(columns["personalized_score"], 1.0))
+            columns["case_acc"] = pc.cast(perfect, pa.float64())
+        results = pa.table([columns[name] for name in RESULT_SCHEMA.names], schema=RESULT_SCHEMA)
+
+        counts = results.group_by(SAMPLE_KEYS, use_threads=False).aggregate([([], "count_all")])
+        duplicates = counts.filter(pc.greater(pc.field("count_all"), 1))
+        if duplicates.num_rows:
+            raise ValueError(f"Duplicate results for {duplicates.select(SAMPLE_KEYS).slice(0, 5).to_pylist()}")
+        unknown = results.join(self.constraints.select(SAMPLE_KEYS), SAMPLE_KEYS, join_type="left anti")
+        if unknown.num_rows:
+            raise ValueError(
+                f"Results for samples not in travel_constraints: {unknown.select(SAMPLE_KEYS).slice(0, 5).to_pylist()}"
+            )
+
+        run = results.column("run")[0].as_py()
+        grid = self.constraints.select(SAMPLE_KEYS + ["position"])
+        grid = grid.append_column("run", pa.array([run] * grid.num_rows, pa.string()))
+        full = grid.join(results.drop_columns(["run"]), SAMPLE_KEYS, join_type="left outer")
+        full = full.set_column(
+            full.schema.get_field_index("delivered"), "delivered", pc.fill_null(full.column("delivered"), False)
+        )
+        for name in METRICS:
+            idx = full.schema.get_field_index(name)
+            full = full.set_column(idx, name, pc.fill_null(full.column(name), 0.0))
+        return full.sort_by([("position", "ascending")]).select(RESULT_SCHEMA.names)
+
+    def _write_run(self, run: str, table: pa.Table) -> None:
+        run_dir = self.results_path / f"run={quote(run, safe='')}"
+        if run_dir.exists():
+            shutil.rmtree(run_dir)
+        for language in pc.unique(table.column("language")).to_pylist():
+            part = table.filter(pc.equal(table.column("language"), language)).drop_columns(["run", "language"])
+            out_path = run_dir / f"language={quote(language, safe='')}" / "part-0.parquet"
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(part, out_path, compression="zstd")
+
+    def ingest(self, results: pa.Table, replace: bool = False) -> Dict[str, List[str]]:
+        """Add the runs in ``results``; runs already stored are skipped unless ``replace``."""
+        known = set(self.runs())
+        ingested: List[str] = []
+        skipped: List[str] = []
+        summaries = []
+        for run in pc.unique(results.column("run")).to_pylist():
+            if run is None:
+                raise ValueError("Results have rows without a run")
+            if run in known and not replace:
+                skipped.append(run)
+                continue
+            table = self._complete(results.filter(pc.equal(results.column("run"), run)))
+            self._write_run(run, table)
+            table = table.append_column("delivered_count", pc.cast(table.column("delivered"), pa.int64()))
+            sums = table.group_by(["run", "language"], use_threads=False).aggregate(
+                [([], "count_all"), ("delivered_count", "sum")] + [(metric, "sum") for metric in METRICS]
+            )
+            sums = sums.select(["run", "language", "count_all", "delivered_count_sum"] + [f"{m}_sum" for m in METRICS])
+            summaries.append(sums.rename_columns(SUMMARY_SCHEMA.names).cast(SUMMARY_SCHEMA))
+            ingested.append(run)
+        if summaries:
+            previous = self.summary()
+            previous = previous.filter(
+                pc.invert(pc.is_in(previous.column("run"), value_set=pa.array(ingested, pa.string())))
+            )
+            self.results_dir.mkdir(parents=True, exist_ok=True)
+            _write_atomic(pa.concat_tables([previous] + summaries), self.summary_path)
+        return {"ingested": ingested, "skipped": skipped}
+
+    def ingest_shopping(self, shopping_runs: pa.Table) -> List[str]:
+        """Upsert per-run shopping metrics (``deepplanning_shopping_eval`` ``runs`` table) used by ``avg_acc``."""
+        if "valid" not in shopping_runs.column_names:
+            # The evaluator only reports valid when given --incomplete-rate-threshold.
+            shopping_runs = shopping_runs.append_column("valid", pa.nulls(shopping_runs.num_rows, pa.bool_()))
+        table = shopping_runs.select(["run", "weighted_average_case_score", "match_rate", "valid"])
+        if self.shopping_path.exists():
+            previous = pq.read_table(self.shopping_path)
+            keep = pc.invert(pc.is_in(previous.column("run"), value_set=table.column("run")))
+            table = pa.concat_tables([previous.filter(keep), table.cast(previous.schema)])
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        _write_atomic(table, self.shopping_path)
+        return shopping_runs.column("run").to_pylist()
+
+    # -- reports ---------------------------------------------------------------
+
+    def language_averages(self) -> pa.Table:
+        """Per (run, language): ``delivery_rate`` and the average of every metric."""
+        summary = self.summary()
+        samples = pc.cast(summary.column("samples"), pa.float64())
+        table = summary.select(["run", "language", "samples"])
+        table = table.append_column(
+            "delivery_rate", pc.divide(pc.cast(summary.column("delivered"), pa.float64()), samples)
+        )
+        for metric in METRICS:
+            table = table.append_column(metric, pc.divide(summary.column(f"{metric}_sum"), samples))
+        return table
+
+    def leaderboard(self) -> pa.Table:
+        """Per run: travel metrics averaged over languages, shopping metrics and ``avg_acc``, best first."""
+        averages = self.language_averages()
+        board = averages.group_by(["run"], use_threads=False).aggregate(
+            [([], "count_all")] + [(metric, "mean") for metric in METRICS + ["delivery_rate"]]
+        )
+        board = board.select(["run", "count_all"] + [f"{m}_mean" for m in METRICS + ["delivery_rate"]])
+        board = board.rename_columns(["run", "travel_languages"] + [f"travel_{m}" for m in METRICS + ["delivery_rate"]])
+        shopping_columns = ["weighted_average_case_score", "match_rate", "valid"]
+        if self.shopping_path.exists():
+            shopping = pq.read_table(self.shopping_path).select(["run"] + shopping_columns)
+            shopping = shopping.rename_columns(["run"] + [f"shopping_{name}" for name in shopping_columns])
+            board = board.join(shopping, "run", join_type="full outer")
+        else:
+            for name, kind in (
+                ("weighted_average_case_score", pa.float64()),
+                ("match_rate", pa.float64()),
+                ("valid", pa.bool_()),
+            ):
+                board = board.append_column(f"shopping_{name}", pa.nulls(board.num_rows, kind))
+        avg_acc = pc.divide(
+            pc.add(board.column("shopping_weighted_average_case_score"), board.column("travel_case_acc")), 2.0
+        )
+        board = board.append_column("avg_acc", avg_acc)
+        return board.sort_by([("avg_acc", "descending"), ("travel_case_acc", "descending"), ("run", "ascending")])
+
+    def slice(self, by: str, runs: Optional[Iterable[str]] = None) -> pa.Table:
+        """Metric averages per (run, language, ``by`` value).
+
+        ``by`` is ``days``, ``people_number`` or ``hard_constraint`` (a sample counts once per constraint it declares).
+        """
+        if by not in SLICE_COLUMNS:
+            raise ValueError(f"Unknown slice {by!r}; expected one of {SLICE_COLUMNS}")
+        partitioning = ds.partitioning(pa.schema([("run", pa.string()), ("language", pa.string())]), flavor="hive")
+        dataset = ds.dataset(self.results_path, format="parquet", partitioning=partitioning)
+        results = dataset.to_table(filter=None if runs is None else pc.field("run").isin(list(runs)))
+        if by == "hard_constraint":
+            attributes = _constraint_types(self.constraints)
+        else:
+            attributes = self.constraints.select(SAMPLE_KEYS + [by])
+        joined = results.join(attributes, SAMPLE_KEYS, join_type="inner")
+        joined = joined.append_column("delivered_count", pc.cast(joined.column("delivered"), pa.int64()))
+        table = joined.group_by(["run", "language", by], use_threads=False).aggregate(
+            [([], "count_all"), ("delivered_count", "sum")] + [(metric, "mean") for metric in METRICS]
+        )
+        table = table.select(
+            ["run", "language", by, "count_all", "delivered_count_sum"] + [f"{m}_mean" for m in METRICS]
+        )
+        table = table.rename_columns(["run", "language", by, "samples", "delivered"] + METRICS)
+        return table.sort_by([("run", "ascending"), ("language", "ascending"), (by, "ascending")])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Ingest travel results of many runs and build the DeepPlanning leaderboard"
+    )
+    parser.add_argument("--results-dir", type=Path, default=Path("artifacts/deepplanning_results"))
+    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
+    parser.add_argument(
+        "--ingest", type=Path, nargs="*", default=[], help="Per-sample travel results (.parquet or .jsonl)"
+    )
+    parser.add_argument("--shopping-runs", type=Path, nargs="*", default=[], help="shopping_eval_runs.parquet files")
+    parser.add_argument("--replace", action="store_true", help="Re-ingest runs that are already stored")
+    parser.add_argument("--slice", choices=SLICE_COLUMNS, default=None, help="Also break metrics down by this column")
+    parser.add_argument("--runs", nargs="+", default=None, help="Runs to include in --slice (default: all)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = TravelResultsStore(args.results_dir, args.parquet_dir)
+    report: Dict = {"ingested": [], "skipped": []}
+    for path in args.ingest:
+        outcome = store.ingest(read_results(path), replace=args.replace)
+        report["ingested"].extend(outcome["ingested"])
+        report["skipped"].extend(outcome["skipped"])
+    for path in args.shopping_runs:
+        store.ingest_shopping(pq.read_table(path))
+    report["leaderboard"] = store.leaderboard().to_pylist()
+    if args.slice is not None:
+        report["slice"] = store.slice(args.slice, args.runs).to_pylist()
+    report["seconds"] = round(time.perf_counter() - started, 4)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Named parquet write profiles and a file size / decode time report across them.
+
+``schemas/write_profiles.json`` (next to ``table_contracts.json``) declares:
+
+- ``profiles``: codec, zstd level, data page size, row-group size, whether
+  dictionary encoding applies to every column (``all``, the pyarrow default),
+  only to the declared columns (``declared``) or to none, and whether the
+  declared float columns use BYTE_STREAM_SPLIT.
+- ``tables``: per table, the dictionary and BYTE_STREAM_SPLIT column paths
+  (parquet paths, so nested leaves look like ``product.price`` or
+  ``distance.list.element``; paths missing from a file are ignored, so one
+  declaration covers every ``--json-columns`` mode) and optional per-profile
+  overrides under ``profiles``. ``*`` applies to every table.
+
+``default`` is what the builder always wrote (zstd with pyarrow defaults).
+``write_profile_report`` re-encodes built tables with each profile and
+measures size and a full-scan decode, to choose between small Hub downloads
+and fast local scans.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+WRITE_PROFILES_PATH = Path(__file__).resolve().parent.parent / "schemas" / "write_profiles.json"
+DEFAULT_WRITE_PROFILE = "default"
+DICTIONARY_MODES = ("all", "declared", "none")
+REPORT_FILE = "write_profile_report.json"
+
+
+def _leaf_types(schema: pa.Schema) -> Dict[str, pa.DataType]:
+    """Parquet column path -> Arrow type of every leaf column of ``schema``."""
+    leaves: Dict[str, pa.DataType] = {}
+
+    def visit(path: str, type_: pa.DataType) -> None:
+        if pa.types.is_struct(type_):
+            for i in range(type_.num_fields):
+                visit(f"{path}.{type_.field(i).name}", type_.field(i).type)
+        elif pa.types.is_list(type_) or pa.types.is_large_list(type_):
+            visit(f"{path}.list.element", type_.value_type)
+        else:
+            leaves[path] = type_
+
+    for field in schema:
+        visit(field.name, field.type)
+    return leaves
+
+
+class WriteProfile:
+    """One profile from ``write_profiles.json`` with the per-table column declarations."""
+
+    def __init__(self, name: str, settings: Dict, tables: Dict[str, Dict]) -> None:
+        if settings.get("dictionary", "all") not in DICTIONARY_MODES:
+            raise ValueError(f"Write profile {name!r}: dictionary must be one of {DICTIONARY_MODES}")
+        self.name = name
+        self.settings = settings
+        self.tables = tables
+
+    def table_settings(self, table: str) -> Dict:
+        return {**self.settings, **self.tables.get(table, {}).get("profiles", {}).get(self.name, {})}
+
+    def _declared(self, table: str, key: str) -> List[str]:
+        return self.tables.get("*", {}).get(key, []) + self.tables.get(table, {}).get(key, [])
+
+    def row_group_size(self, table: str, default: int) -> int:
+        return self.table_settings(table).get("row_group_size", default)
+
+    def writer_options(self, table: str, schema: pa.Schema) -> Dict:
+        """Keyword arguments for ``pq.ParquetWriter`` writing ``table`` with ``schema``."""
+        settings = self.table_settings(table)
+        options: Dict = {"compression": settings.get("compression", "zstd")}
+        for key in ("compression_level", "data_page_size"):
+            if key in settings:
+                options[key] = settings[key]
+        leaves = _leaf_types(schema)
+        split: List[str] = []
+        if settings.get("byte_stream_split"):
+            split = [
+                path
+                for path in self._declared(table, "byte_stream_split")
+                if path in leaves and pa.types.is_floating(leaves[path])
+            ]
+        dictionary = settings.get("dictionary", "all")
+        if dictionary == "declared":
+            options["use_dictionary"] = [
+                path for path in self._declared(table, "dictionary") if path in leaves and path not in split
+            ]
+        elif dictionary == "none":
+            options["use_dictionary"] = False
+        elif split:
+            # Dictionary encoding takes precedence over BYTE_STREAM_SPLIT, so leave the split columns out.
+            options["use_dictionary"] = [path for path in leaves if path not in split]
+        if split:
+            options["use_byte_stream_split"] = split
+        return options
+
+
+def load_write_profiles(path: Path = WRITE_PROFILES_PATH) -> Dict[str, WriteProfile]:
+    spec = json.loads(Path(path).read_text(encoding="utf-8"))
+    tables = spec.get("tables", {})
+    return {name: WriteProfile(name, settings, tables) for name, settings in spec["profiles"].items()}
+
+
+def rewrite_parquet(src: Path, dest: Path, profile: WriteProfile, table: Optional[str] = None) -> Dict:
+    """Re-encode one parquet file with ``profile``, streaming fixed-size row groups.
+
+    Profiles without a row-group size keep the source file's (largest) row group size.
+    """
+    table = table or Path(src).stem
+    pf = pq.ParquetFile(src)
+    source_size = max((pf.metadata.row_group(i).num_rows for i in range(pf.metadata.num_row_groups)), default=1)
+    row_group_size = max(profile.row_group_size(table, source_size), 1)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    with pq.ParquetWriter(dest, pf.schema_arrow, **profile.writer_options(table, pf.schema_arrow)) as writer:
+        pending: List[pa.RecordBatch] = []
+        pending_rows = 0
+        for batch in pf.iter_batches(batch_size=row_group_size):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_size:
+                chunk = pa.Table.from_batches(pending)
+                full = pending_rows - pending_rows % row_group_size
+                writer.write_table(chunk.slice(0, full), row_group_size=row_group_size)
+                pending = chunk.slice(full).combine_chunks().to_batches()
+                pending_rows -= full
+        if pending_rows:
+            writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_size)
+    return {
+        "bytes": dest.stat().st_size,
+        "row_groups": pq.ParquetFile(dest).metadata.num_row_groups,
+        "encode_seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+def _decode_seconds(path: Path, repeats: int) -> float:
+    """Best-of-``repeats`` wall time of a full ``pq.read_table`` (warm page cache)."""
+    best = float("inf")
+    for _ in range(max(repeats, 1)):
+        started = time.perf_counter()
+        pq.read_table(path)
+        best = min(best, time.perf_counter() - started)
+    return round(best, 4)
+
+
+def write_profile_report(
+    parquet_dir: Path,
+    profiles: Optional[Iterable[str]] = None,
+    tables: Optional[Iterable[str]] = None,
+    repeats: int = 3,
+    profiles_path: Path = WRITE_PROFILES_PATH,
+) -> Dict:
+    """Re-encode every table (default: all ``*.parquet`` in ``parquet_dir``) with each profile.
+
+    Returns per-table and total file size, row groups, encode time and full-scan
+    decode time per profile. Scratch files go to a temporary directory inside
+    ``parquet_dir`` and are removed afterwards.
+    """
+    parquet_dir = Path(parquet_dir)
+    available = load_write_profiles(profiles_path)
+    names = list(available) if profiles is None else list(profiles)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise KeyError(f"Unknown write profiles {unknown} (declared: {sorted(available)})")
+    table_names = sorted(p.stem for p in parquet_dir.glob("*.parquet")) if tables is None else list(tables)
+
+    report: Dict = {"repeats": repeats, "profiles": {}, "tables": {}}
+    with tempfile.TemporaryDirectory(prefix=".write_profiles_", dir=parquet_dir) as scratch:
+        for table in table_names:
+            src = parquet_dir / f"{table}.parquet"
+            entry = {"rows": pq.ParquetFile(src).metadata.num_rows}
+            for name in names:
+                dest = Path(scratch) / name / f"{table}.parquet"
+                written = rewrite_parquet(src, dest, available[name], table)
+                written["decode_seconds"] = _decode_seconds(dest, repeats)
+                entry[name] = written
+                dest.unlink()
+            report["tables"][table] = entry
+    for name in names:
+        per_table = [entry[name] for entry in report["tables"].values()]
+        report["profiles"][name] = {
+            "bytes": sum(t["bytes"] for t in per_table),
+            "encode_seconds": round(sum(t["encode_seconds"] for t in per_table), 4),
+            "decode_seconds": round(sum(t["decode_seconds"] for t in per_table), 4),
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare parquet write profiles on built DeepPlanning tables")
+    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
+    parser.add_argument("--profiles", nargs="+", default=None, help="Profiles to compare (default: all declared)")
+    parser.add_argument("--tables", nargs="+", default=None, help="Table names (default: every *.parquet)")
+    parser.add_argument("--repeats", type=int, default=3, help="Full-scan decodes per file; the best is kept")
+    parser.add_argument("--out", type=Path, default=None, help=f"Report path (default: <parquet-dir>/{REPORT_FILE})")
+    args = parser.parse_args()
+
+    report = write_profile_report(args.parquet_dir, args.profiles, args.tables, args.repeats)
+    out = args.out or args.parquet_dir / REPORT_FILE
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps({"report": str(out), "profiles": report["profiles"]}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,16 @@ from __future__ import annotations
 import argparse
 import json
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional
 
+import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 
+from deepplanning_nested import expand_json_column
+
+TABLE_CONTRACTS_PATH = Path(__file__).resolve().parent.parent / "schemas" / "table_contracts.json"
+
 REQUIRED_TABLES = [
     "shopping_queries.parquet",
     "shopping_cases.parquet",
@@ -26,71 +32,385 @@ REQUIRED_TABLES = [
     "travel_db_locations.parquet",
 ]
 
+# Required table -> tables that replace it in an alternative layout (--catalog-layout dedup).
+REQUIRED_ALTERNATIVES = {
+    "shopping_catalog.parquet": ["shopping_catalog_membership.parquet", "shopping_products.parquet"],
+}
+
+# Child table -> parent table whose primary keys every child row must reference.
+# travel_db_* tables are attached to travel_constraints in _parent_tables().
+PARENT_TABLES = {
+    "shopping_cases.parquet": "shopping_queries.parquet",
+    "shopping_gt_products.parquet": "shopping_cases.parquet",
+    "shopping_gt_coupons.parquet": "shopping_cases.parquet",
+    "shopping_catalog.parquet": "shopping_cases.parquet",
+    "shopping_catalog_membership.parquet": "shopping_cases.parquet",
+    "shopping_user_info.parquet": "shopping_cases.parquet",
+    "shopping_initial_cart.parquet": "shopping_cases.parquet",
+    "travel_constraints.parquet": "travel_queries.parquet",
+}
+
+# Child table -> (parent table, columns) for references that are not domain keys.
+CONTENT_REFERENCES = {
+    "shopping_catalog_membership.parquet": ("shopping_products.parquet", ["product_hash"]),
+}
+
+# Extra columns that, together with the domain primary keys, identify one row.
+UNIQUE_KEY_SUFFIXES = {
+    "shopping_queries.parquet": [],
+    "shopping_cases.parquet": [],
+    "shopping_user_info.parquet": [],
+    "shopping_initial_cart.parquet": [],
+    "shopping_gt_products.parquet": ["gt_index"],
+    "shopping_gt_coupons.parquet": ["coupon_name"],
+    "shopping_catalog.parquet": ["row_id"],
+    "shopping_catalog_membership.parquet": ["row_id"],
+    "shopping_products.parquet": [],
+    "travel_queries.parquet": [],
+    "travel_constraints.parquet": [],
+    "travel_db_transportation_dense.parquet": [],
+}
+
+SAMPLE_LIMIT = 20
+
 
 def row_count(path: Path) -> int:
     return pq.ParquetFile(path).metadata.num_rows
 
 
-def load_col(path: Path, col: str) -> List[str]:
-    t = pq.read_table(path, columns=[col])
-    return [str(x) for x in t.column(0).to_pylist()]
+def load_contracts(path: Path = TABLE_CONTRACTS_PATH) -> Dict:
+    return json.loads(path.read_text(encoding="utf-8"))
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Validate DeepPlanning parquet artifacts")
-    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
-    args = parser.parse_args()
+def _keys_for_table(spec: Dict, table: str) -> List[str]:
+    shared = spec.get("shared_tables", {}).get(table)
+    return list(shared["primary_keys"] if shared is not None else spec["primary_keys"])
+
+
+def primary_keys_by_table(contracts: Dict) -> Dict[str, List[str]]:
+    return {
+        table: _keys_for_table(spec, table)
+        for spec in contracts.values()
+        for table in list(spec["tables"]) + list(spec.get("shared_tables", {}))
+    }
+
+
+def _is_missing(parquet_dir: Path, table: str) -> bool:
+    if (parquet_dir / table).exists():
+        return False
+    alternatives = REQUIRED_ALTERNATIVES.get(table)
+    return not alternatives or not all((parquet_dir / alt).exists() for alt in alternatives)
+
+
+def _parent_tables(present: List[str]) -> Dict[str, str]:
+    parents = {child: parent for child, parent in PARENT_TABLES.items() if child in present and parent in present}
+    if "travel_constraints.parquet" in present:
+        for table in present:
+            if table.startswith("travel_db_"):
+                parents[table] = "travel_constraints.parquet"
+    return parents
 
-    if not args.parquet_dir.exists():
-        raise FileNotFoundError(args.parquet_dir)
 
-    missing = [t for t in REQUIRED_TABLES if not (args.parquet_dir / t).exists()]
+def iter_key_row_groups(path: Path, columns: List[str]) -> Iterator[pa.Table]:
+    """Yield only the requested columns, one row group at a time."""
+    pf = pq.ParquetFile(path, memory_map=True)
+    missing = [c for c in columns if c not in pf.schema_arrow.names]
     if missing:
-        raise RuntimeError(f"Missing required tables: {missing}")
+        if pf.metadata.num_rows:
+            raise RuntimeError(f"{path.name} is missing key columns {missing}")
+        return
+    for rg in range(pf.metadata.num_row_groups):
+        yield pf.read_row_group(rg, columns=columns)
 
-    report: Dict = {"tables": {}, "checks": {}}
-    for t in REQUIRED_TABLES:
-        path = args.parquet_dir / t
-        report["tables"][t] = {"rows": row_count(path)}
 
-    shopping_case_ids = set(load_col(args.parquet_dir / "shopping_cases.parquet", "case_id"))
-    shopping_query_ids = set(load_col(args.parquet_dir / "shopping_queries.parquet", "case_id"))
+def _format_keys(table: pa.Table, limit: int = SAMPLE_LIMIT) -> List[str]:
+    rows = table.slice(0, limit).to_pylist()
+    return [":".join(str(v) for v in row.values()) for row in rows]
+
+
+def load_key_set(path: Path, keys: List[str]) -> pa.Table:
+    """Distinct key tuples of a (parent) table."""
+    distinct: Optional[pa.Table] = None
+    for rg in iter_key_row_groups(path, keys):
+        parts = [rg] if distinct is None else [distinct, rg]
+        distinct = pa.concat_tables(parts).group_by(keys, use_threads=False).aggregate([])
+    if distinct is None:
+        schema = pq.read_schema(path)
+        return pa.schema(schema.field(k) if k in schema.names else pa.field(k, pa.string()) for k in keys).empty_table()
+    return distinct
+
+
+def check_references(child: Path, parent_keys: pa.Table, keys: List[str]) -> Dict:
+    """Anti-join every child row group against the parent key set and count orphans."""
+    rows = 0
+    orphan_rows = 0
+    orphan_keys: Optional[pa.Table] = None
+    for rg in iter_key_row_groups(child, keys):
+        rows += rg.num_rows
+        orphans = rg.join(parent_keys, keys=keys, join_type="left anti", use_threads=True)
+        if orphans.num_rows:
+            orphan_rows += orphans.num_rows
+            distinct = orphans.group_by(keys, use_threads=False).aggregate([])
+            parts = [distinct] if orphan_keys is None else [orphan_keys, distinct]
+            orphan_keys = pa.concat_tables(parts).group_by(keys, use_threads=False).aggregate([])
+    return {
+        "ok": orphan_rows == 0,
+        "rows": rows,
+        "orphan_rows": orphan_rows,
+        "orphan_keys": 0 if orphan_keys is None else orphan_keys.num_rows,
+        "sample_orphan_keys": [] if orphan_keys is None else _format_keys(orphan_keys),
+    }
+
+
+def check_uniqueness(path: Path, keys: List[str]) -> Dict:
+    """Count key tuples that occur more than once.
+
+    Per-row-group counts are folded into a running (key, count) table, so only
+    key columns are ever held in memory.
+    """
+    counts: Optional[pa.Table] = None
+    for rg in iter_key_row_groups(path, keys):
+        partial = rg.group_by(keys, use_threads=False).aggregate([([], "count_all")]).rename_columns(keys + ["n"])
+        if counts is not None:
+            partial = (
+                pa.concat_tables([counts, partial])
+                .group_by(keys, use_threads=False)
+                .aggregate([("n", "sum")])
+                .rename_columns(keys + ["n"])
+            )
+        counts = partial
+    if counts is None:
+        return {"ok": True, "keys": keys, "duplicate_keys": 0, "duplicate_rows": 0, "sample_duplicate_keys": []}
+    dupes = counts.filter(pc.greater(counts.column("n"), 1))
+    duplicate_rows = pc.sum(dupes.column("n")).as_py() or 0
+    return {
+        "ok": dupes.num_rows == 0,
+        "keys": keys,
+        "duplicate_keys": dupes.num_rows,
+        "duplicate_rows": duplicate_rows,
+        "sample_duplicate_keys": _format_keys(dupes.select(keys)),
+    }
+
+
+def _leaf_index(metadata: pq.FileMetaData, column: str) -> Optional[int]:
+    for idx in range(metadata.num_columns):
+        if metadata.schema.column(idx).path == column:
+            return idx
+    return None
+
+
+def _declared_columns(declared: Dict[str, str], json_columns: str) -> Dict[str, str]:
+    """Contract columns as written by ``--json-columns``; native nested columns accept any type."""
+    columns: Dict[str, str] = {}
+    for name, alias in declared.items():
+        for column in expand_json_column(name, json_columns):
+            columns[column] = alias if column == name else "any"
+    return columns
 
-    travel_query_ids = set(
-        f"{lang}:{sid}"
-        for lang, sid in zip(
-            load_col(args.parquet_dir / "travel_queries.parquet", "language"),
-            load_col(args.parquet_dir / "travel_queries.parquet", "sample_id"),
-        )
-    )
-    travel_constraint_ids = set(
-        f"{lang}:{sid}"
-        for lang, sid in zip(
-            load_col(args.parquet_dir / "travel_constraints.parquet", "language"),
-            load_col(args.parquet_dir / "travel_constraints.parquet", "sample_id"),
-        )
-    )
 
+def check_contract(
+    path: Path,
+    table: str,
+    domain_spec: Dict,
+    manifest_rows: Optional[int],
+    json_columns: str = "string",
+) -> Dict:
+    """Check one table against table_contracts.json using only the parquet footer.
+
+    Covers column names/order and types, row count against manifest.json, and
+    null counts plus min/max of every primary key from row-group statistics.
+    No data page is read.
+    """
+    pf = pq.ParquetFile(path)
+    metadata = pf.metadata
+    schema = pf.schema_arrow
+    errors: List[str] = []
+    warnings: List[str] = []
+
+    if manifest_rows is not None and manifest_rows != metadata.num_rows:
+        errors.append(f"row count {metadata.num_rows} != manifest {manifest_rows}")
+
+    declared = domain_spec.get("columns", {}).get(table)
+    if metadata.num_rows == 0 and not schema.names:
+        warnings.append("empty table without columns")
+    elif declared is None:
+        warnings.append("no declared columns")
+    else:
+        declared = _declared_columns(declared, json_columns)
+        for name, alias in declared.items():
+            if name not in schema.names:
+                errors.append(f"missing column {name}")
+            elif alias != "any" and schema.field(name).type != pa.type_for_alias(alias):
+                errors.append(f"column {name} is {schema.field(name).type}, expected {alias}")
+        if table not in domain_spec.get("open_schema_tables", []):
+            extra = [name for name in schema.names if name not in declared]
+            if extra:
+                errors.append(f"undeclared columns {extra}")
+            elif list(schema.names) != [name for name in declared if name in schema.names]:
+                errors.append("column order differs from contract")
+
+    key_ranges: Dict[str, Dict] = {}
+    for key in _keys_for_table(domain_spec, table):
+        idx = _leaf_index(metadata, key)
+        if idx is None:
+            continue
+        null_count = 0
+        mins, maxs = [], []
+        complete = True
+        for rg in range(metadata.num_row_groups):
+            stats = metadata.row_group(rg).column(idx).statistics
+            if stats is None or not stats.has_min_max or not stats.has_null_count:
+                complete = complete and metadata.row_group(rg).num_rows == 0
+                continue
+            null_count += stats.null_count
+            mins.append(stats.min)
+            maxs.append(stats.max)
+        entry: Dict = {"null_count": null_count, "min": min(mins) if mins else None, "max": max(maxs) if maxs else None}
+        if not complete:
+            entry["statistics"] = "incomplete"
+            warnings.append(f"row-group statistics missing for {key}")
+        if null_count:
+            errors.append(f"{null_count} null values in key column {key}")
+        allowed = domain_spec.get("key_values", {}).get(key)
+        if allowed and mins and (entry["min"] < min(allowed) or entry["max"] > max(allowed)):
+            errors.append(f"{key} range [{entry['min']}, {entry['max']}] outside {allowed}")
+        key_ranges[key] = entry
+
+    return {
+        "ok": not errors,
+        "rows": metadata.num_rows,
+        "row_groups": metadata.num_row_groups,
+        "key_ranges": key_ranges,
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+def check_contracts(parquet_dir: Path, contracts: Dict, manifest: Dict) -> Dict[str, Dict]:
+    manifest_tables = manifest.get("tables", {})
+    results: Dict[str, Dict] = {}
+    for domain_spec in contracts.values():
+        for table in list(domain_spec["tables"]) + list(domain_spec.get("shared_tables", {})):
+            name = table[: -len(".parquet")]
+            path = parquet_dir / table
+            if path.exists():
+                results[table] = check_contract(
+                    path, table, domain_spec, manifest_tables.get(name), manifest.get("json_columns", "string")
+                )
+            elif name in manifest_tables or (table in REQUIRED_TABLES and _is_missing(parquet_dir, table)):
+                results[table] = {"ok": False, "errors": ["file missing"], "warnings": []}
+    return results
+
+
+def _run_data_checks(parquet_dir: Path, present: List[str], table_keys: Dict[str, List[str]], report: Dict) -> None:
+    key_sets: Dict[str, pa.Table] = {}
+    references: Dict[str, Dict] = {}
+    for child, parent in _parent_tables(present).items():
+        keys = table_keys[child]
+        if parent not in key_sets:
+            key_sets[parent] = load_key_set(parquet_dir / parent, keys)
+        references[child] = {"parent": parent, **check_references(parquet_dir / child, key_sets[parent], keys)}
+    for child, (parent, keys) in CONTENT_REFERENCES.items():
+        if child in present and parent in present:
+            parent_keys = load_key_set(parquet_dir / parent, keys)
+            references[f"{child}:{','.join(keys)}"] = {
+                "parent": parent,
+                **check_references(parquet_dir / child, parent_keys, keys),
+            }
+    report["checks"]["referential_integrity"] = references
+
+    report["checks"]["key_uniqueness"] = {
+        t: check_uniqueness(parquet_dir / t, table_keys[t] + suffix)
+        for t, suffix in UNIQUE_KEY_SUFFIXES.items()
+        if t in present
+    }
+
+    shopping_cases = references["shopping_cases.parquet"]
     report["checks"]["shopping_query_case_overlap"] = {
-        "ok": shopping_case_ids.issubset(shopping_query_ids),
-        "shopping_cases": len(shopping_case_ids),
-        "shopping_queries": len(shopping_query_ids),
-        "missing_case_ids": sorted(list(shopping_case_ids - shopping_query_ids))[:20],
+        "ok": shopping_cases["ok"],
+        "shopping_cases": key_sets["shopping_cases.parquet"].num_rows,
+        "shopping_queries": key_sets["shopping_queries.parquet"].num_rows,
+        # Bare case ids (what this field always held); the full domain:level:case_id keys go in missing_keys.
+        "missing_case_ids": sorted({key.split(":", 2)[2] for key in shopping_cases["sample_orphan_keys"]}),
+        "missing_keys": shopping_cases["sample_orphan_keys"],
     }
+    travel_constraints = references["travel_constraints.parquet"]
     report["checks"]["travel_query_constraint_overlap"] = {
-        "ok": travel_constraint_ids.issubset(travel_query_ids),
-        "travel_constraints": len(travel_constraint_ids),
-        "travel_queries": len(travel_query_ids),
-        "missing_ids": sorted(list(travel_constraint_ids - travel_query_ids))[:20],
+        "ok": travel_constraints["ok"],
+        "travel_constraints": key_sets["travel_constraints.parquet"].num_rows,
+        "travel_queries": key_sets["travel_queries.parquet"].num_rows,
+        "missing_ids": sorted({key.split(":", 1)[1] for key in travel_constraints["sample_orphan_keys"]}),
+        "missing_keys": travel_constraints["sample_orphan_keys"],
     }
 
-    manifest_path = args.parquet_dir / "manifest.json"
-    if manifest_path.exists():
-        report["manifest"] = json.loads(manifest_path.read_text(encoding="utf-8"))
 
-    out = args.parquet_dir / "validation_report.json"
+def validate_parquet_dir(parquet_dir: Path, fast: bool = False) -> Dict:
+    """Run the contract check, plus the data-page checks unless ``fast``, and return the report."""
+    if not parquet_dir.exists():
+        raise FileNotFoundError(parquet_dir)
+
+    missing = [t for t in REQUIRED_TABLES if _is_missing(parquet_dir, t)]
+    if missing:
+        raise RuntimeError(f"Missing required tables: {missing}")
+
+    contracts = load_contracts()
+    table_keys = primary_keys_by_table(contracts)
+    present = [t for t in table_keys if (parquet_dir / t).exists()]
+
+    manifest_path = parquet_dir / "manifest.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest_path.exists() else {}
+
+    report: Dict = {"mode": "fast" if fast else "full", "tables": {}, "checks": {}}
+    for t in present:
+        path = parquet_dir / t
+        report["tables"][t] = {"rows": row_count(path)}
+
+    report["checks"]["contract"] = check_contracts(parquet_dir, contracts, manifest)
+    check_groups = ["contract"]
+
+    if not fast:
+        _run_data_checks(parquet_dir, present, table_keys, report)
+        check_groups += ["referential_integrity", "key_uniqueness"]
+
+    if manifest:
+        report["manifest"] = manifest
+
+    failed = sorted(
+        f"{group}:{name}"
+        for group in check_groups
+        for name, check in report["checks"][group].items()
+        if not check["ok"]
+    )
+    report["status"] = "failed" if failed else "ok"
+    report["failed_checks"] = failed
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Validate DeepPlanning parquet artifacts")
+    parser.add_argument("--parquet-dir", type=Path, default=Path("artifacts/deepplanning_parquet"))
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Footer-only contract check (schema, types, key stats, manifest row counts); reads no data pages",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        default=None,
+        help="Report path (default: validation_report.json, or validation_report_fast.json with --fast)",
+    )
+    args = parser.parse_args()
+
+    report = validate_parquet_dir(args.parquet_dir, args.fast)
+    failed = report["failed_checks"]
+
+    default_report = "validation_report_fast.json" if args.fast else "validation_report.json"
+    out = args.report or args.parquet_dir / default_report
     out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(json.dumps({"status": "ok", "report": str(out)}, ensure_ascii=False))
+    print(json.dumps({"status": report["status"], "failed_checks": failed, "report": str(out)}, ensure_ascii=False))
+    if failed:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
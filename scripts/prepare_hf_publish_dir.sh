@@ -4,10 +4,46 @@ set -euo pipefail
 PARQUET_DIR="${1:-artifacts/deepplanning_parquet}"
 PUBLISH_DIR="${2:-hf_publish}"
 CARD_FILE="${3:-hf/README.dataset_card.md}"
+# How parquet files are staged: reflink (copy-on-write clone), hardlink, copy,
+# or auto (the first of those the filesystem supports). Reflinks and hardlinks
+# take no extra disk. A hardlink shares the build output's inode: this is safe
+# with build_deepplanning_parquet.py, which writes <table>.parquet.tmp and
+# renames it over the old file, but any tool that rewrites files in
+# PARQUET_DIR in place also changes the staged copy (use reflink or copy then).
+STAGE_MODE="${STAGE_MODE:-auto}"
+
+reflink() {
+  if [ "$(uname)" = "Darwin" ]; then
+    cp -c -p "$1" "$2"
+  else
+    cp --reflink=always -p "$1" "$2"
+  fi
+}
+
+stage() {
+  rm -f "$2"
+  case "$STAGE_MODE" in
+    reflink) reflink "$1" "$2" ;;
+    hardlink) ln "$1" "$2" ;;
+    copy) cp -p "$1" "$2" ;;
+    # A failed clone can leave an empty destination behind, so remove it before falling back.
+    auto) reflink "$1" "$2" 2>/dev/null || { rm -f "$2" && ln "$1" "$2" 2>/dev/null; } || { rm -f "$2" && cp -p "$1" "$2"; } ;;
+    *)
+      echo "Unknown STAGE_MODE: $STAGE_MODE (reflink|hardlink|copy|auto)" >&2
+      exit 2
+      ;;
+  esac
+}
 
 mkdir -p "$PUBLISH_DIR"
 cp -f "$CARD_FILE" "$PUBLISH_DIR/README.md"
-cp -f "$PARQUET_DIR"/*.parquet "$PUBLISH_DIR/"
+for src in "$PARQUET_DIR"/*.parquet; do
+  stage "$src" "$PUBLISH_DIR/$(basename "$src")"
+done
+# Tables no longer built (e.g. after a layout change) are dropped, so the next publish deletes them on the Hub.
+for staged in "$PUBLISH_DIR"/*.parquet; do
+  [ -e "$PARQUET_DIR/$(basename "$staged")" ] || rm -f "$staged"
+done
 cp -f "$PARQUET_DIR"/manifest.json "$PUBLISH_DIR/" || true
 cp -f "$PARQUET_DIR"/validation_report.json "$PUBLISH_DIR/" || true
 
@@ -16,4 +52,4 @@ cat > "$PUBLISH_DIR/.gitattributes" <<'EOF'
 *.json filter=lfs diff=lfs merge=lfs -text
 EOF
 
-echo "Prepared HF publish dir: $PUBLISH_DIR"
+echo "Prepared HF publish dir: $PUBLISH_DIR (parquet staged with STAGE_MODE=$STAGE_MODE)"
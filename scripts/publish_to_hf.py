@@ -1,12 +1,225 @@
 #!/usr/bin/env python3
-"""Create/update HF dataset repo and upload parquet folder."""
+"""Create/update HF dataset repo and upload the files that changed since the last release.
+
+Every release uploads ``release_manifest.json`` (path -> sha256/size of every
+file in the publish dir). The next publish downloads the previous one, hashes
+the staged files and commits only new/changed files plus deletions of files
+that are gone, in one commit whose parent is the release it was diffed
+against. LFS uploads inside the commit run on ``--num-threads`` threads.
+
+``--local-hub DIR`` swaps ``HfApi`` for ``LocalHubApi``, a directory-backed
+stand-in, so the diff and commit logic can be checked offline.
+"""
 
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional
+
+from huggingface_hub import CommitOperationAdd, CommitOperationDelete, HfApi
+from huggingface_hub.utils import EntryNotFoundError
+
+RELEASE_MANIFEST = "release_manifest.json"
+HASH_CACHE = Path(".cache") / "publish_hashes.json"
+SKIPPED_DIRS = {".git", ".cache"}
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _release_files(source_dir: Path) -> List[str]:
+    return sorted(
+        p.relative_to(source_dir).as_posix()
+        for p in source_dir.rglob("*")
+        if p.is_file()
+        and not SKIPPED_DIRS.intersection(p.relative_to(source_dir).parts)
+        and p.relative_to(source_dir).as_posix() != RELEASE_MANIFEST
+    )
+
 
-from huggingface_hub import HfApi
+def local_release(source_dir: Path, workers: int = 4) -> Dict[str, Dict]:
+    """sha256/size of every file to publish, reusing cached digests when size and mtime are unchanged.
+
+    Staged files are hardlinks/reflinks of the build output, so tables the
+    builder skipped keep their mtime and are not hashed again.
+    """
+    cache_path = source_dir / HASH_CACHE
+    cache = json.loads(cache_path.read_text(encoding="utf-8")) if cache_path.exists() else {}
+    stats = {path: (source_dir / path).stat() for path in _release_files(source_dir)}
+
+    def digest(path: str) -> str:
+        prev = cache.get(path, {})
+        if prev.get("size") == stats[path].st_size and prev.get("mtime_ns") == stats[path].st_mtime_ns:
+            return prev["sha256"]
+        return _sha256_file(source_dir / path)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        digests = dict(zip(stats, pool.map(digest, stats)))
+    cache = {
+        path: {"sha256": digests[path], "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        for path, stat in stats.items()
+    }
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+    return {path: {"sha256": digests[path], "size": stats[path].st_size} for path in stats}
+
+
+def previous_release(api, repo_id: str, revision: Optional[str]) -> Dict[str, Dict]:
+    """Files of the release manifest at ``revision`` ({} for a repo never published with a manifest)."""
+    try:
+        path = api.hf_hub_download(repo_id, RELEASE_MANIFEST, repo_type="dataset", revision=revision)
+    except EntryNotFoundError:
+        return {}
+    return json.loads(Path(path).read_text(encoding="utf-8"))["files"]
+
+
+def plan_release(current: Dict[str, Dict], previous: Dict[str, Dict]) -> Dict[str, List[str]]:
+    return {
+        "upload": sorted(p for p, entry in current.items() if previous.get(p, {}).get("sha256") != entry["sha256"]),
+        "delete": sorted(p for p in previous if p not in current),
+        "unchanged": sorted(p for p, entry in current.items() if previous.get(p, {}).get("sha256") == entry["sha256"]),
+    }
+
+
+def publish(
+    api,
+    repo_id: str,
+    source_dir: Path,
+    commit_message: str,
+    private: bool = False,
+    num_threads: int = 8,
+    dry_run: bool = False,
+) -> Dict:
+    """Commit the delta between ``source_dir`` and the repo's last release; ``dry_run`` only plans."""
+    if dry_run and not api.repo_exists(repo_id, repo_type="dataset"):
+        parent = None
+    else:
+        if not dry_run:
+            api.create_repo(repo_id=repo_id, repo_type="dataset", private=private, exist_ok=True)
+        parent = api.repo_info(repo_id, repo_type="dataset").sha
+    previous = previous_release(api, repo_id, parent) if parent is not None else {}
+    current = local_release(source_dir, num_threads)
+    plan = plan_release(current, previous)
+    summary = {
+        "repo_id": repo_id,
+        "parent_commit": parent,
+        **plan,
+        "upload_bytes": sum(current[p]["size"] for p in plan["upload"]),
+        "commit": None,
+    }
+    if dry_run or not (plan["upload"] or plan["delete"]):
+        return summary
+
+    manifest = {"files": current}
+    (source_dir / RELEASE_MANIFEST).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    operations: List = [CommitOperationAdd(path_in_repo=p, path_or_fileobj=str(source_dir / p)) for p in plan["upload"]]
+    operations += [CommitOperationDelete(path_in_repo=p) for p in plan["delete"]]
+    operations.append(
+        CommitOperationAdd(path_in_repo=RELEASE_MANIFEST, path_or_fileobj=str(source_dir / RELEASE_MANIFEST))
+    )
+    info = api.create_commit(
+        repo_id,
+        operations,
+        commit_message=commit_message,
+        repo_type="dataset",
+        num_threads=num_threads,
+        parent_commit=parent,
+    )
+    summary["commit"] = info.commit_url
+    return summary
+
+
+class LocalHubApi:
+    """Directory-backed stand-in for the ``HfApi`` calls ``publish`` makes.
+
+    ``<root>/<repo_id>/files`` holds the head tree, ``HEAD`` the head commit id
+    and ``commits.jsonl`` one line per commit (operations, parent). Commits are
+    rejected when ``parent_commit`` is not the head, like the Hub does.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def _repo(self, repo_id: str) -> Path:
+        return self.root / repo_id
+
+    def _head(self, repo_id: str) -> str:
+        return (self._repo(repo_id) / "HEAD").read_text(encoding="utf-8").strip()
+
+    def repo_exists(self, repo_id: str, repo_type: Optional[str] = None) -> bool:
+        return (self._repo(repo_id) / "HEAD").exists()
+
+    def create_repo(self, repo_id: str, repo_type: Optional[str] = None, private: bool = False, exist_ok: bool = False):
+        if self.repo_exists(repo_id):
+            if not exist_ok:
+                raise FileExistsError(repo_id)
+        else:
+            (self._repo(repo_id) / "files").mkdir(parents=True, exist_ok=True)
+            (self._repo(repo_id) / "HEAD").write_text(
+                hashlib.sha1(repo_id.encode("utf-8")).hexdigest(), encoding="utf-8"
+            )
+        return f"local://{repo_id}"
+
+    def repo_info(self, repo_id: str, repo_type: Optional[str] = None, revision: Optional[str] = None):
+        return SimpleNamespace(id=repo_id, sha=self._head(repo_id))
+
+    def hf_hub_download(
+        self, repo_id: str, filename: str, repo_type: Optional[str] = None, revision: Optional[str] = None
+    ) -> str:
+        if revision is not None and revision != self._head(repo_id):
+            raise ValueError(f"LocalHubApi only serves the head revision, not {revision}")
+        path = self._repo(repo_id) / "files" / filename
+        if not path.is_file():
+            raise EntryNotFoundError(f"{filename} not found in {repo_id}")
+        return str(path)
+
+    def create_commit(
+        self,
+        repo_id: str,
+        operations: Iterable,
+        commit_message: str,
+        repo_type: Optional[str] = None,
+        num_threads: int = 5,
+        parent_commit: Optional[str] = None,
+    ):
+        head = self._head(repo_id)
+        if parent_commit is not None and parent_commit != head:
+            raise ValueError(f"parent_commit {parent_commit} is not the head of {repo_id} ({head})")
+        files = self._repo(repo_id) / "files"
+        log: List[Dict] = []
+        digest = hashlib.sha1(head.encode("utf-8"))
+        for op in operations:
+            dest = files / op.path_in_repo
+            if isinstance(op, CommitOperationDelete):
+                dest.unlink()
+                log.append({"delete": op.path_in_repo})
+            else:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                tmp = dest.with_name(dest.name + ".tmp")
+                if isinstance(op.path_or_fileobj, bytes):
+                    tmp.write_bytes(op.path_or_fileobj)
+                else:
+                    shutil.copyfile(op.path_or_fileobj, tmp)
+                os.replace(tmp, dest)
+                log.append({"add": op.path_in_repo, "size": dest.stat().st_size})
+            digest.update(json.dumps(log[-1], sort_keys=True).encode("utf-8"))
+        oid = digest.hexdigest()
+        with (self._repo(repo_id) / "commits.jsonl").open("a", encoding="utf-8") as f:
+            f.write(json.dumps({"oid": oid, "parent": head, "message": commit_message, "operations": log}) + "\n")
+        (self._repo(repo_id) / "HEAD").write_text(oid, encoding="utf-8")
+        return SimpleNamespace(oid=oid, commit_url=f"local://{repo_id}/commit/{oid}")
 
 
 def main() -> None:
@@ -16,23 +229,25 @@ def main() -> None:
     parser.add_argument("--source-dir", type=Path, default=Path("hf_publish"), help="Folder to upload")
     parser.add_argument("--private", action="store_true", help="Create private dataset repo")
     parser.add_argument("--commit-message", default="Upload DeepPlanning parquet standardized dataset")
+    parser.add_argument("--num-threads", type=int, default=8, help="Parallel file hashing / LFS uploads")
+    parser.add_argument("--dry-run", action="store_true", help="Print what would be uploaded/deleted, commit nothing")
+    parser.add_argument(
+        "--local-hub",
+        type=Path,
+        default=None,
+        help="Publish into a local directory-backed stand-in for the Hub instead (offline checks)",
+    )
     args = parser.parse_args()
 
     if not args.source_dir.exists():
         raise FileNotFoundError(args.source_dir)
 
     repo_id = f"{args.username}/{args.dataset_name}"
-    api = HfApi()
-    api.create_repo(repo_id=repo_id, repo_type="dataset", private=args.private, exist_ok=True)
-
-    api.upload_folder(
-        repo_id=repo_id,
-        repo_type="dataset",
-        folder_path=str(args.source_dir),
-        commit_message=args.commit_message,
-    )
-
-    print(f"Uploaded dataset to: https://huggingface.co/datasets/{repo_id}")
+    api = HfApi() if args.local_hub is None else LocalHubApi(args.local_hub)
+    summary = publish(api, repo_id, args.source_dir, args.commit_message, args.private, args.num_threads, args.dry_run)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if summary["commit"] is not None and args.local_hub is None:
+        print(f"Uploaded dataset to: https://huggingface.co/datasets/{repo_id}")
 
 
 if __name__ == "__main__":
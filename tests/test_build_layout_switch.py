@@ -0,0 +1,80 @@
+"""Rebuilding into the same directories with other layouts/flags removes the tables they no longer write."""
+
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ETL_DIR = Path(__file__).resolve().parent.parent / "etl"
+sys.path.insert(0, str(ETL_DIR))
+
+from deepplanning_store import DeepPlanningStore  # noqa: E402
+from deepplanning_synthetic import generate  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory) -> dict:
+    return generate(tmp_path_factory.mktemp("synthetic"))
+
+
+def _build(inputs: dict, out_dir: Path, *flags: str) -> dict:
+    cmd = [
+        sys.executable,
+        str(ETL_DIR / "build_deepplanning_parquet.py"),
+        "--skip-download",
+        "--qwen-agent-root",
+        inputs["qwen_agent_root"],
+        "--raw-cache-dir",
+        inputs["raw_cache_dir"],
+        "--out-dir",
+        str(out_dir / "parquet"),
+        "--partitioned-dir",
+        str(out_dir / "partitioned"),
+        "--ipc-companions",
+        "uncompressed",
+        *flags,
+    ]
+    done = subprocess.run(cmd, check=True, capture_output=True, text=True, cwd=ETL_DIR)
+    return json.loads(done.stdout)
+
+
+def _on_disk(out_dir: Path, table: str) -> list:
+    paths = [
+        out_dir / "parquet" / f"{table}.parquet",
+        out_dir / "parquet" / "ipc" / f"{table}.arrow",
+        out_dir / "partitioned" / table,
+    ]
+    return [p for p in paths if p.exists()]
+
+
+def test_distance_layout_and_flag_switches_remove_stale_tables(inputs: dict, tmp_path: Path):
+    first = _build(inputs, tmp_path, "--include-distance-matrix", "--distance-matrix-layout", "long")
+    assert first["removed"] == []
+    assert len(_on_disk(tmp_path, "travel_db_transportation")) == 3
+
+    second = _build(inputs, tmp_path, "--include-distance-matrix", "--distance-matrix-layout", "dense")
+    assert _on_disk(tmp_path, "travel_db_transportation") == []
+    assert len(second["removed"]) == 3
+    assert len(_on_disk(tmp_path, "travel_db_transportation_dense")) == 3
+
+    store = DeepPlanningStore(tmp_path / "parquet", index_path=tmp_path / "index.json")
+    sample = store.travel_sample("en", store.keys("travel")[0][2])
+    assert "travel_db_transportation" not in sample
+    assert sample["travel_db_transportation_dense"].num_rows == 1
+
+    third = _build(inputs, tmp_path)
+    assert _on_disk(tmp_path, "travel_db_transportation_dense") == []
+    assert len(third["removed"]) == 3
+
+
+def test_catalog_layout_switch_removes_flat_catalog(inputs: dict, tmp_path: Path):
+    _build(inputs, tmp_path)
+    assert len(_on_disk(tmp_path, "shopping_catalog")) == 3
+
+    _build(inputs, tmp_path, "--catalog-layout", "dedup")
+    assert _on_disk(tmp_path, "shopping_catalog") == []
+    assert len(_on_disk(tmp_path, "shopping_catalog_membership")) == 3
@@ -0,0 +1,65 @@
+"""Streaming shopping cases out of database_level{n}.tar.gz (etl/build_deepplanning_parquet.py)."""
+
+from __future__ import annotations
+
+import io
+import os
+import sys
+import tarfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+
+from build_deepplanning_parquet import _iter_tar_cases  # noqa: E402
+
+FILES = ["products.jsonl", "user_info.json", "cart.json"]
+
+
+def _make_tar(path: Path, members: list, padding: int = 0) -> Path:
+    with tarfile.open(path, "w:gz") as tf:
+        for num, name in members:
+            data = f"case {num} {name}".encode("utf-8") + os.urandom(padding)
+            info = tarfile.TarInfo(f"database_level1/case_{num}/{name}")
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return path
+
+
+def _case_order(cases) -> list:
+    return [case_id for case_id, files in cases if sorted(files.files) == sorted(FILES)]
+
+
+def test_cases_in_order_are_handed_out_before_the_pass_ends(tmp_path: Path):
+    members = [(n, name) for n in (1, 2, 3, 4) for name in FILES]
+    archive = _make_tar(tmp_path / "level1.tar.gz", members, padding=4096)
+    data = archive.read_bytes()
+    # Cut the archive inside case 4: cases 1-3 must still come out before the stream fails.
+    (tmp_path / "cut.tar.gz").write_bytes(data[: len(data) * 7 // 8])
+
+    seen = []
+    with pytest.raises((EOFError, tarfile.ReadError)):
+        for case_id, _ in _iter_tar_cases(tmp_path / "cut.tar.gz", ["1", "2", "3", "4"]):
+            seen.append(case_id)
+    assert seen == ["1", "2", "3"]
+
+
+def test_archive_order_falls_back_to_buffering(tmp_path: Path):
+    members = [(n, name) for n in (1, 10, 2, 3) for name in FILES]
+    archive = _make_tar(tmp_path / "level1.tar.gz", members)
+    assert _case_order(_iter_tar_cases(archive, ["1", "2", "3", "10"])) == ["1", "2", "3", "10"]
+
+
+def test_unlisted_cases_keep_their_place(tmp_path: Path):
+    members = [(n, name) for n in (0, 2, 1, 5) for name in FILES]
+    archive = _make_tar(tmp_path / "level1.tar.gz", members)
+    assert _case_order(_iter_tar_cases(archive, ["1", "2"])) == ["0", "1", "2", "5"]
+    assert _case_order(_iter_tar_cases(archive)) == ["0", "1", "2", "5"]
+
+
+def test_split_case_directory_is_rejected(tmp_path: Path):
+    members = [(1, FILES[0]), (2, FILES[0]), (1, FILES[1])]
+    archive = _make_tar(tmp_path / "level1.tar.gz", members)
+    with pytest.raises(RuntimeError, match="split case directory"):
+        list(_iter_tar_cases(archive, ["1", "2"]))
@@ -0,0 +1,87 @@
+"""Catalog layout selection (etl/deepplanning_catalog.py) follows manifest.json, not the files on disk."""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+
+from deepplanning_catalog import (  # noqa: E402
+    FLAT_TABLE,
+    MEMBERSHIP_TABLE,
+    PRODUCTS_TABLE,
+    manifest_catalog_layout,
+    off_layout_tables,
+    read_catalog,
+    split_catalog_row,
+)
+
+
+def _flat_row(case_id: str, row_id: int, product: dict) -> dict:
+    return {
+        "domain": "shopping",
+        "level": 1,
+        "case_id": case_id,
+        "row_id": row_id,
+        "product_id": product["product_id"],
+        "name": product["name"],
+        "brand": None,
+        "color": None,
+        "size": None,
+        "price": product["price"],
+        "stock_quantity": product["stock_quantity"],
+        "rating": None,
+        "sales_volume": product["sales_volume"],
+        "shipping_info_json": None,
+        "product_json": json.dumps(product, ensure_ascii=False),
+    }
+
+
+def _write_dedup(parquet_dir: Path, rows: list) -> None:
+    products, membership = {}, []
+    for row in rows:
+        product_row, membership_row = split_catalog_row(row, json.loads(row["product_json"]))
+        products[product_row["product_hash"]] = product_row
+        membership.append(membership_row)
+    pq.write_table(pa.Table.from_pylist(list(products.values())), parquet_dir / f"{PRODUCTS_TABLE}.parquet")
+    pq.write_table(pa.Table.from_pylist(membership), parquet_dir / f"{MEMBERSHIP_TABLE}.parquet")
+
+
+@pytest.fixture
+def rows() -> list:
+    product = {"product_id": "p1", "name": "mug", "price": 9.5, "stock_quantity": 3, "sales_volume": 10}
+    return [_flat_row("1", 0, product), _flat_row("2", 0, {**product, "stock_quantity": 7})]
+
+
+def test_off_layout_tables():
+    assert off_layout_tables("flat") == [PRODUCTS_TABLE, MEMBERSHIP_TABLE]
+    assert off_layout_tables("dedup") == [FLAT_TABLE]
+
+
+def test_layout_defaults_to_flat_without_manifest(tmp_path: Path):
+    assert manifest_catalog_layout(tmp_path) == "flat"
+
+
+def test_dedup_manifest_ignores_stale_flat_file(tmp_path: Path, rows: list):
+    _write_dedup(tmp_path, rows)
+    pq.write_table(pa.Table.from_pylist(rows[:1]), tmp_path / f"{FLAT_TABLE}.parquet")
+    (tmp_path / "manifest.json").write_text(json.dumps({"catalog_layout": "dedup"}), encoding="utf-8")
+
+    catalog = read_catalog(tmp_path)
+
+    assert catalog.column("case_id").to_pylist() == ["1", "2"]
+    assert [json.loads(p)["stock_quantity"] for p in catalog.column("product_json").to_pylist()] == [3, 7]
+
+
+def test_flat_manifest_ignores_stale_dedup_files(tmp_path: Path, rows: list):
+    _write_dedup(tmp_path, rows[:1])
+    pq.write_table(pa.Table.from_pylist(rows), tmp_path / f"{FLAT_TABLE}.parquet")
+    (tmp_path / "manifest.json").write_text(json.dumps({"catalog_layout": "flat"}), encoding="utf-8")
+
+    assert read_catalog(tmp_path).num_rows == 2
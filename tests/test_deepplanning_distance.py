@@ -0,0 +1,48 @@
+"""Dense distance-matrix encoding (etl/deepplanning_distance.py)."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+
+from deepplanning_distance import DistanceMatrix, dense_schema, encode_distance_matrix, measure_types  # noqa: E402
+
+
+def _long_table(rows, **extra) -> pa.Table:
+    columns = {
+        "origin": [r[0] for r in rows],
+        "destination": [r[1] for r in rows],
+        "distance": pa.array([r[2] for r in rows], pa.float64()),
+    }
+    columns.update(extra)
+    return pa.table(columns)
+
+
+def test_encode_places_values_row_major():
+    encoded = encode_distance_matrix(_long_table([("A", "B", 1.0), ("B", "A", 2.0)]))
+    matrix = DistanceMatrix(encoded["locations"], {"distance": encoded["distance"]})
+    assert matrix.lookup("A", "B") == 1.0
+    assert matrix.lookup("B", "A") == 2.0
+    assert matrix.lookup("A", "A") is None
+
+
+def test_duplicate_pair_is_rejected():
+    with pytest.raises(ValueError, match=r"duplicate \(origin, destination\) pair \('A', 'B'\)"):
+        encode_distance_matrix(_long_table([("A", "B", 1.0), ("A", "B", 2.0)]))
+
+
+def test_non_numeric_extra_column_is_kept_as_strings():
+    table = _long_table([("A", "B", 1.0), ("B", "A", 2.0)], mode=["walk", "taxi"])
+    types = measure_types(table.schema)
+    assert types == {"distance": pa.float64(), "mode": pa.string()}
+
+    encoded = encode_distance_matrix(table)
+    row = {"domain": "travel", "language": "en", "sample_id": "1", **encoded}
+    batch = pa.RecordBatch.from_pylist([row], schema=dense_schema(types))
+    matrix = DistanceMatrix.from_row(batch.to_pylist()[0])
+    assert matrix.get("B", "A") == {"distance": 2.0, "mode": "taxi"}
@@ -0,0 +1,108 @@
+"""Columnar shopping evaluator (etl/deepplanning_shopping_eval.py) against hand-computed scores."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+
+from deepplanning_shopping_eval import CART_SCHEMA, evaluate_shopping  # noqa: E402
+
+# Ground truth: level 1 cases 1-3, level 2 case 1.
+#   1/1: products p1, p2 + coupon C1 x2   1/2: product p3   1/3: product p4 + coupon C3 x1   2/1: product p9
+CASES = [(1, "1"), (1, "2"), (1, "3"), (2, "1")]
+GT_PRODUCTS = [(1, "1", "p1"), (1, "1", "p2"), (1, "2", "p3"), (1, "3", "p4"), (2, "1", "p9")]
+GT_COUPONS = [(1, "1", "C1", 2), (1, "3", "C3", 1)]
+
+
+def _cart(run, level, case_id, product_ids, coupons=()):
+    coupons = None if product_ids is None else [{"coupon_name": n, "quantity": q} for n, q in coupons]
+    return {"run": run, "level": level, "case_id": case_id, "product_ids": product_ids, "coupons": coupons}
+
+
+CARTS = [
+    # run a: 1/1 has an extra product and uses C1 once instead of twice, 1/2 is exact,
+    # 1/3 has no cart at all (incomplete), 2/1 is exact.
+    _cart("a", 1, "1", ["p1", "p2", "pX"], [("C1", 1)]),
+    _cart("a", 1, "2", ["p3"]),
+    _cart("a", 2, "1", ["p9"]),
+    # run b: 1/1 exact, 1/2 null product_ids (incomplete), 1/3 exact, 2/1 missing (incomplete).
+    _cart("b", 1, "1", ["p2", "p1"], [("C1", 2)]),
+    _cart("b", 1, "2", None),
+    _cart("b", 1, "3", ["p4"], [("C3", 1)]),
+]
+
+
+@pytest.fixture
+def parquet_dir(tmp_path: Path) -> Path:
+    def write(name, columns, rows):
+        pq.write_table(pa.Table.from_pylist([dict(zip(columns, r)) for r in rows]), tmp_path / f"{name}.parquet")
+
+    keys = ["level", "case_id"]
+    write("shopping_cases", keys, CASES)
+    write("shopping_gt_products", keys + ["product_id"], GT_PRODUCTS)
+    write("shopping_gt_coupons", keys + ["coupon_name", "quantity"], GT_COUPONS)
+    return tmp_path
+
+
+@pytest.fixture
+def results(parquet_dir: Path) -> dict:
+    return evaluate_shopping(pa.Table.from_pylist(CARTS, schema=CART_SCHEMA), parquet_dir)
+
+
+def _by_key(table: pa.Table, *keys: str) -> dict:
+    return {tuple(row[k] for k in keys): row for row in table.to_pylist()}
+
+
+def test_case_scores(results: dict):
+    cases = _by_key(results["cases"], "run", "level", "case_id")
+    # Coupon used 1x where the ground truth says 2x does not match: 2 of 3 items.
+    assert cases[("a", 1, "1")]["matched_count"] == 2
+    assert cases[("a", 1, "1")]["expected_count"] == 3
+    assert cases[("a", 1, "1")]["score"] == pytest.approx(2 / 3)
+    assert cases[("a", 1, "1")]["case_score"] == 0
+    assert cases[("a", 1, "2")]["case_score"] == 1
+    assert cases[("a", 1, "3")]["complete"] is False
+    assert (cases[("a", 1, "3")]["score"], cases[("a", 1, "3")]["case_score"]) == (0.0, 0)
+    assert cases[("b", 1, "1")]["case_score"] == 1
+    assert cases[("b", 1, "2")]["complete"] is False
+    assert cases[("b", 1, "2")]["expected_count"] == 1
+    assert cases[("b", 2, "1")]["complete"] is False
+
+
+def test_match_rate_counts_products_only(results: dict):
+    runs = _by_key(results["runs"], "run")
+    # a: products 2 + 1 + 0 + 1 of 2 + 1 + 1 + 1; b: 2 + 0 + 1 + 0 of 5.
+    assert runs[("a",)]["match_rate"] == pytest.approx(4 / 5)
+    assert runs[("b",)]["match_rate"] == pytest.approx(3 / 5)
+    # With coupons: a 4 of 7 (C1 quantity mismatch), b 5 of 7.
+    assert runs[("a",)]["match_rate_with_coupons"] == pytest.approx(4 / 7)
+    assert runs[("b",)]["match_rate_with_coupons"] == pytest.approx(5 / 7)
+
+
+def test_levels_and_weighted_average(results: dict):
+    levels = _by_key(results["levels"], "run", "level")
+    assert levels[("a", 1)]["average_case_score"] == pytest.approx(1 / 3)
+    assert levels[("a", 1)]["incomplete_rate"] == pytest.approx(1 / 3)
+    assert levels[("b", 2)]["incomplete_rate"] == 1.0
+    runs = _by_key(results["runs"], "run")
+    # (1/3 * 3 cases + 1 * 1 case) / 4 and (2/3 * 3 + 0 * 1) / 4.
+    assert runs[("a",)]["weighted_average_case_score"] == pytest.approx(0.5)
+    assert runs[("b",)]["weighted_average_case_score"] == pytest.approx(0.5)
+    assert (runs[("a",)]["incomplete"], runs[("b",)]["incomplete"]) == (1, 2)
+
+
+def test_valid_needs_an_explicit_threshold(parquet_dir: Path, results: dict):
+    assert "valid" not in results["levels"].column_names
+    assert "valid" not in results["runs"].column_names
+
+    carts = pa.Table.from_pylist(CARTS, schema=CART_SCHEMA)
+    scored = evaluate_shopping(carts, parquet_dir, incomplete_rate_threshold=0.5)
+    levels = _by_key(scored["levels"], "run", "level")
+    assert (levels[("a", 1)]["valid"], levels[("b", 2)]["valid"]) == (True, False)
+    assert [row["valid"] for row in scored["runs"].to_pylist()] == [True, False]
@@ -0,0 +1,38 @@
+"""Stage scheduler (etl/deepplanning_stages.py): process pool start-up."""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+
+from deepplanning_stages import StageScheduler  # noqa: E402
+
+
+def _pid_after(seconds: float) -> int:
+    time.sleep(seconds)
+    return os.getpid()
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_every_worker_process_is_started_before_the_stages(workers: int):
+    scheduler = StageScheduler(cpu_workers=workers)
+    seen = {}
+
+    def stage(_):
+        pool = scheduler.process_pool
+        seen["started"] = len(pool._processes)
+        # Work submitted from stage threads runs on the pre-started workers only.
+        seen["pids"] = {f.result() for f in [pool.submit(_pid_after, 0.2) for _ in range(workers * 2)]}
+        seen["known"] = set(pool._processes)
+
+    scheduler.add("work", stage)
+    scheduler.run()
+    assert seen["started"] == workers
+    assert seen["pids"] <= seen["known"]
+    assert len(seen["known"]) == workers
@@ -0,0 +1,148 @@
+"""Row-group cache of DeepPlanningStore (etl/deepplanning_store.py) under concurrent readers."""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+
+from deepplanning_ipc import write_ipc_companion  # noqa: E402
+from deepplanning_store import DeepPlanningStore  # noqa: E402
+
+TABLE = "travel_db_hotels"
+THREADS = 16
+# Samples 1-6 with two rows each, four rows per row group: samples 1-2 in row group 0, 3-4 in 1, 5-6 in 2.
+ROWS = [
+    {
+        "domain": "travel",
+        "language": "en",
+        "sample_id": sample,
+        "name": f"hotel {sample}.{n}",
+        "price": sample * 10.0 + n,
+    }
+    for sample in range(1, 7)
+    for n in range(2)
+]
+
+
+@pytest.fixture
+def parquet_dir(tmp_path: Path) -> Path:
+    pq.write_table(pa.Table.from_pylist(ROWS), tmp_path / f"{TABLE}.parquet", row_group_size=4)
+    companion = write_ipc_companion(tmp_path / f"{TABLE}.parquet", tmp_path / "ipc" / f"{TABLE}.arrow")
+    manifest = {
+        "tables": {TABLE: len(ROWS)},
+        "ipc": {"tables": {TABLE: {"path": f"ipc/{TABLE}.arrow", **companion}}},
+    }
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    return tmp_path
+
+
+def _expected(sample: int) -> list:
+    return [row for row in ROWS if row["sample_id"] == sample]
+
+
+def _count_decodes(store: DeepPlanningStore, monkeypatch, delay: float = 0.05, fail_first: bool = False) -> list:
+    """Record every row group decode; ``delay`` keeps each decode open long enough for readers to pile up."""
+    decodes = []
+    read = store._read_row_group
+
+    def counted(name, rg):
+        decodes.append((name, rg))
+        time.sleep(delay)
+        if fail_first and len(decodes) == 1:
+            raise OSError("disk went away")
+        return read(name, rg)
+
+    monkeypatch.setattr(store, "_read_row_group", counted)
+    return decodes
+
+
+def _hammer(fn, threads: int = THREADS) -> list:
+    start = threading.Barrier(threads)
+
+    def call(_):
+        start.wait()
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(call, range(threads)))
+
+
+@pytest.mark.parametrize("use_ipc", [False, True])
+def test_concurrent_readers_of_one_row_group_share_a_single_decode(parquet_dir: Path, monkeypatch, use_ipc: bool):
+    store = DeepPlanningStore(parquet_dir, use_ipc=use_ipc)
+    decodes = _count_decodes(store, monkeypatch)
+
+    results = _hammer(lambda: store.rows(TABLE, "travel", "en", 3).to_pylist())
+
+    assert decodes == [(TABLE, 1)]
+    assert all(result == _expected(3) for result in results)
+    assert (store.cache_misses, store.cache_hits) == (1, THREADS - 1)
+    assert store._loading == {}
+
+
+def test_each_thread_reads_through_its_own_file_handles(parquet_dir: Path):
+    store = DeepPlanningStore(parquet_dir, use_ipc=False)
+
+    def handles():
+        store.rows(TABLE, "travel", "en", 1)
+        first = store._file(TABLE)
+        return first, first is store._file(TABLE)
+
+    results = _hammer(handles, threads=4)
+    assert all(reused for _, reused in results)
+    assert len({id(handle) for handle, _ in results}) == 4
+
+
+def test_row_group_cache_evicts_the_least_recently_used(parquet_dir: Path, monkeypatch):
+    store = DeepPlanningStore(parquet_dir, cache_row_groups=2, use_ipc=False)
+    decodes = _count_decodes(store, monkeypatch, delay=0)
+
+    for sample in (1, 3, 2, 5, 1, 3):
+        assert store.rows(TABLE, "travel", "en", sample).to_pylist() == _expected(sample)
+
+    # Reading sample 2 refreshed row group 0, so row group 1 is the one sample 5 pushed out.
+    assert [rg for _, rg in decodes] == [0, 1, 2, 1]
+    assert list(store._cache) == [(TABLE, 0), (TABLE, 1)]
+    assert (store.cache_misses, store.cache_hits) == (4, 2)
+
+
+def test_failed_decode_reaches_every_waiter_and_is_retried(parquet_dir: Path, monkeypatch):
+    store = DeepPlanningStore(parquet_dir, use_ipc=False)
+    decodes = _count_decodes(store, monkeypatch, fail_first=True)
+
+    def read():
+        try:
+            return store.rows(TABLE, "travel", "en", 5).to_pylist()
+        except OSError as exc:
+            return str(exc)
+
+    assert _hammer(read) == ["disk went away"] * THREADS
+    assert store._loading == {}
+    assert store.rows(TABLE, "travel", "en", 5).to_pylist() == _expected(5)
+    assert decodes == [(TABLE, 2), (TABLE, 2)]
+
+
+def test_ipc_companion_is_read_when_it_follows_the_row_groups(parquet_dir: Path):
+    store = DeepPlanningStore(parquet_dir)
+    assert store._ipc_file(TABLE).num_record_batches == 3
+    assert store.rows(TABLE, "travel", "en", 4).to_pylist() == _expected(4)
+
+    # A companion written as one batch no longer lines up with the row-group index: back to parquet.
+    with pa.OSFile(str(parquet_dir / "ipc" / f"{TABLE}.arrow"), "wb") as sink:
+        table = pa.Table.from_pylist(ROWS).combine_chunks()
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    store = DeepPlanningStore(parquet_dir)
+    assert store._ipc_file(TABLE) is None
+    assert TABLE not in store._ipc_paths
+    assert store.rows(TABLE, "travel", "en", 4).to_pylist() == _expected(4)
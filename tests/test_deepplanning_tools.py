@@ -0,0 +1,86 @@
+"""/search request handling of the tool server (etl/deepplanning_tools.py)."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+
+from deepplanning_tools import _dispatch, _IndexedTable  # noqa: E402
+
+HOTELS = pa.table({"city": ["Hanoi", "Hanoi", "Hue"], "name": ["A", "B", "C"], "price": [30.0, 80.0, 50.0]})
+SPEC = {"hash": [["city"], ["name"]], "sorted": ["price"]}
+
+
+class _Backend:
+    """Stands in for ``ToolBackend.search`` on one indexed table."""
+
+    def __init__(self) -> None:
+        self.table = _IndexedTable(HOTELS, SPEC)
+
+    def search(self, domain, part, item_id, table, where, ranges, order_by, descending, limit, columns):
+        result, plan = self.table.search(where or {}, ranges or {}, order_by, descending, limit, columns)
+        return {"plan": plan, "rows": result.to_pylist()}
+
+
+def _post(request) -> tuple:
+    body = json.dumps(request).encode("utf-8")
+    return asyncio.run(_dispatch(_Backend(), "POST", "/search", body))
+
+
+def _request(**fields) -> dict:
+    return {"domain": "travel", "part": "en", "id": "1", "table": "travel_db_hotels", **fields}
+
+
+def test_well_formed_request_uses_the_indexes():
+    status, response = _post(_request(where={"city": "Hanoi"}, ranges={"price": [None, 50]}))
+    assert status == 200
+    assert response["plan"] == "hash:city"
+    assert [row["name"] for row in response["rows"]] == ["A"]
+
+    status, response = _post(_request(ranges={"price": [40, None]}, order_by="price", limit=1))
+    assert (status, response["plan"]) == (200, "sorted:price")
+    assert [row["name"] for row in response["rows"]] == ["C"]
+
+
+@pytest.mark.parametrize(
+    "fields, message",
+    [
+        ({"where": ["city", "Hanoi"]}, "where must be an object"),
+        ({"where": "city=Hanoi"}, "where must be an object"),
+        ({"where": {"city": {"eq": "Hanoi"}}}, "where['city']"),
+        ({"ranges": ["price", 0, 50]}, "ranges must be an object"),
+        ({"ranges": {"price": 50}}, "ranges['price']"),
+        ({"ranges": {"price": [0, 50, 100]}}, "ranges['price']"),
+        ({"ranges": {"price": [[0], 50]}}, "ranges['price']"),
+        ({"order_by": ["price"]}, "order_by"),
+        ({"limit": "10"}, "limit"),
+        ({"limit": -1}, "limit"),
+        ({"columns": "name"}, "columns"),
+        ({"table": ["travel_db_hotels"]}, "table"),
+    ],
+)
+def test_malformed_request_is_a_400(fields: dict, message: str):
+    status, response = _post(_request(**fields))
+    assert status == 400
+    assert message in response["error"]
+
+
+def test_non_object_body_and_missing_fields_are_400s():
+    assert _post([1, 2])[0] == 400
+    status, response = _post({"domain": "travel"})
+    assert status == 400
+    assert "missing fields" in response["error"]
+
+
+def test_unknown_column_and_bad_value_type_are_400s():
+    status, response = _post(_request(where={"stars": 5}))
+    assert status == 400
+    assert "unknown column" in response["error"]
+    assert _post(_request(where={"price": "cheap"}))[0] == 400
@@ -0,0 +1,46 @@
+"""Row-group writer of the builder (etl/build_deepplanning_parquet.py): schema drift across row groups."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "etl"))
+
+from build_deepplanning_parquet import _ParquetTableWriter  # noqa: E402
+
+
+def test_int_to_float_and_null_to_string_drift_widens_written_row_groups(tmp_path: Path):
+    out = tmp_path / "t.parquet"
+    writer = _ParquetTableWriter(out, row_group_size=2)
+    writer.write_rows([{"a": 1, "b": None}, {"a": 2, "b": None}])
+    writer.write_rows([{"a": 2.5, "b": "x"}])
+    assert writer.close() == 3
+
+    table = pq.read_table(out)
+    assert table.schema == pa.schema([("a", pa.float64()), ("b", pa.string())])
+    assert table.to_pylist() == [{"a": 1.0, "b": None}, {"a": 2.0, "b": None}, {"a": 2.5, "b": "x"}]
+    assert pq.ParquetFile(out).metadata.num_row_groups == 2
+    assert not out.with_name(out.name + ".tmp").exists()
+
+
+def test_struct_children_widen_too(tmp_path: Path):
+    out = tmp_path / "t.parquet"
+    writer = _ParquetTableWriter(out, row_group_size=1)
+    writer.write_rows([{"s": {"x": None, "y": 1}}])
+    writer.write_rows([{"s": {"x": "v", "y": 1.5}}])
+    writer.close()
+
+    assert pq.read_table(out).column("s").to_pylist() == [{"x": None, "y": 1.0}, {"x": "v", "y": 1.5}]
+
+
+def test_pinned_column_types_do_not_widen(tmp_path: Path):
+    writer = _ParquetTableWriter(tmp_path / "t.parquet", row_group_size=1, column_types={"a": pa.int64()})
+    writer.write_rows([{"a": 1}])
+    with pytest.raises(pa.ArrowInvalid):
+        writer.write_rows([{"a": 2.5}])
+    writer.abort()
@@ -0,0 +1,122 @@
+"""Delta publish (scripts/publish_to_hf.py) against the directory-backed LocalHubApi."""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from huggingface_hub import CommitOperationAdd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from publish_to_hf import RELEASE_MANIFEST, LocalHubApi, plan_release, publish  # noqa: E402
+
+REPO_ID = "tester/deepplanning-parquet"
+
+
+def _write(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+def _last_commit(hub_root: Path) -> dict:
+    lines = (hub_root / REPO_ID / "commits.jsonl").read_text(encoding="utf-8").splitlines()
+    return json.loads(lines[-1])
+
+
+@pytest.fixture
+def stage(tmp_path: Path) -> Path:
+    source = tmp_path / "hf_publish"
+    _write(source / "README.md", b"# card\n")
+    _write(source / "shopping_queries.parquet", b"queries-v1")
+    _write(source / "shopping_gt_coupons.parquet", b"coupons-v1")
+    _write(source / "travel_queries.parquet", b"travel-v1")
+    return source
+
+
+@pytest.fixture
+def api(tmp_path: Path) -> LocalHubApi:
+    return LocalHubApi(tmp_path / "hub")
+
+
+def test_plan_release_splits_upload_delete_unchanged():
+    previous = {"a": {"sha256": "1"}, "b": {"sha256": "2"}, "gone": {"sha256": "3"}}
+    current = {"a": {"sha256": "1"}, "b": {"sha256": "changed"}, "new": {"sha256": "4"}}
+    assert plan_release(current, previous) == {"upload": ["b", "new"], "delete": ["gone"], "unchanged": ["a"]}
+
+
+def test_first_publish_uploads_everything(stage: Path, api: LocalHubApi, tmp_path: Path):
+    summary = publish(api, REPO_ID, stage, "release 1")
+
+    assert summary["upload"] == sorted(
+        ["README.md", "shopping_gt_coupons.parquet", "shopping_queries.parquet", "travel_queries.parquet"]
+    )
+    assert summary["delete"] == [] and summary["unchanged"] == []
+    assert summary["commit"] is not None
+    files = tmp_path / "hub" / REPO_ID / "files"
+    assert (files / "shopping_queries.parquet").read_bytes() == b"queries-v1"
+    manifest = json.loads((files / RELEASE_MANIFEST).read_text(encoding="utf-8"))
+    assert set(manifest["files"]) == set(summary["upload"])
+
+
+def test_unchanged_rerun_uploads_nothing(stage: Path, api: LocalHubApi, tmp_path: Path):
+    publish(api, REPO_ID, stage, "release 1")
+    head = api.repo_info(REPO_ID).sha
+
+    summary = publish(api, REPO_ID, stage, "release 2")
+
+    assert summary["upload"] == [] and summary["delete"] == []
+    assert summary["commit"] is None
+    assert api.repo_info(REPO_ID).sha == head
+    assert len((tmp_path / "hub" / REPO_ID / "commits.jsonl").read_text(encoding="utf-8").splitlines()) == 1
+
+
+def test_changed_and_deleted_tables_become_one_commit(stage: Path, api: LocalHubApi, tmp_path: Path):
+    publish(api, REPO_ID, stage, "release 1")
+    _write(stage / "travel_queries.parquet", b"travel-v2")
+    (stage / "shopping_gt_coupons.parquet").unlink()
+
+    summary = publish(api, REPO_ID, stage, "release 2")
+
+    assert summary["upload"] == ["travel_queries.parquet"]
+    assert summary["delete"] == ["shopping_gt_coupons.parquet"]
+    assert summary["unchanged"] == ["README.md", "shopping_queries.parquet"]
+    commit = _last_commit(tmp_path / "hub")
+    assert commit["operations"] == [
+        {"add": "travel_queries.parquet", "size": len(b"travel-v2")},
+        {"delete": "shopping_gt_coupons.parquet"},
+        {"add": RELEASE_MANIFEST, "size": commit["operations"][-1]["size"]},
+    ]
+    assert not (tmp_path / "hub" / REPO_ID / "files" / "shopping_gt_coupons.parquet").exists()
+
+
+def test_dry_run_plans_without_creating_the_repo(stage: Path, api: LocalHubApi):
+    summary = publish(api, REPO_ID, stage, "release 1", dry_run=True)
+
+    assert summary["parent_commit"] is None and summary["commit"] is None
+    assert len(summary["upload"]) == 4
+    assert not api.repo_exists(REPO_ID)
+
+
+class _RacingHub(LocalHubApi):
+    """Another publisher commits right after ``publish`` has read the previous release."""
+
+    def hf_hub_download(self, repo_id, filename, repo_type=None, revision=None):
+        path = super().hf_hub_download(repo_id, filename, repo_type=repo_type, revision=revision)
+        super().create_commit(
+            repo_id, [CommitOperationAdd(path_in_repo="other.parquet", path_or_fileobj=b"x")], commit_message="race"
+        )
+        return path
+
+
+def test_stale_parent_commit_is_rejected(stage: Path, tmp_path: Path):
+    publish(LocalHubApi(tmp_path / "hub"), REPO_ID, stage, "release 1")
+    _write(stage / "travel_queries.parquet", b"travel-v2")
+    racing = _RacingHub(tmp_path / "hub")
+
+    with pytest.raises(ValueError, match="not the head"):
+        publish(racing, REPO_ID, stage, "release 2")
+    files = tmp_path / "hub" / REPO_ID / "files"
+    assert (files / "travel_queries.parquet").read_bytes() == b"travel-v1"
@@ -0,0 +1,119 @@
+"""Validator (etl/validate_deepplanning_parquet.py) against a build with deliberately broken tables."""
+
+from __future__ import annotations
+
+import json
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytest
+
+ETL_DIR = Path(__file__).resolve().parent.parent / "etl"
+sys.path.insert(0, str(ETL_DIR))
+
+from deepplanning_synthetic import generate  # noqa: E402
+from validate_deepplanning_parquet import validate_parquet_dir  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def built(tmp_path_factory) -> Path:
+    inputs = generate(tmp_path_factory.mktemp("synthetic"))
+    out_dir = tmp_path_factory.mktemp("build") / "parquet"
+    cmd = [
+        sys.executable,
+        str(ETL_DIR / "build_deepplanning_parquet.py"),
+        "--skip-download",
+        "--qwen-agent-root",
+        inputs["qwen_agent_root"],
+        "--raw-cache-dir",
+        inputs["raw_cache_dir"],
+        "--out-dir",
+        str(out_dir),
+    ]
+    subprocess.run(cmd, check=True, capture_output=True, cwd=ETL_DIR)
+    return out_dir
+
+
+@pytest.fixture
+def parquet_dir(built: Path, tmp_path: Path) -> Path:
+    return Path(shutil.copytree(built, tmp_path / "parquet"))
+
+
+def _validate(parquet_dir: Path, *flags: str) -> subprocess.CompletedProcess:
+    cmd = [sys.executable, str(ETL_DIR / "validate_deepplanning_parquet.py"), "--parquet-dir", str(parquet_dir), *flags]
+    return subprocess.run(cmd, capture_output=True, text=True, cwd=ETL_DIR)
+
+
+def _rewrite(parquet_dir: Path, table: str, edit) -> None:
+    """Rewrite one table and keep its manifest row count in step, so only the data checks can notice."""
+    path = parquet_dir / f"{table}.parquet"
+    rewritten = edit(pq.read_table(path))
+    pq.write_table(rewritten, path)
+    manifest_path = parquet_dir / "manifest.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest["tables"][table] = rewritten.num_rows
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+
+
+def _first_case(parquet_dir: Path, table: str) -> tuple:
+    row = pq.read_table(parquet_dir / f"{table}.parquet", columns=["level", "case_id"]).slice(0, 1).to_pylist()[0]
+    return row["level"], row["case_id"]
+
+
+def _without_case(level, case_id):
+    def edit(table: pa.Table) -> pa.Table:
+        same = pc.and_(pc.equal(table.column("level"), level), pc.equal(table.column("case_id"), case_id))
+        return table.filter(pc.invert(same))
+
+    return edit
+
+
+def test_clean_build_passes(parquet_dir: Path):
+    done = _validate(parquet_dir)
+    assert done.returncode == 0, done.stdout + done.stderr
+    assert json.loads(done.stdout)["failed_checks"] == []
+
+
+def test_dangling_reference_fails_with_its_key(parquet_dir: Path):
+    level, case_id = _first_case(parquet_dir, "shopping_queries")
+    _rewrite(parquet_dir, "shopping_queries", _without_case(level, case_id))
+
+    done = _validate(parquet_dir)
+    assert done.returncode == 1
+    assert json.loads(done.stdout)["failed_checks"] == ["referential_integrity:shopping_cases.parquet"]
+
+    report = json.loads((parquet_dir / "validation_report.json").read_text(encoding="utf-8"))
+    references = report["checks"]["referential_integrity"]["shopping_cases.parquet"]
+    assert (references["orphan_rows"], references["sample_orphan_keys"]) == (1, [f"shopping:{level}:{case_id}"])
+    overlap = report["checks"]["shopping_query_case_overlap"]
+    assert overlap["ok"] is False
+    assert overlap["missing_case_ids"] == [str(case_id)]
+    assert overlap["missing_keys"] == [f"shopping:{level}:{case_id}"]
+
+
+def test_duplicate_key_fails_with_its_key(parquet_dir: Path):
+    level, case_id = _first_case(parquet_dir, "shopping_user_info")
+    _rewrite(parquet_dir, "shopping_user_info", lambda table: pa.concat_tables([table, table.slice(0, 1)]))
+
+    done = _validate(parquet_dir)
+    assert done.returncode == 1
+    assert json.loads(done.stdout)["failed_checks"] == ["key_uniqueness:shopping_user_info.parquet"]
+
+    uniqueness = validate_parquet_dir(parquet_dir)["checks"]["key_uniqueness"]["shopping_user_info.parquet"]
+    assert (uniqueness["duplicate_keys"], uniqueness["duplicate_rows"]) == (1, 2)
+    assert uniqueness["sample_duplicate_keys"] == [f"shopping:{level}:{case_id}"]
+
+
+def test_missing_required_table_fails(parquet_dir: Path):
+    (parquet_dir / "travel_db_hotels.parquet").unlink()
+
+    done = _validate(parquet_dir)
+    assert done.returncode == 1
+    assert "Missing required tables: ['travel_db_hotels.parquet']" in done.stderr
+    with pytest.raises(RuntimeError, match="travel_db_hotels.parquet"):
+        validate_parquet_dir(parquet_dir)